@@ -12,6 +12,8 @@ from routes.app_informacion import informacion_bp
 from routes.app_acercade import acercade_bp
 from routes.app_privacidad import privacidad_bp
 from routes.app_admin import admin_bp
+from routes.app_metricas import metricas_bp
+from routes.app_estado import estado_bp
 
 app = Flask(__name__)
 
@@ -25,6 +27,12 @@ app.register_blueprint(informacion_bp)
 app.register_blueprint(acercade_bp)
 app.register_blueprint(privacidad_bp)
 app.register_blueprint(admin_bp) 
+app.register_blueprint(metricas_bp)
+app.register_blueprint(estado_bp)
 
 if __name__ == "__main__":
+    # En producción lo inician gunicorn.conf.py / asgi.py en cada worker
+    from routes.app_chatbot import selector
+    from logic.calentamiento import iniciar_calentamiento
+    iniciar_calentamiento(selector)
     app.run(host="0.0.0.0", port=5010, debug=True)
\ No newline at end of file
@@ -0,0 +1,51 @@
+# --- asgi.py ---
+"""
+Punto de entrada ASGI.
+
+/chat y /api/register_access se atienden con las rutas async de
+routes/app_chatbot_asgi.py; todo lo demás (páginas, panel admin, estáticos)
+lo sigue sirviendo la app Flask de app.py, adaptada con a2wsgi: sus vistas
+síncronas corren en un pool de FLASK_HILOS hilos (como el antiguo --threads=4).
+
+Producción (ver Procfile):
+    gunicorn asgi:app -k uvicorn.workers.UvicornWorker --workers=1
+Local:
+    uvicorn asgi:app --port 5010
+
+Al arrancar cada worker (lifespan) se lanza el calentamiento en segundo
+plano de KNN y RAG; GET /ready indica cuándo terminó (ver logic/calentamiento.py).
+Al apagarlo se vacía la cola de escrituras diferidas (logic/cola_escritura.py).
+"""
+import os
+from contextlib import asynccontextmanager
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.routing import Mount
+
+from app import app as flask_app
+from routes.app_chatbot_asgi import rutas_chatbot_async
+from routes.app_chatbot import selector
+from logic.calentamiento import iniciar_calentamiento
+from logic import cola_escritura
+from models import modelo_knn
+
+FLASK_HILOS = int(os.getenv("FLASK_HILOS", "4"))
+
+
+@asynccontextmanager
+async def ciclo_de_vida(_app):
+    # Ya en el worker (después del fork de gunicorn --preload)
+    iniciar_calentamiento(selector)
+    yield
+    # Al apagar: escribir los registros y FAQs pendientes y publicar sus cambios en el KNN
+    cola_escritura.vaciar()
+    modelo_knn.publicar_pendientes()
+
+
+app = Starlette(
+    routes=[
+        *rutas_chatbot_async,
+        Mount("/", app=WSGIMiddleware(flask_app, workers=FLASK_HILOS)),
+    ],
+    lifespan=ciclo_de_vida,
+)
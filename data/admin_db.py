@@ -1,10 +1,9 @@
 import os
+import sys
 import time
-import chromadb
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import WebBaseLoader, PyPDFLoader
 from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEndpointEmbeddings
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -14,24 +13,54 @@ CURRENT_FILE_PATH = os.path.abspath(__file__)
 DATA_DIR = os.path.dirname(CURRENT_FILE_PATH)
 PROJECT_ROOT = os.path.dirname(DATA_DIR)
 
-MODELO_EMBEDDING = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
-HF_TOKEN = os.getenv("HF_TOKEN")
-CHROMA_API_KEY = os.getenv("CHROMA_API_KEY")
-CHROMA_TENANT = os.getenv("CHROMA_TENANT")
-CHROMA_DATABASE = os.getenv("CHROMA_DATABASE")
-CHROMA_COLLECTION = "goit_vectores"
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from models.proveedor_embeddings import obtener_proveedor, EMBEDDINGS_BACKEND
+from models.version_conocimiento import incrementar_version
+from models.indice_lexico import guardar_indice, ruta_indice
+from models import shards
+from models import vectorstore as almacen_vectores
 
 # chunk_size=1800 y overlap=150 equilibra calidad de recuperación con cantidad de fragmentos.
-# CHROMA_MAX_RECORDS debe mantenerse por debajo del límite del plan (300 en plan gratuito).
+# Con Chroma Cloud el total de todas las colecciones (shards) se recorta a
+# CHROMA_MAX_RECORDS (ver models/vectorstore.py); con VECTORSTORE_BACKEND=local no hay límite.
 CHUNK_SIZE = 1800
 CHUNK_OVERLAP = 150
-CHROMA_MAX_RECORDS = 280  # margen de seguridad antes del límite de 300
 
 
-def actualizar_base_datos_completa(registry_data):
+def _repartir_limite(conteos: dict, limite: int) -> dict:
+    """
+    Fragmentos que caben de cada shard para que el total no pase de `limite`:
+    los shards pequeños entran completos y el resto del límite se reparte a
+    partes iguales entre los demás. conteos: shard → fragmentos generados.
+    """
+    cupos = {}
+    pendientes = sorted(conteos, key=conteos.get)
+    restante = limite
+    while pendientes:
+        parte = restante // len(pendientes)
+        shard = pendientes.pop(0)
+        cupos[shard] = min(conteos[shard], parte)
+        restante -= cupos[shard]
+    # El residuo de la división entera, a los shards recortados
+    for shard in sorted(conteos, key=conteos.get, reverse=True):
+        if restante <= 0:
+            break
+        extra = min(restante, conteos[shard] - cupos[shard])
+        cupos[shard] += extra
+        restante -= extra
+    return cupos
+
+
+def actualizar_base_datos_completa(registry_data, programa=None):
     """
     Función Generadora (Streaming) para entrenar la IA.
-    Guarda los vectores en Chroma Cloud — sin almacenamiento local.
+    Guarda los vectores en Chroma Cloud o en Chroma local (VECTORSTORE_BACKEND).
+
+    Con SHARDS_POR_PROGRAMA=1 (ver models/shards.py) cada URL/PDF del registro
+    va al shard de su campo "programa" (o al general). Si se indica `programa`,
+    solo se reentrena ese shard; los demás no se tocan.
 
     Optimizaciones aplicadas:
     - chunk_size=1000 (reducido de 2500): fragmentos más granulares para recuperación precisa.
@@ -44,9 +73,20 @@ def actualizar_base_datos_completa(registry_data):
         texto_seguro = texto.replace('\n', ' ')
         return f"data: {texto_seguro}\n\n"
 
+    def shard_de(item):
+        return shards.shard_de(item.get('programa'))
+
     try:
         yield enviar_msg("🚀 Iniciando proceso de entrenamiento...")
 
+        shard_objetivo = shards.shard_de(programa) if programa else None
+        if shard_objetivo is not None:
+            yield enviar_msg(f"🎯 Solo se reentrena el shard '{shard_objetivo}'.")
+            registry_data = {
+                clave: [item for item in registry_data.get(clave, []) if shard_de(item) == shard_objetivo]
+                for clave in ('urls', 'pdfs')
+            }
+
         todos_los_documentos = []
 
         # --- A) Procesar URLs ---
@@ -63,6 +103,7 @@ def actualizar_base_datos_completa(registry_data):
                     for doc in docs_web:
                         doc.metadata['fuente'] = nombre
                         doc.metadata['tipo'] = 'url'
+                        doc.metadata['shard'] = shard_de(url_item)
                     todos_los_documentos.extend(docs_web)
                     yield enviar_msg(f"  ✅ {nombre}: {len(docs_web)} página(s) descargadas.")
                 except Exception as e:
@@ -89,6 +130,7 @@ def actualizar_base_datos_completa(registry_data):
                         for doc in docs_pdf:
                             doc.metadata['fuente'] = pdf_item['filename']
                             doc.metadata['tipo'] = 'pdf'
+                            doc.metadata['shard'] = shard_de(pdf_item)
                         todos_los_documentos.extend(docs_pdf)
                         count_pdf += 1
                         yield enviar_msg(f"  ✅ {pdf_item['filename']}: {len(docs_pdf)} página(s).")
@@ -100,7 +142,7 @@ def actualizar_base_datos_completa(registry_data):
 
             yield enviar_msg(f"✅ {count_pdf}/{len(pdfs)} PDFs procesados.")
 
-        # --- C) Fragmentar y cargar en Chroma Cloud ---
+        # --- C) Fragmentar y cargar en Chroma ---
         if todos_los_documentos:
             yield enviar_msg(f"✂️ Fragmentando {len(todos_los_documentos)} documentos...")
             yield enviar_msg(f"   chunk_size={CHUNK_SIZE}, chunk_overlap={CHUNK_OVERLAP}")
@@ -113,50 +155,101 @@ def actualizar_base_datos_completa(registry_data):
             chunks = text_splitter.split_documents(todos_los_documentos)
             yield enviar_msg(f"📊 Total de fragmentos generados: {len(chunks)}")
 
-            # Salvaguarda de cuota: Chroma Cloud limita el número de registros por plan.
-            if len(chunks) > CHROMA_MAX_RECORDS:
+            backend = almacen_vectores.nombre_backend()
+            yield enviar_msg(f"🔌 Conectando con {backend}...")
+            chroma_client = almacen_vectores.crear_cliente()
+
+            yield enviar_msg(f"🔄 Preparando embeddings (backend={EMBEDDINGS_BACKEND})...")
+            embedding_function = obtener_proveedor()
+
+            por_shard = {}
+            for chunk in chunks:
+                por_shard.setdefault(chunk.metadata['shard'], []).append(chunk)
+
+            existentes = almacen_vectores.colecciones_existentes(chroma_client)
+
+            # Salvaguarda de cuota: Chroma Cloud limita el número de registros por plan,
+            # sumando todas las colecciones. Al reentrenar un solo shard, los demás
+            # conservan sus registros y solo queda lo que ellos no ocupan.
+            limite = almacen_vectores.limite_registros()
+            if limite is not None and shard_objetivo is not None:
+                prefijo = f"{almacen_vectores.CHROMA_COLLECTION}__"
+                ocupados = sum(
+                    almacen_vectores.registros_coleccion(chroma_client, nombre)
+                    for nombre in existentes
+                    if nombre != almacen_vectores.nombre_coleccion(shard_objetivo)
+                    and (nombre == almacen_vectores.CHROMA_COLLECTION or nombre.startswith(prefijo))
+                )
+                if ocupados:
+                    yield enviar_msg(f"   Los demás shards ocupan {ocupados} de {limite} registros.")
+                limite = max(0, limite - ocupados)
+
+            if limite is not None and len(chunks) > limite:
                 yield enviar_msg(
-                    f"⚠️ Se generaron {len(chunks)} fragmentos, pero el límite configurado "
-                    f"es {CHROMA_MAX_RECORDS}. Se usarán solo los primeros {CHROMA_MAX_RECORDS} "
-                    f"fragmentos para no exceder la cuota de Chroma Cloud."
+                    f"⚠️ Se generaron {len(chunks)} fragmentos, pero el límite disponible "
+                    f"es {limite}. Se usarán solo {limite} fragmentos, repartidos entre "
+                    f"los shards, para no exceder la cuota de Chroma Cloud."
                 )
                 yield enviar_msg(
-                    "   Consejo: reduce la cantidad de documentos, o solicita un aumento de cuota "
-                    "en trychroma.com para procesar todos los fragmentos."
+                    "   Consejo: usa VECTORSTORE_BACKEND=local (sin límite), reduce la cantidad "
+                    "de documentos, o solicita un aumento de cuota en trychroma.com."
                 )
-                chunks = chunks[:CHROMA_MAX_RECORDS]
+                cupos = _repartir_limite({shard: len(f) for shard, f in por_shard.items()}, limite)
+                for shard, cupo in cupos.items():
+                    if cupo == 0:
+                        yield enviar_msg(
+                            f"⚠️ El shard '{shard}' se queda sin documentos: no cabe en el límite "
+                            f"de {limite} registros."
+                        )
+                        del por_shard[shard]
+                    else:
+                        por_shard[shard] = por_shard[shard][:cupo]
+                chunks = [chunk for fragmentos in por_shard.values() for chunk in fragmentos]
                 yield enviar_msg(f"✂️ Fragmentos reducidos a {len(chunks)}.")
 
-            yield enviar_msg("☁️ Conectando con Chroma Cloud...")
-            chroma_client = chromadb.CloudClient(
-                api_key=CHROMA_API_KEY,
-                tenant=CHROMA_TENANT,
-                database=CHROMA_DATABASE
-            )
+            # Los shards entrenados que se quedan sin documentos (todos en un entrenamiento
+            # completo, o el recortado por el límite) se eliminan
+            prefijo = f"{almacen_vectores.CHROMA_COLLECTION}__"
+            for nombre in existentes:
+                if nombre == almacen_vectores.CHROMA_COLLECTION:
+                    shard = shards.SHARD_GENERAL
+                else:
+                    shard = nombre[len(prefijo):] if nombre.startswith(prefijo) else None
+                if shard is None or shard in por_shard:
+                    continue
+                if shard_objetivo is None or shard == shard_objetivo:
+                    yield enviar_msg(f"🧹 Eliminando shard sin documentos: '{shard}'...")
+                    chroma_client.delete_collection(nombre)
+                    if os.path.exists(ruta_indice(shard)):
+                        os.remove(ruta_indice(shard))
 
-            yield enviar_msg("🔄 Conectando con API de embeddings (HuggingFace)...")
-            embedding_function = HuggingFaceEndpointEmbeddings(
-                model=MODELO_EMBEDDING,
-                huggingfacehub_api_token=HF_TOKEN
-            )
+            for shard, fragmentos in por_shard.items():
+                coleccion = almacen_vectores.nombre_coleccion(shard)
+                etiqueta = f" (shard '{shard}')" if shards.activo() else ""
 
-            # Limpiar colección anterior si existe
-            colecciones = [c.name for c in chroma_client.list_collections()]
-            if CHROMA_COLLECTION in colecciones:
-                yield enviar_msg("🧹 Limpiando colección anterior en Chroma Cloud...")
-                chroma_client.delete_collection(CHROMA_COLLECTION)
-
-            # Crear colección nueva y cargar vectores
-            yield enviar_msg("💾 Insertando vectores en Chroma Cloud...")
-            vector_db = Chroma(
-                client=chroma_client,
-                collection_name=CHROMA_COLLECTION,
-                embedding_function=embedding_function
-            )
-            vector_db.add_documents(documents=chunks)
+                # Limpiar colección anterior si existe
+                if coleccion in existentes:
+                    yield enviar_msg(f"🧹 Limpiando colección anterior en {backend}{etiqueta}...")
+                    chroma_client.delete_collection(coleccion)
+
+                # Crear colección nueva y cargar vectores
+                yield enviar_msg(f"💾 Insertando {len(fragmentos)} vectores en {backend}{etiqueta}...")
+                vector_db = Chroma(
+                    client=chroma_client,
+                    collection_name=coleccion,
+                    embedding_function=embedding_function
+                )
+                vector_db.add_documents(documents=fragmentos)
+
+                # Mismos fragmentos para la búsqueda léxica (BM25) de cada worker
+                yield enviar_msg(f"🔤 Guardando índice léxico (BM25){etiqueta}...")
+                guardar_indice(fragmentos, shard)
+
+            # Invalida los cachés de recuperación del RAG en todos los workers
+            version = incrementar_version()
 
-            yield enviar_msg("✅ ¡Entrenamiento exitoso! Vectores guardados en Chroma Cloud.")
-            yield enviar_msg(f"   {len(chunks)} fragmentos listos para recuperación precisa.")
+            yield enviar_msg(f"✅ ¡Entrenamiento exitoso! Vectores guardados en {backend}.")
+            yield enviar_msg(f"   {len(chunks)} fragmentos listos para recuperación precisa (versión {version}).")
         else:
             yield enviar_msg("⚠️ No se encontraron documentos válidos (ni URLs ni PDFs).")
 
@@ -1,10 +1,13 @@
 # database.py
-from pymongo import MongoClient, DESCENDING
+from pymongo import MongoClient, DESCENDING, UpdateOne
+from pymongo.errors import DuplicateKeyError, BulkWriteError
 from pymongo.collection import Collection
 from bson import ObjectId
+from datetime import datetime, timedelta
 import os
 from dotenv import load_dotenv
 
+
 load_dotenv()
 
 # --- CONFIGURACIÓN ---
@@ -30,6 +33,10 @@ db = client[DB_NAME]
 faq_collection: Collection          = db["faq"]
 access_log_collection: Collection   = db["access_log"]
 chat_logs_collection: Collection    = db["chat_logs"]
+# Vectores de preguntas FAQ indexados por hash del texto normalizado
+faq_embeddings_collection: Collection = db["faq_embeddings"]
+# Última ejecución de tareas periódicas compartidas entre workers (ver claim_periodic_task)
+tareas_collection: Collection       = db["tareas"]
 
 
 def init_db():
@@ -37,6 +44,8 @@ def init_db():
     print("🔄 Inicializando colecciones e índices en MongoDB...")
 
     faq_collection.create_index("pregunta", unique=False)
+    faq_collection.create_index("alias")
+    faq_collection.create_index([("origen", 1), ("hits", 1), ("ultimo_hit", 1)])
 
     access_log_collection.create_index("fecha")
     access_log_collection.create_index("ip")
@@ -45,6 +54,8 @@ def init_db():
     chat_logs_collection.create_index("matricula")
     chat_logs_collection.create_index([("fecha", DESCENDING), ("hora", DESCENDING)])
 
+    # faq_embeddings usa el hash como _id: no necesita índices adicionales.
+
     print("✅ MongoDB inicializado correctamente.")
 
 
@@ -52,6 +63,18 @@ def init_db():
 # FUNCIONES FAQ
 # ──────────────────────────────────────────────
 
+def find_faq_by_pregunta(pregunta: str, shard: str | None = None,
+                         solo_shard: bool = False) -> dict | None:
+    """
+    Busca una FAQ por su pregunta o por uno de sus alias (ver merge_faqs).
+    solo_shard: solo entre las FAQs cuyo campo shard vale `shard` (None = sin
+    campo, las del general; ver models/shards.py).
+    """
+    filtro = {"$or": [{"pregunta": pregunta}, {"alias": pregunta}]}
+    if solo_shard:
+        filtro["shard"] = shard
+    return faq_collection.find_one(filtro)
+
 def get_all_faq() -> list[dict]:
     """Retorna todas las FAQs sin _id (uso interno del modelo KNN)."""
     return list(faq_collection.find({}, {"_id": 0}))
@@ -66,8 +89,26 @@ def get_all_faq_admin() -> list[dict]:
         result.append(doc)
     return result
 
-def insert_faq(pregunta: str, respuesta: str) -> None:
-    faq_collection.insert_one({"pregunta": pregunta, "respuesta": respuesta, "bloqueado": False})
+def insert_faq(pregunta: str, respuesta: str, origen: str = "manual",
+               shard: str | None = None) -> str:
+    """
+    Inserta una FAQ no bloqueada y retorna su id como string.
+    origen: "manual" (panel admin) o "auto" (aprendida de una respuesta del LLM).
+    Solo las "auto" pueden ser desalojadas del caché (ver evict_auto_faqs).
+    shard: valor del campo shard (programa al que pertenece); None para las del
+    general, que no guardan el campo.
+    """
+    documento = {
+        "pregunta":  pregunta,
+        "respuesta": respuesta,
+        "bloqueado": False,
+        "origen":    origen,
+        "creado":    datetime.now(),
+    }
+    if shard is not None:
+        documento["shard"] = shard
+    result = faq_collection.insert_one(documento)
+    return str(result.inserted_id)
 
 def update_faq(pregunta: str, nueva_respuesta: str) -> None:
     faq_collection.update_one(
@@ -91,6 +132,118 @@ def delete_faq_by_id(faq_id: str) -> bool:
     result = faq_collection.delete_one({"_id": ObjectId(faq_id)})
     return result.deleted_count > 0
 
+def merge_faqs(keep_id: str, alias: list[str], remove_ids: list[str]) -> int:
+    """
+    Fusiona FAQs duplicadas: agrega `alias` a la FAQ que se conserva y elimina
+    las demás (nunca las bloqueadas). Si alguna eliminada no era "auto", la que
+    se conserva pasa a origen "manual" para que evict_auto_faqs no la desaloje.
+    Retorna cuántas se eliminaron.
+    """
+    eliminar = {
+        "_id": {"$in": [ObjectId(i) for i in remove_ids]},
+        "bloqueado": {"$ne": True},
+    }
+    cambios = {}
+    if alias:
+        cambios["$addToSet"] = {"alias": {"$each": alias}}
+    if faq_collection.count_documents({**eliminar, "origen": {"$ne": "auto"}}, limit=1):
+        cambios["$set"] = {"origen": "manual"}
+    if cambios:
+        faq_collection.update_one({"_id": ObjectId(keep_id)}, cambios)
+    result = faq_collection.delete_many(eliminar)
+    return result.deleted_count
+
+def increment_faq_hits(conteos: dict[str, tuple[int, datetime]]) -> None:
+    """
+    Suma aciertos del caché en lote: {faq_id: (aciertos, fecha_ultimo_acierto)}.
+    Una sola operación bulk para todas las FAQs acumuladas.
+    """
+    if not conteos:
+        return
+    faq_collection.bulk_write([
+        UpdateOne(
+            {"_id": ObjectId(faq_id)},
+            {"$inc": {"hits": n}, "$max": {"ultimo_hit": ultimo}}
+        )
+        for faq_id, (n, ultimo) in conteos.items()
+    ], ordered=False)
+
+def evict_auto_faqs(capacidad: int, ttl_dias: int) -> list[str]:
+    """
+    Desaloja FAQs aprendidas automáticamente (origen "auto", no bloqueadas):
+    1. TTL: las que no tienen aciertos (o creación) en los últimos ttl_dias.
+    2. Capacidad: si aún quedan más de `capacidad`, las de menos aciertos
+       (y, a igualdad, las usadas hace más tiempo).
+    Las FAQs manuales o bloqueadas nunca se tocan. 0 desactiva cada criterio.
+    Retorna los ids eliminados.
+    """
+    filtro = {"origen": "auto", "bloqueado": {"$ne": True}}
+    eliminar = []
+
+    if ttl_dias > 0:
+        limite = datetime.now() - timedelta(days=ttl_dias)
+        vencidas = faq_collection.find({**filtro, "$or": [
+            {"ultimo_hit": {"$lt": limite}},
+            {"ultimo_hit": {"$exists": False}, "creado": {"$lt": limite}},
+        ]}, {"_id": 1})
+        eliminar.extend(doc['_id'] for doc in vencidas)
+
+    if capacidad > 0:
+        restantes = faq_collection.count_documents(filtro) - len(eliminar)
+        if restantes > capacidad:
+            menos_usadas = (
+                faq_collection
+                .find({**filtro, "_id": {"$nin": eliminar}}, {"_id": 1})
+                .sort([("hits", 1), ("ultimo_hit", 1), ("creado", 1)])
+                .limit(restantes - capacidad)
+            )
+            eliminar.extend(doc['_id'] for doc in menos_usadas)
+
+    if eliminar:
+        faq_collection.delete_many({**filtro, "_id": {"$in": eliminar}})
+    return [str(i) for i in eliminar]
+
+def backfill_faq_origen(modelo_llm: str, origen_por_defecto: str = "manual") -> dict[str, int]:
+    """
+    Marca `origen` y `creado` en las FAQs anteriores a esos campos, para que
+    evict_auto_faqs pueda desalojar las aprendidas del LLM:
+    - creado: fecha de creación del ObjectId.
+    - origen: "auto" si chat_logs tiene esa misma pregunta y respuesta generada
+      por el LLM (modelo == modelo_llm); "manual" si está bloqueada; si no,
+      origen_por_defecto ("manual" no desaloja nada dudoso).
+    Retorna cuántas FAQs quedaron de cada origen.
+    """
+    sin_origen = list(faq_collection.find(
+        {"origen": {"$exists": False}},
+        {"_id": 1, "pregunta": 1, "respuesta": 1, "bloqueado": 1, "creado": 1},
+    ))
+    if not sin_origen:
+        return {}
+
+    generadas = {
+        (log.get("pregunta"), log.get("respuesta"))
+        for log in chat_logs_collection.find({"modelo": modelo_llm}, {"_id": 0, "pregunta": 1, "respuesta": 1})
+    }
+
+    conteo = {}
+    operaciones = []
+    for doc in sin_origen:
+        if doc.get("bloqueado", False):
+            origen = "manual"
+        elif (doc.get("pregunta"), doc.get("respuesta")) in generadas:
+            origen = "auto"
+        else:
+            origen = origen_por_defecto
+        cambios = {"origen": origen}
+        if "creado" not in doc:
+            # generation_time es UTC; las demás fechas se guardan en hora local
+            cambios["creado"] = doc["_id"].generation_time.astimezone().replace(tzinfo=None)
+        operaciones.append(UpdateOne({"_id": doc["_id"]}, {"$set": cambios}))
+        conteo[origen] = conteo.get(origen, 0) + 1
+
+    faq_collection.bulk_write(operaciones, ordered=False)
+    return conteo
+
 def toggle_faq_block(faq_id: str) -> bool:
     """Alterna el estado de bloqueo de una FAQ. Retorna el nuevo estado."""
     doc = faq_collection.find_one({"_id": ObjectId(faq_id)}, {"bloqueado": 1})
@@ -104,6 +257,55 @@ def toggle_faq_block(faq_id: str) -> bool:
     return new_status
 
 
+# ──────────────────────────────────────────────
+# TAREAS PERIÓDICAS ENTRE WORKERS
+# ──────────────────────────────────────────────
+
+def claim_periodic_task(nombre: str, intervalo_segundos: float) -> bool:
+    """
+    Reserva la tarea `nombre` si nadie la ejecutó en los últimos
+    intervalo_segundos. Con varios workers (o varias instancias) solo uno
+    recibe True por intervalo: el documento se actualiza de forma atómica.
+    """
+    ahora = datetime.now()
+    try:
+        resultado = tareas_collection.update_one(
+            {"_id": nombre, "ultima": {"$lt": ahora - timedelta(seconds=intervalo_segundos)}},
+            {"$set": {"ultima": ahora}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        return False   # el documento existe y la última ejecución es reciente
+    return resultado.modified_count > 0 or resultado.upserted_id is not None
+
+
+# ──────────────────────────────────────────────
+# FUNCIONES EMBEDDINGS FAQ
+# ──────────────────────────────────────────────
+
+def get_faq_embeddings(claves: list[str]) -> dict[str, bytes]:
+    """
+    Retorna {clave: vector serializado} para las claves que ya existen.
+    Los vectores se guardan como bytes float32 (ver models/almacen_embeddings.py).
+    """
+    resultado = {}
+    # Lotes de 1000 para no construir filtros $in gigantes
+    for i in range(0, len(claves), 1000):
+        lote = claves[i:i + 1000]
+        for doc in faq_embeddings_collection.find({"_id": {"$in": lote}}):
+            resultado[doc['_id']] = doc['vector']
+    return resultado
+
+def upsert_faq_embeddings(vectores: dict[str, bytes]) -> None:
+    """Guarda (o reemplaza) vectores serializados indexados por su clave."""
+    if not vectores:
+        return
+    faq_embeddings_collection.bulk_write([
+        UpdateOne({"_id": clave}, {"$set": {"vector": vector}}, upsert=True)
+        for clave, vector in vectores.items()
+    ], ordered=False)
+
+
 # ──────────────────────────────────────────────
 # FUNCIONES ACCESS LOG
 # ──────────────────────────────────────────────
@@ -112,7 +314,12 @@ def insert_access_log(dia: str, fecha: str, hora: str,
                       programa: str, dispositivo: str,
                       ip: str, matricula: str = "") -> None:
     """Registra un acceso. El campo matricula es opcional para compatibilidad."""
-    access_log_collection.insert_one({
+    access_log_collection.insert_one(
+        _documento_acceso(dia, fecha, hora, programa, dispositivo, ip, matricula)
+    )
+
+def _documento_acceso(dia, fecha, hora, programa, dispositivo, ip, matricula) -> dict:
+    return {
         "dia":        dia,
         "fecha":      fecha,
         "hora":       hora,
@@ -120,7 +327,7 @@ def insert_access_log(dia: str, fecha: str, hora: str,
         "dispositivo": dispositivo,
         "ip":         ip,
         "matricula":  matricula,
-    })
+    }
 
 def get_all_access_logs() -> list[dict]:
     return list(access_log_collection.find(
@@ -136,7 +343,34 @@ def insert_chat_log(matricula: str, programa: str,
                     pregunta: str, respuesta: str,
                     modelo: str, fecha: str, hora: str) -> None:
     """Guarda una pregunta/respuesta asociada a la matrícula del alumno."""
-    chat_logs_collection.insert_one({
+    chat_logs_collection.insert_one(
+        _documento_chat(matricula, programa, pregunta, respuesta, modelo, fecha, hora)
+    )
+
+def insert_chat_logs(registros: list[dict]) -> None:
+    """
+    Inserta varios registros de chat en una sola operación (cola de escrituras
+    diferidas). Cada registro recibe su _id la primera vez: si la cola reintenta
+    el lote tras un error, los que ya se insertaron no se duplican.
+    """
+    if not registros:
+        return
+    documentos = []
+    for r in registros:
+        r.setdefault("_id", ObjectId())
+        datos = {campo: valor for campo, valor in r.items() if campo != "_id"}
+        documentos.append({"_id": r["_id"], **_documento_chat(**datos)})
+    try:
+        chat_logs_collection.insert_many(documentos, ordered=False)
+    except BulkWriteError as e:
+        # Solo claves duplicadas: insertados en un intento anterior
+        if e.details.get("writeConcernErrors") or any(
+            error.get("code") != 11000 for error in e.details.get("writeErrors", [])
+        ):
+            raise
+
+def _documento_chat(matricula, programa, pregunta, respuesta, modelo, fecha, hora) -> dict:
+    return {
         "matricula": matricula,
         "programa":  programa,
         "pregunta":  pregunta,
@@ -144,7 +378,7 @@ def insert_chat_log(matricula: str, programa: str,
         "modelo":    modelo,
         "fecha":     fecha,
         "hora":      hora,
-    })
+    }
 
 def get_all_chat_logs(limit: int = 500) -> list[dict]:
     """Retorna los registros más recientes de chat (máx. 500 por defecto)."""
@@ -162,3 +396,44 @@ def get_chat_logs_by_matricula(matricula: str) -> list[dict]:
         .find({"matricula": matricula}, {"_id": 0})
         .sort([("fecha", DESCENDING), ("hora", DESCENDING)])
     )
+
+
+
+# ──────────────────────────────────────────────
+# CLIENTE ASYNC (ruta ASGI, ver asgi.py)
+# ──────────────────────────────────────────────
+# AsyncMongoClient (pymongo >= 4.9) queda ligado al event loop donde se usa
+# por primera vez, así que se crea de forma diferida dentro del servidor ASGI.
+
+_db_async = None
+
+def obtener_db_async():
+    """Base de datos con el cliente async de pymongo (se crea en el primer uso)."""
+    global _db_async
+    if _db_async is None:
+        from pymongo import AsyncMongoClient
+        cliente_async = AsyncMongoClient(
+            MONGODB_URL,
+            serverSelectionTimeoutMS=5000,
+            connectTimeoutMS=5000,
+            socketTimeoutMS=10000,
+            retryWrites=True,
+        )
+        _db_async = cliente_async[DB_NAME]
+    return _db_async
+
+async def ainsert_access_log(dia: str, fecha: str, hora: str,
+                             programa: str, dispositivo: str,
+                             ip: str, matricula: str = "") -> None:
+    """Versión async de insert_access_log."""
+    await obtener_db_async()["access_log"].insert_one(
+        _documento_acceso(dia, fecha, hora, programa, dispositivo, ip, matricula)
+    )
+
+async def ainsert_chat_log(matricula: str, programa: str,
+                           pregunta: str, respuesta: str,
+                           modelo: str, fecha: str, hora: str) -> None:
+    """Versión async de insert_chat_log."""
+    await obtener_db_async()["chat_logs"].insert_one(
+        _documento_chat(matricula, programa, pregunta, respuesta, modelo, fecha, hora)
+    )
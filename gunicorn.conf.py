@@ -0,0 +1,40 @@
+# --- gunicorn.conf.py ---
+"""
+Hooks de gunicorn (se lee automáticamente desde el directorio del proyecto).
+
+Con --preload el maestro importa la aplicación una sola vez y los workers
+la heredan al hacer fork; los hilos, en cambio, no se heredan. Por eso el
+calentamiento de KNN y RAG (logic/calentamiento.py) se lanza en cada
+worker tras el fork. Con UvicornWorker, el lifespan de asgi.py hace lo
+mismo; la llamada es idempotente.
+
+El primer worker de cada arranque construye el índice KNN y lo publica como
+instantánea compartida (models/instantanea_compartida.py); los demás la
+mapean en memoria en vez de construir la suya.
+
+Al salir cada worker se escribe lo que quede en la cola de escrituras
+diferidas (logic/cola_escritura.py; atexit lo cubre fuera de gunicorn).
+"""
+import os
+import uuid
+
+
+def on_starting(server):
+    # Identifica este arranque: los workers lo heredan y solo reutilizan la
+    # instantánea compartida si la publicó un worker del mismo arranque
+    os.environ["GOIT_GENERACION_SERVIDOR"] = uuid.uuid4().hex
+
+
+def post_fork(server, worker):
+    from routes.app_chatbot import selector
+    from logic.calentamiento import iniciar_calentamiento
+    iniciar_calentamiento(selector)
+
+
+def worker_exit(server, worker):
+    # Registros y FAQs aún en la cola de escrituras diferidas
+    from logic import cola_escritura
+    from models import modelo_knn
+    cola_escritura.vaciar()
+    # Cambios del KNN aún no publicados para los demás workers
+    modelo_knn.publicar_pendientes()
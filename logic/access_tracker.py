@@ -13,8 +13,10 @@ if project_root not in sys.path:
 # --- IMPORTS DE BASE DE DATOS (MongoDB) ---
 from database import (
     insert_access_log, get_all_access_logs,
-    insert_chat_log,
+    insert_chat_log, insert_chat_logs, ainsert_access_log, ainsert_chat_log,
 )
+from models.metricas import medir
+from logic.cola_escritura import encolar
 
 
 # ──────────────────────────────────────────────────────────────
@@ -41,24 +43,77 @@ def registrar_acceso(programa: str, ip: str,
         return False
 
 
+async def aregistrar_acceso(programa: str, ip: str,
+                            dispositivo: str, matricula: str = "") -> bool:
+    """Versión async de registrar_acceso (ruta ASGI)."""
+    ahora = datetime.now()
+    try:
+        await ainsert_access_log(
+            dia        = ahora.strftime('%A'),
+            fecha      = ahora.strftime('%Y-%m-%d'),
+            hora       = ahora.strftime('%H:%M:%S'),
+            programa   = programa,
+            dispositivo= dispositivo,
+            ip         = ip,
+            matricula  = matricula,
+        )
+        print(f"✅ Acceso registrado: {matricula} | {programa} desde {ip}")
+        return True
+    except Exception as e:
+        print(f"❌ Error registrando acceso en MongoDB: {e}")
+        return False
+
+
 # ──────────────────────────────────────────────────────────────
 # REGISTRO DE PREGUNTA
 # ──────────────────────────────────────────────────────────────
 
+def _registro_pregunta(matricula, programa, pregunta, respuesta, modelo) -> dict:
+    ahora = datetime.now()
+    return {
+        "matricula": matricula,
+        "programa":  programa,
+        "pregunta":  pregunta,
+        "respuesta": respuesta,
+        "modelo":    modelo,
+        "fecha":     ahora.strftime('%Y-%m-%d'),
+        "hora":      ahora.strftime('%H:%M:%S'),
+    }
+
+
+def _insertar_preguntas(registros: list[dict]) -> None:
+    # Un insert_many por lote de la cola: etapa aparte de registro_mongo (una petición)
+    with medir("registro_mongo_lote"):
+        insert_chat_logs(registros)
+    print(f"✅ {len(registros)} preguntas registradas.")
+
+
 def registrar_pregunta(matricula: str, programa: str,
                        pregunta: str, respuesta: str,
                        modelo: str) -> bool:
-    ahora = datetime.now()
+    registro = _registro_pregunta(matricula, programa, pregunta, respuesta, modelo)
+    if encolar(_insertar_preguntas, registro):
+        return True
     try:
-        insert_chat_log(
-            matricula = matricula,
-            programa  = programa,
-            pregunta  = pregunta,
-            respuesta = respuesta,
-            modelo    = modelo,
-            fecha     = ahora.strftime('%Y-%m-%d'),
-            hora      = ahora.strftime('%H:%M:%S'),
-        )
+        with medir("registro_mongo"):
+            insert_chat_log(**registro)
+        print(f"✅ Pregunta registrada: {matricula} | modelo={modelo}")
+        return True
+    except Exception as e:
+        print(f"❌ Error registrando pregunta en MongoDB: {e}")
+        return False
+
+
+async def aregistrar_pregunta(matricula: str, programa: str,
+                              pregunta: str, respuesta: str,
+                              modelo: str) -> bool:
+    """Versión async de registrar_pregunta (ruta ASGI)."""
+    registro = _registro_pregunta(matricula, programa, pregunta, respuesta, modelo)
+    if encolar(_insertar_preguntas, registro):
+        return True
+    try:
+        with medir("registro_mongo"):
+            await ainsert_chat_log(**registro)
         print(f"✅ Pregunta registrada: {matricula} | modelo={modelo}")
         return True
     except Exception as e:
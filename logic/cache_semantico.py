@@ -0,0 +1,154 @@
+# --- cache_semantico.py ---
+"""
+Uso y capacidad del caché semántico (FAQs).
+
+- Cada vez que el selector sirve una FAQ se registra un acierto en memoria;
+  un hilo de fondo los vuelca a MongoDB en lote (campos `hits` y `ultimo_hit`).
+- El mismo hilo desaloja periódicamente FAQs aprendidas automáticamente que
+  superan la capacidad o la antigüedad configuradas (ver evict_auto_faqs).
+  Las FAQs manuales y las bloqueadas están exentas.
+
+El hilo arranca con el calentamiento de cada worker (logic/calentamiento.py),
+aunque el worker no sirva ningún acierto. La purga, en cambio, la ejecuta un
+solo worker por intervalo: se reserva en MongoDB con claim_periodic_task.
+
+Para purgar a mano (p. ej. tras bajar FAQ_AUTO_CAPACIDAD):
+    python -m logic.cache_semantico
+
+Las FAQs aprendidas antes de que existiera el campo `origen` se marcan con
+setup_db.py (ver backfill_faq_origen).
+"""
+import atexit
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+# --- CONFIGURACIÓN DE RUTAS ---
+current_dir  = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from database import increment_faq_hits, evict_auto_faqs, claim_periodic_task
+from models import modelo_knn
+
+# --- CONFIGURACIÓN ---
+FAQ_AUTO_CAPACIDAD     = int(os.getenv("FAQ_AUTO_CAPACIDAD", "5000"))   # 0 = sin límite
+FAQ_AUTO_TTL_DIAS      = int(os.getenv("FAQ_AUTO_TTL_DIAS", "180"))     # 0 = sin caducidad
+_SEGUNDOS_ENTRE_VOLCADOS = int(os.getenv("FAQ_HITS_INTERVALO", "30"))
+_SEGUNDOS_ENTRE_PURGAS   = int(os.getenv("FAQ_PURGA_INTERVALO", "600"))
+
+# faq_id → [aciertos, fecha del último acierto] pendientes de escribir
+_hits_pendientes = {}
+_lock_hits = threading.Lock()
+
+_hilo = None
+_pid_hilo = None
+_lock_hilo = threading.Lock()
+
+
+def registrar_hit(faq_id: str) -> None:
+    """Anota un acierto del caché. No toca MongoDB: se vuelca en lote."""
+    if not faq_id:
+        return
+    with _lock_hits:
+        pendiente = _hits_pendientes.setdefault(faq_id, [0, None])
+        pendiente[0] += 1
+        pendiente[1] = datetime.now()
+    _asegurar_hilo()
+
+
+def volcar_hits() -> int:
+    """Escribe en MongoDB los aciertos acumulados. Retorna cuántas FAQs se actualizaron."""
+    global _hits_pendientes
+    with _lock_hits:
+        pendientes, _hits_pendientes = _hits_pendientes, {}
+    if not pendientes:
+        return 0
+
+    try:
+        increment_faq_hits({faq_id: (n, ultimo) for faq_id, (n, ultimo) in pendientes.items()})
+        return len(pendientes)
+    except Exception as e:
+        print(f"⚠️ [Caché] No se pudieron guardar los aciertos: {e}")
+        # Se devuelven al búfer para el siguiente intento
+        with _lock_hits:
+            for faq_id, (n, ultimo) in pendientes.items():
+                actual = _hits_pendientes.setdefault(faq_id, [0, ultimo])
+                actual[0] += n
+                actual[1] = max(actual[1], ultimo)
+        return 0
+
+
+def purgar_cache() -> list[str]:
+    """
+    Desaloja FAQs automáticas por antigüedad (TTL) y por capacidad (LFU),
+    y las quita del índice KNN sin reconstruirlo. Retorna los ids eliminados.
+    """
+    # Primero los aciertos pendientes, para no desalojar FAQs recién usadas
+    volcar_hits()
+    try:
+        eliminadas = evict_auto_faqs(FAQ_AUTO_CAPACIDAD, FAQ_AUTO_TTL_DIAS)
+    except Exception as e:
+        print(f"⚠️ [Caché] Error al purgar FAQs: {e}")
+        return []
+
+    for faq_id in eliminadas:
+        modelo_knn.eliminar_faq(faq_id)
+    if eliminadas:
+        print(f"🧹 [Caché] {len(eliminadas)} FAQs automáticas desalojadas.")
+    return eliminadas
+
+
+def _toca_purgar() -> bool:
+    """True si este worker se reservó la purga del intervalo actual."""
+    try:
+        return claim_periodic_task("purga_faq_auto", _SEGUNDOS_ENTRE_PURGAS)
+    except Exception as e:
+        print(f"⚠️ [Caché] No se pudo reservar la purga: {e}")
+        return False
+
+
+def _bucle():
+    while True:
+        time.sleep(_SEGUNDOS_ENTRE_VOLCADOS)
+        volcar_hits()
+        if _toca_purgar():
+            purgar_cache()
+
+
+def iniciar() -> None:
+    """Arranca el hilo de volcado y purga de este worker (idempotente)."""
+    _asegurar_hilo()
+
+
+def _asegurar_hilo():
+    """
+    Arranca el hilo de fondo en el primer uso. Se comprueba el pid porque
+    gunicorn --preload hace fork y los hilos no sobreviven en el hijo.
+    """
+    global _hilo, _pid_hilo
+    if _hilo is not None and _pid_hilo == os.getpid():
+        return
+    with _lock_hilo:
+        if _hilo is not None and _pid_hilo == os.getpid():
+            return
+        _hilo = threading.Thread(target=_bucle, name="cache-semantico", daemon=True)
+        _pid_hilo = os.getpid()
+        _hilo.start()
+
+
+# Al apagar el proceso se vuelcan los aciertos que queden en memoria
+atexit.register(volcar_hits)
+
+
+if __name__ == "__main__":
+    # Carga el índice para que las FAQs desalojadas también salgan de la
+    # instantánea compartida que usan los workers
+    modelo_knn.cargar_knn()
+    eliminadas = purgar_cache()
+    print(f"✅ Purga completa: {len(eliminadas)} FAQs automáticas desalojadas "
+          f"(capacidad={FAQ_AUTO_CAPACIDAD}, TTL={FAQ_AUTO_TTL_DIAS} días).")
@@ -0,0 +1,122 @@
+# --- calentamiento.py ---
+"""
+Calentamiento en segundo plano de cada worker.
+
+Sin él, el primer alumno tras un despliegue pagaba la carga de todas las
+FAQ, sus embeddings y la conexión con Chroma y el LLM, y si algo fallaba
+las consultas siguientes chocaban con los intervalos de reintento. Ahora,
+al arrancar cada worker, un hilo:
+
+1. carga el índice KNN (la instantánea compartida si otro worker ya la
+   publicó; si no, desde MongoDB, ver models/modelo_knn.py),
+2. hace una llamada de prueba al proveedor de embeddings,
+3. construye la cadena RAG (Chroma + proveedores del LLM),
+
+y reintenta cada CALENTAMIENTO_REINTENTO_SEGUNDOS lo que falte. GET /ready
+(routes/app_estado.py) responde 503 hasta que todo está listo, para que la
+plataforma no envíe tráfico a un worker frío.
+
+Se inicia después del fork (gunicorn.conf.py y el lifespan de asgi.py): un
+hilo arrancado en el proceso maestro de `--preload` no sobrevive al fork.
+Con CALENTAR_AL_ARRANCAR=0 se vuelve a la inicialización diferida en la
+primera consulta y /ready responde siempre 200.
+"""
+import os
+import sys
+import time
+import threading
+
+# Configuración de rutas
+current_dir  = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from models import modelo_knn
+from models.proveedor_embeddings import obtener_proveedor
+from logic import cache_semantico
+
+# --- CONFIGURACIÓN ---
+CALENTAR_AL_ARRANCAR = os.getenv("CALENTAR_AL_ARRANCAR", "1").strip().lower() in ("1", "true", "si")
+CALENTAMIENTO_REINTENTO_SEGUNDOS = float(os.getenv("CALENTAMIENTO_REINTENTO_SEGUNDOS", "5"))
+
+# Estados con los que un componente no impide atender tráfico
+# ("sin_entrenar": aún no hay colección en Chroma; el KNN y el aviso al alumno siguen funcionando)
+_ESTADOS_LISTOS = frozenset({"listo", "desactivado", "sin_entrenar"})
+
+_lock = threading.Lock()
+_hilo = None
+_pid = None          # proceso en el que se lanzó el hilo (un worker nuevo hereda las globales del maestro)
+_selector = None
+_estado_embeddings = "pendiente"
+
+
+def iniciar_calentamiento(selector) -> None:
+    """Lanza el calentamiento de este proceso (idempotente: una vez por worker)."""
+    global _hilo, _pid, _selector
+    with _lock:
+        if _pid == os.getpid():
+            return
+        _pid = os.getpid()
+        _selector = selector
+        # Volcado de aciertos y purga del caché FAQ, aunque el worker no sirva ninguno
+        cache_semantico.iniciar()
+        if not CALENTAR_AL_ARRANCAR:
+            print("ℹ️ [Calentamiento] Desactivado: los modelos se cargan en la primera consulta.")
+            return
+        _hilo = threading.Thread(target=_calentar, name="calentamiento", daemon=True)
+        _hilo.start()
+
+
+def _calentar():
+    global _estado_embeddings
+    inicio = time.monotonic()
+    print(f"🔥 [Calentamiento] Iniciando en el worker {os.getpid()}...")
+
+    while True:
+        if _selector.usar_knn and not modelo_knn.obtener_instantanea().cargada:
+            modelo_knn.cargar_knn()
+
+        if _estado_embeddings != "listo":
+            try:
+                # Sin pasar por el caché de consultas: abre la conexión (o carga el modelo local)
+                obtener_proveedor().embed_query("calentamiento")
+                _estado_embeddings = "listo"
+            except Exception as e:
+                _estado_embeddings = "error"
+                print(f"⚠️ [Calentamiento] Proveedor de embeddings no disponible: {e}")
+
+        if _selector.usar_llm:
+            _selector.calentar()
+
+        componentes = estado_componentes()
+        if all(estado in _ESTADOS_LISTOS for estado in componentes.values()):
+            print(f"✅ [Calentamiento] Completo en {time.monotonic() - inicio:.1f}s: {componentes}")
+            return
+
+        print(f"⏳ [Calentamiento] Pendiente {componentes}; "
+              f"nuevo intento en {CALENTAMIENTO_REINTENTO_SEGUNDOS:g}s.")
+        time.sleep(CALENTAMIENTO_REINTENTO_SEGUNDOS)
+
+
+def estado_componentes() -> dict:
+    """Estado de cada componente: listo, cargando, pendiente, error, sin_entrenar o desactivado."""
+    if _selector is None:
+        return {"knn": "pendiente", "embeddings": "pendiente", "rag": "pendiente"}
+
+    if not _selector.usar_knn:
+        knn = "desactivado"
+    elif modelo_knn.obtener_instantanea().cargada:
+        knn = "listo"
+    else:
+        knn = "cargando" if _hilo is not None and _hilo.is_alive() else "pendiente"
+
+    return {"knn": knn, "embeddings": _estado_embeddings, "rag": _selector.estado_cadena}
+
+
+def listo() -> bool:
+    """True si el worker puede recibir tráfico."""
+    if not CALENTAR_AL_ARRANCAR:
+        return True
+    return all(estado in _ESTADOS_LISTOS for estado in estado_componentes().values())
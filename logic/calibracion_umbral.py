@@ -0,0 +1,306 @@
+# --- calibracion_umbral.py ---
+"""
+Calibración offline del umbral del caché semántico (KNN).
+
+Reproduce preguntas reales contra el índice KNN actual y, para un barrido de
+umbrales de distancia coseno, estima:
+- tasa de aciertos del caché (preguntas que NO irían al LLM),
+- llamadas al LLM y segundos de generación que se ahorrarían,
+- posibles respuestas incorrectas, cuando hay una respuesta de referencia
+  (columna Respuesta del CSV): aciertos cuya FAQ devuelve otra respuesta.
+También muestra la distribución de distancias.
+
+Fuentes:
+- chat_logs de MongoDB (por defecto): preguntas reales de los alumnos. Cada
+  respuesta del LLM se guardó como FAQ con esa misma pregunta, así que siempre
+  se ignora la FAQ idéntica (dejar uno fuera): si no, toda pregunta del log
+  acertaría consigo misma a distancia 0 con cualquier umbral.
+- un CSV con columna "Pregunta" (y opcionalmente "Respuesta"), p. ej. data/faq.csv.
+  Como esas preguntas suelen ser FAQs, --dejar-uno-fuera ignora la FAQ idéntica
+  y mide si la pregunta se habría respondido con la FAQ vecina.
+
+Uso:
+    python -m logic.calibracion_umbral [--csv data/faq.csv --dejar-uno-fuera]
+                                       [--limite 5000] [--latencia-llm 3.0]
+                                       [--guardar 0.18 | --auto-precision 0.95]
+
+--guardar / --auto-precision escriben data/config_selector.json, que el
+selector lee al arrancar (reiniciar la app para aplicarlo).
+"""
+import argparse
+import csv
+import os
+import sys
+from datetime import datetime
+from difflib import SequenceMatcher
+import numpy as np
+
+# --- CONFIGURACIÓN DE RUTAS ---
+current_dir  = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from database import get_all_chat_logs
+from models import modelo_knn
+from models.normalizacion import normalizar_texto
+from logic.seleccion_modelo import leer_umbral_configurado, guardar_umbral_configurado
+
+UMBRALES_POR_DEFECTO = [round(float(u), 3) for u in np.arange(0.05, 0.41, 0.025)]
+
+# Latencia media estimada de una respuesta del LLM (chat_logs no guarda tiempos)
+LATENCIA_LLM_SEGUNDOS = 3.0
+
+# Similitud mínima entre textos de respuesta para considerarlos la misma respuesta
+_SIMILITUD_MISMA_RESPUESTA = 0.8
+
+# Vecinos pedidos por pregunta: con --dejar-uno-fuera hace falta el segundo
+_K_VECINOS = 4
+
+_BLOQUE_EMBEDDINGS = 256
+
+
+# ──────────────────────────────────────────────────────────────
+# CARGA DE PREGUNTAS
+# ──────────────────────────────────────────────────────────────
+
+def cargar_chat_logs(limite: int) -> list[dict]:
+    """Preguntas recientes de chat_logs: [{"pregunta", "referencia": None, "fuente"}]."""
+    return [
+        {"pregunta": log["pregunta"], "referencia": None, "fuente": log.get("modelo", "")}
+        for log in get_all_chat_logs(limit=limite)
+        if log.get("pregunta")
+    ]
+
+
+def cargar_csv(ruta: str) -> list[dict]:
+    """Preguntas de un CSV con columnas Pregunta y (opcional) Respuesta."""
+    with open(ruta, 'r', encoding='utf-8-sig', newline='') as f:
+        filas = list(csv.DictReader(f))
+    return [
+        {"pregunta": fila["Pregunta"], "referencia": fila.get("Respuesta"), "fuente": ""}
+        for fila in filas
+        if (fila.get("Pregunta") or "").strip()
+    ]
+
+
+# ──────────────────────────────────────────────────────────────
+# REPRODUCCIÓN CONTRA EL ÍNDICE
+# ──────────────────────────────────────────────────────────────
+
+def _misma_respuesta(a: str, b: str) -> bool:
+    a, b = normalizar_texto(a), normalizar_texto(b)
+    return a == b or SequenceMatcher(None, a, b).ratio() >= _SIMILITUD_MISMA_RESPUESTA
+
+
+def reproducir(preguntas: list[dict], dejar_uno_fuera: bool = False) -> list[dict]:
+    """
+    Busca la FAQ más cercana a cada pregunta, igual que el selector
+    (coincidencia exacta normalizada primero, después KNN).
+
+    dejar_uno_fuera ignora las FAQs cuya pregunta o alias coincide con la
+    pregunta (obligatorio con chat_logs, ver el docstring del módulo).
+
+    Las preguntas repetidas se embeben una sola vez. Retorna una lista con
+    {"distancia", "correcta" (bool o None sin referencia), "fuente"} por pregunta.
+    """
+    instantanea = modelo_knn.obtener_instantanea()
+    if not instantanea.cargada:
+        modelo_knn.inicializar_knn()
+        instantanea = modelo_knn.obtener_instantanea()
+    if instantanea.indice is None:
+        raise RuntimeError("El índice KNN está vacío: no hay FAQs contra las que calibrar.")
+
+    # La calibración es global: coincidencias exactas de cualquier shard
+    exactas = {clave: faq_id for (_, clave), faq_id in instantanea.exactas.items()}
+
+    # Texto normalizado → primera pregunta original, para embeber una vez por texto
+    unicas = {}
+    for p in preguntas:
+        unicas.setdefault(normalizar_texto(p["pregunta"]), p["pregunta"])
+
+    # Solo se embeben las que no se resuelven por coincidencia exacta
+    por_embeber = [
+        clave for clave in unicas
+        if dejar_uno_fuera or clave not in exactas
+    ]
+    vecinos = {}
+    for inicio in range(0, len(por_embeber), _BLOQUE_EMBEDDINGS):
+        bloque = por_embeber[inicio:inicio + _BLOQUE_EMBEDDINGS]
+        vectores = modelo_knn.modelo_embedding.embed_documents([unicas[c] for c in bloque])
+        ids, distancias = instantanea.indice.query_many(vectores, k=_K_VECINOS)
+        for clave, fila_ids, fila_dist in zip(bloque, ids, distancias):
+            vecinos[clave] = list(zip(fila_ids, (float(d) for d in fila_dist)))
+    print(f"[Calibración] {len(preguntas)} preguntas, {len(unicas)} distintas, "
+          f"{len(por_embeber)} embebidas.")
+
+    resultados = []
+    for p in preguntas:
+        clave = normalizar_texto(p["pregunta"])
+        mejor = None
+        if not dejar_uno_fuera and clave in exactas:
+            mejor = (exactas[clave], 0.0)
+        else:
+            for faq_id, distancia in vecinos.get(clave, []):
+                faq = instantanea.faqs.get(faq_id)
+                if faq is None:
+                    continue
+                if dejar_uno_fuera and (
+                    normalizar_texto(faq.pregunta) == clave
+                    or any(normalizar_texto(a) == clave for a in faq.alias)
+                ):
+                    continue
+                mejor = (faq_id, distancia)
+                break
+
+        if mejor is None:
+            resultados.append({"distancia": 1.0, "correcta": None, "fuente": p["fuente"]})
+            continue
+
+        faq = instantanea.faqs[mejor[0]]
+        correcta = None
+        if p["referencia"]:
+            correcta = _misma_respuesta(faq.respuesta, p["referencia"])
+        resultados.append({"distancia": mejor[1], "correcta": correcta, "fuente": p["fuente"]})
+
+    return resultados
+
+
+# ──────────────────────────────────────────────────────────────
+# MÉTRICAS
+# ──────────────────────────────────────────────────────────────
+
+def barrer_umbrales(resultados: list[dict], umbrales=UMBRALES_POR_DEFECTO,
+                    latencia_llm: float = LATENCIA_LLM_SEGUNDOS) -> list[dict]:
+    """
+    Métricas por umbral. "llm_evitadas" cuenta aciertos en preguntas que hoy
+    respondió el LLM (según chat_logs); sin esa información, todos los aciertos.
+    """
+    distancias = np.array([r["distancia"] for r in resultados], dtype=np.float32)
+    del_llm = np.array([("LLM" in r["fuente"]) or not r["fuente"] for r in resultados])
+    con_referencia = np.array([r["correcta"] is not None for r in resultados])
+    correctas = np.array([bool(r["correcta"]) for r in resultados])
+    total = len(resultados)
+
+    filas = []
+    for umbral in umbrales:
+        aciertos = distancias <= umbral
+        evitadas = int(np.sum(aciertos & del_llm))
+        evaluables = int(np.sum(aciertos & con_referencia))
+        incorrectas = int(np.sum(aciertos & con_referencia & ~correctas))
+        filas.append({
+            "umbral":         float(umbral),
+            "aciertos":       int(np.sum(aciertos)),
+            "tasa_aciertos":  float(np.mean(aciertos)) if total else 0.0,
+            "llm_evitadas":   evitadas,
+            "segundos_ahorrados": round(evitadas * latencia_llm, 1),
+            "incorrectas":    incorrectas if evaluables else None,
+            "precision":      (1 - incorrectas / evaluables) if evaluables else None,
+        })
+    return filas
+
+
+def distribucion_distancias(resultados: list[dict], ancho: float = 0.05) -> dict:
+    """Percentiles e histograma (por intervalos de `ancho`) de las distancias."""
+    distancias = np.array([r["distancia"] for r in resultados], dtype=np.float32)
+    if len(distancias) == 0:
+        return {"percentiles": {}, "histograma": []}
+    percentiles = {
+        f"p{p}": float(np.percentile(distancias, p)) for p in (10, 25, 50, 75, 90)
+    }
+    limites = np.arange(0.0, 1.0 + ancho, ancho)
+    conteos, _ = np.histogram(np.clip(distancias, 0.0, 1.0), bins=limites)
+    histograma = [
+        {"desde": float(a), "hasta": float(b), "n": int(n)}
+        for a, b, n in zip(limites[:-1], limites[1:], conteos)
+    ]
+    return {"percentiles": percentiles, "histograma": histograma}
+
+
+def elegir_umbral(filas: list[dict], precision_minima: float) -> float | None:
+    """Mayor umbral cuya precisión estimada alcanza precision_minima (requiere referencia)."""
+    validos = [
+        f["umbral"] for f in filas
+        if f["precision"] is not None and f["precision"] >= precision_minima
+    ]
+    return max(validos) if validos else None
+
+
+# ──────────────────────────────────────────────────────────────
+# CLI
+# ──────────────────────────────────────────────────────────────
+
+def _imprimir_informe(filas, distribucion, umbral_actual):
+    print(f"\nUmbral actual del selector: {umbral_actual}")
+    print(f"\n{'umbral':>7} {'aciertos':>9} {'tasa':>7} {'LLM evit.':>10} "
+          f"{'seg. ahorr.':>12} {'incorr.':>8} {'precisión':>10}")
+    for f in filas:
+        incorrectas = "-" if f["incorrectas"] is None else str(f["incorrectas"])
+        precision = "-" if f["precision"] is None else f"{f['precision']:.1%}"
+        marca = " ◀" if abs(f["umbral"] - umbral_actual) < 1e-6 else ""
+        print(f"{f['umbral']:>7.3f} {f['aciertos']:>9} {f['tasa_aciertos']:>7.1%} "
+              f"{f['llm_evitadas']:>10} {f['segundos_ahorrados']:>12} "
+              f"{incorrectas:>8} {precision:>10}{marca}")
+
+    print("\nDistribución de distancias:")
+    print("   " + "  ".join(f"{k}={v:.3f}" for k, v in distribucion["percentiles"].items()))
+    maximo = max((h["n"] for h in distribucion["histograma"]), default=0) or 1
+    for h in distribucion["histograma"]:
+        if h["n"]:
+            barra = "█" * max(1, round(40 * h["n"] / maximo))
+            print(f"   {h['desde']:.2f}-{h['hasta']:.2f} {h['n']:>6} {barra}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calibra el umbral del caché semántico KNN.")
+    parser.add_argument("--csv", help="CSV con columnas Pregunta[,Respuesta] en lugar de chat_logs")
+    parser.add_argument("--limite", type=int, default=5000,
+                        help="máximo de registros de chat_logs (por defecto %(default)s)")
+    parser.add_argument("--dejar-uno-fuera", action="store_true",
+                        help="con --csv: ignorar la FAQ idéntica a cada pregunta "
+                             "(con chat_logs siempre se ignora)")
+    parser.add_argument("--latencia-llm", type=float, default=LATENCIA_LLM_SEGUNDOS,
+                        help="segundos estimados por respuesta del LLM (por defecto %(default)s)")
+    grupo = parser.add_mutually_exclusive_group()
+    grupo.add_argument("--guardar", type=float, metavar="UMBRAL",
+                       help="guardar este umbral en la configuración del selector")
+    grupo.add_argument("--auto-precision", type=float, metavar="P",
+                       help="guardar el mayor umbral con precisión estimada >= P (requiere Respuesta)")
+    args = parser.parse_args()
+
+    if args.csv:
+        preguntas = cargar_csv(args.csv)
+        origen = os.path.basename(args.csv)
+        dejar_uno_fuera = args.dejar_uno_fuera
+    else:
+        preguntas = cargar_chat_logs(args.limite)
+        origen = "chat_logs"
+        # Las preguntas del log que respondió el LLM ya son FAQs: no deben acertar consigo mismas
+        dejar_uno_fuera = True
+    if not preguntas:
+        sys.exit("❌ No hay preguntas para reproducir.")
+
+    resultados = reproducir(preguntas, dejar_uno_fuera=dejar_uno_fuera)
+    umbral_actual = leer_umbral_configurado()
+    umbrales = sorted(set(UMBRALES_POR_DEFECTO) | {umbral_actual})
+    filas = barrer_umbrales(resultados, umbrales, latencia_llm=args.latencia_llm)
+    _imprimir_informe(filas, distribucion_distancias(resultados), umbral_actual)
+
+    elegido = args.guardar
+    if args.auto_precision is not None:
+        elegido = elegir_umbral(filas, args.auto_precision)
+        if elegido is None:
+            sys.exit(f"\n❌ Ningún umbral alcanza una precisión de {args.auto_precision:.1%} "
+                     "(¿el CSV tiene columna Respuesta?).")
+
+    if elegido is not None:
+        fila = barrer_umbrales(resultados, [elegido], latencia_llm=args.latencia_llm)[0]
+        guardar_umbral_configurado(elegido, {
+            "calibrado":     datetime.now().isoformat(timespec='seconds'),
+            "origen":        origen,
+            "preguntas":     len(resultados),
+            "tasa_aciertos": round(fila["tasa_aciertos"], 4),
+            "precision":     None if fila["precision"] is None else round(fila["precision"], 4),
+        })
+        print(f"\n✅ Umbral {elegido} guardado. Reinicia la aplicación para aplicarlo.")
@@ -0,0 +1,172 @@
+# --- cola_escritura.py ---
+"""
+Cola de escrituras diferidas (write-behind) de cada worker.
+
+Después de generar la respuesta, /chat guardaba la FAQ aprendida (búsqueda,
+inserción o actualización en MongoDB y embedding incremental del KNN) y
+registraba la pregunta en chat_logs antes de contestar al alumno. Ahora esos
+efectos secundarios se encolan y un hilo en segundo plano los ejecuta:
+
+- Cada elemento va con su destino: una función que recibe una lista de
+  elementos (p. ej. un insert_many en chat_logs). El hilo agrupa lo que haya
+  pendiente, hasta COLA_ESCRITURA_LOTE elementos, y llama a cada destino una
+  vez con sus elementos en orden de llegada.
+- Si un destino falla (p. ej. un error transitorio de MongoDB), el lote se
+  reintenta hasta COLA_ESCRITURA_REINTENTOS veces con espera creciente; solo
+  después se descarta. El destino puede quitar de la lista lo que ya escribió
+  para que el reintento no lo repita.
+- La cola está acotada (COLA_ESCRITURA_MAXIMO): si se llena, encolar()
+  retorna False y quien llama escribe de forma síncrona, como antes. Así una
+  caída de MongoDB no acumula memoria sin límite.
+- Al terminar el proceso (atexit, worker_exit de gunicorn o el lifespan de
+  asgi.py) vaciar() escribe lo pendiente, esperando como mucho
+  COLA_ESCRITURA_ESPERA_CIERRE segundos.
+
+Con COLA_ESCRITURA=0 todas las escrituras vuelven a ser síncronas.
+"""
+import os
+import sys
+import time
+import queue
+import atexit
+import threading
+
+# Configuración de rutas
+current_dir  = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from models.metricas import ESCRITURAS_DIFERIDAS
+
+# --- CONFIGURACIÓN ---
+COLA_ESCRITURA = os.getenv("COLA_ESCRITURA", "1").strip().lower() in ("1", "true", "si")
+COLA_ESCRITURA_MAXIMO = int(os.getenv("COLA_ESCRITURA_MAXIMO", "1000"))
+COLA_ESCRITURA_LOTE = int(os.getenv("COLA_ESCRITURA_LOTE", "100"))
+COLA_ESCRITURA_ESPERA_CIERRE = float(os.getenv("COLA_ESCRITURA_ESPERA_CIERRE", "10"))
+# Reintentos de un lote fallido; la espera empieza en COLA_ESCRITURA_ESPERA_REINTENTO
+# segundos y se duplica en cada intento
+COLA_ESCRITURA_REINTENTOS = int(os.getenv("COLA_ESCRITURA_REINTENTOS", "3"))
+COLA_ESCRITURA_ESPERA_REINTENTO = float(os.getenv("COLA_ESCRITURA_ESPERA_REINTENTO", "0.5"))
+
+_lock = threading.Lock()
+_cola = queue.Queue(maxsize=COLA_ESCRITURA_MAXIMO)
+_hilo = None
+_pid = None          # proceso dueño del hilo (tras el fork, el worker lanza el suyo)
+_cerrando = threading.Event()
+
+
+def _nombre(destino) -> str:
+    return getattr(destino, "__name__", "desconocido").lstrip("_")
+
+
+def encolar(destino, elemento) -> bool:
+    """
+    Encola `elemento` para que el hilo de escritura llame a destino([..., elemento]).
+    Retorna False si la cola está desactivada, llena o cerrándose: en ese caso
+    quien llama debe escribir de forma síncrona.
+    """
+    if not COLA_ESCRITURA or _cerrando.is_set():
+        return False
+    _asegurar_hilo()
+    try:
+        _cola.put_nowait((destino, elemento))
+    except queue.Full:
+        ESCRITURAS_DIFERIDAS.incrementar(_nombre(destino), "sincrona")
+        print(f"⚠️ [Cola escritura] Cola llena ({COLA_ESCRITURA_MAXIMO}): escritura síncrona.")
+        return False
+    ESCRITURAS_DIFERIDAS.incrementar(_nombre(destino), "encolada")
+    return True
+
+
+def pendientes() -> int:
+    return _cola.qsize()
+
+
+def _asegurar_hilo():
+    global _hilo, _pid, _cola
+    if _pid == os.getpid():
+        return
+    with _lock:
+        if _pid == os.getpid():
+            return
+        if _pid is not None:
+            # Proceso hijo: lo heredado del padre lo escribe el padre
+            _cola = queue.Queue(maxsize=COLA_ESCRITURA_MAXIMO)
+        _hilo = threading.Thread(target=_trabajar, name="cola-escritura", daemon=True)
+        _hilo.start()
+        _pid = os.getpid()
+
+
+def _trabajar():
+    while True:
+        try:
+            primero = _cola.get(timeout=0.5)
+        except queue.Empty:
+            if _cerrando.is_set():
+                return
+            continue
+
+        # Lo que ya esté esperando sale en el mismo lote
+        lote = [primero]
+        while len(lote) < COLA_ESCRITURA_LOTE:
+            try:
+                lote.append(_cola.get_nowait())
+            except queue.Empty:
+                break
+
+        por_destino = {}
+        for destino, elemento in lote:
+            por_destino.setdefault(destino, []).append(elemento)
+        for destino, elementos in por_destino.items():
+            _escribir(destino, elementos)
+
+
+def _escribir(destino, elementos):
+    """Llama a destino(elementos), con reintentos si falla (ver docstring del módulo)."""
+    nombre = _nombre(destino)
+    total = len(elementos)
+    for intento in range(COLA_ESCRITURA_REINTENTOS + 1):
+        try:
+            destino(elementos)
+            ESCRITURAS_DIFERIDAS.incrementar(nombre, "escrita", n=total)
+            return
+        except Exception as e:
+            error = e
+            if intento == COLA_ESCRITURA_REINTENTOS:
+                break
+            espera = COLA_ESCRITURA_ESPERA_REINTENTO * 2 ** intento
+            ESCRITURAS_DIFERIDAS.incrementar(nombre, "reintento", n=len(elementos))
+            print(f"⚠️ [Cola escritura] Error en {nombre} ({len(elementos)} elementos): {e}. "
+                  f"Reintento en {espera:g}s.")
+            time.sleep(espera)
+
+    if total > len(elementos):
+        ESCRITURAS_DIFERIDAS.incrementar(nombre, "escrita", n=total - len(elementos))
+    ESCRITURAS_DIFERIDAS.incrementar(nombre, "error", n=len(elementos))
+    print(f"❌ [Cola escritura] {len(elementos)} elementos de {nombre} descartados tras "
+          f"{COLA_ESCRITURA_REINTENTOS} reintentos: {error}")
+
+
+def vaciar(espera: float = COLA_ESCRITURA_ESPERA_CIERRE) -> None:
+    """
+    Escribe lo pendiente y detiene el hilo (al apagar el worker). Las
+    escrituras posteriores se hacen de forma síncrona.
+    """
+    _cerrando.set()
+    hilo = _hilo
+    if hilo is None or _pid != os.getpid() or not hilo.is_alive():
+        return
+    restantes = _cola.qsize()
+    if restantes:
+        print(f"⏳ [Cola escritura] Escribiendo {restantes} pendientes antes de cerrar...")
+    inicio = time.monotonic()
+    hilo.join(espera)
+    if hilo.is_alive():
+        print(f"⚠️ [Cola escritura] {_cola.qsize()} escrituras sin completar tras {espera:g}s.")
+    elif restantes:
+        print(f"✅ [Cola escritura] Vaciada en {time.monotonic() - inicio:.1f}s.")
+
+
+atexit.register(vaciar)
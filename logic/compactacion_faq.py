@@ -0,0 +1,171 @@
+# --- compactacion_faq.py ---
+"""
+Compactación de FAQs casi duplicadas.
+
+Cada pregunta que no acierta en el caché genera una FAQ nueva, así que la
+colección se llena de paráfrasis con respuestas casi iguales. Este proceso
+agrupa las FAQs cuyos embeddings están a distancia coseno <= umbral de un
+representante, conserva solo al representante y guarda las preguntas
+fusionadas en su campo `alias` (el KNN las sigue reconociendo por coincidencia
+exacta). Las FAQs bloqueadas nunca se fusionan ni se usan como representante.
+Si se fusiona una FAQ manual, el representante pasa a ser manual: el
+desalojo de FAQs "auto" (logic/cache_semantico.py) no debe borrar su contenido.
+Con SHARDS_POR_PROGRAMA solo se agrupan FAQs del mismo shard: la misma
+pregunta puede tener respuestas distintas en cada programa.
+
+Uso (por defecto solo muestra el plan, sin modificar nada):
+    python -m logic.compactacion_faq [--umbral 0.08] [--aplicar]
+"""
+import argparse
+import os
+import sys
+import numpy as np
+
+# --- CONFIGURACIÓN DE RUTAS ---
+current_dir  = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from database import merge_faqs
+from models import modelo_knn
+from models.indice_vectorial import IndiceCoseno
+
+# Más estricto que el umbral del selector (0.2): solo fusiona paráfrasis claras
+UMBRAL_COMPACTACION = float(os.getenv("FAQ_UMBRAL_COMPACTACION", "0.08"))
+
+# Vecinos revisados por FAQ al buscar duplicados
+_K_VECINOS = 10
+
+
+def _instantanea_cargada():
+    instantanea = modelo_knn.obtener_instantanea()
+    if not instantanea.cargada:
+        modelo_knn.inicializar_knn()
+        instantanea = modelo_knn.obtener_instantanea()
+    return instantanea
+
+
+def planificar_compactacion(instantanea, umbral: float = UMBRAL_COMPACTACION) -> list[dict]:
+    """
+    Calcula los grupos a fusionar sobre una instantánea del KNN, sin modificar nada.
+
+    Agrupamiento voraz: las FAQs con más vecinos dentro del umbral se toman
+    primero como representantes y absorben a sus vecinos aún libres. Así toda
+    FAQ fusionada queda a <= umbral de su representante (sin encadenamientos).
+
+    Retorna [{"representante": id, "fusionadas": [(id, distancia), ...]}, ...].
+    """
+    if instantanea.indice is None:
+        return []
+
+    por_shard = {}
+    for faq_id, faq in instantanea.faqs.items():
+        if not faq.bloqueado and faq_id in instantanea.indice:
+            por_shard.setdefault(faq.shard, []).append(faq_id)
+
+    grupos = []
+    for candidatas in por_shard.values():
+        grupos.extend(_agrupar(instantanea.indice, candidatas, umbral))
+    return grupos
+
+
+def _agrupar(indice_global, candidatas: list, umbral: float) -> list[dict]:
+    """Grupos de planificar_compactacion entre las FAQs de un solo shard."""
+    if len(candidatas) < 2:
+        return []
+
+    # Índice exacto temporal solo con las FAQs no bloqueadas del shard
+    matriz = np.vstack([indice_global.vector(i) for i in candidatas])
+    indice = IndiceCoseno(candidatas, matriz)
+    ids, distancias = indice.query_many(indice.matriz, k=_K_VECINOS)
+
+    vecinos = {}
+    for faq_id, fila_ids, fila_dist in zip(candidatas, ids, distancias):
+        vecinos[faq_id] = [
+            (otro, float(d)) for otro, d in zip(fila_ids, fila_dist)
+            if otro != faq_id and d <= umbral
+        ]
+
+    asignadas = set()
+    grupos = []
+    for faq_id in sorted(candidatas, key=lambda i: len(vecinos[i]), reverse=True):
+        if faq_id in asignadas or not vecinos[faq_id]:
+            continue
+        fusionadas = [(otro, d) for otro, d in vecinos[faq_id] if otro not in asignadas]
+        if not fusionadas:
+            continue
+        asignadas.add(faq_id)
+        asignadas.update(otro for otro, _ in fusionadas)
+        grupos.append({"representante": faq_id, "fusionadas": fusionadas})
+
+    return grupos
+
+
+def compactar_faqs(umbral: float = UMBRAL_COMPACTACION, aplicar: bool = False) -> dict:
+    """
+    Planifica y, si aplicar=True, ejecuta la compactación en MongoDB y
+    reconstruye el índice KNN (los vectores salen del almacén persistente,
+    sin llamadas de embeddings).
+
+    Retorna un resumen apto para JSON.
+    """
+    instantanea = _instantanea_cargada()
+    grupos = planificar_compactacion(instantanea, umbral)
+    faqs = instantanea.faqs
+
+    resumen = {
+        "umbral":     umbral,
+        "total_faqs": len(faqs),
+        "grupos":     [],
+        "eliminadas": 0,
+        "aplicado":   aplicar,
+    }
+
+    for grupo in grupos:
+        representante = faqs[grupo["representante"]]
+        resumen["grupos"].append({
+            "id":       grupo["representante"],
+            "pregunta": representante.pregunta,
+            "fusionadas": [
+                {"id": otro, "pregunta": faqs[otro].pregunta, "distancia": round(d, 4)}
+                for otro, d in grupo["fusionadas"]
+            ],
+        })
+
+    if aplicar and grupos:
+        for grupo in grupos:
+            alias = []
+            for otro, _ in grupo["fusionadas"]:
+                alias.append(faqs[otro].pregunta)
+                alias.extend(faqs[otro].alias)
+            resumen["eliminadas"] += merge_faqs(
+                grupo["representante"], alias, [otro for otro, _ in grupo["fusionadas"]]
+            )
+        print(f"✅ Compactación aplicada: {resumen['eliminadas']} FAQs fusionadas.")
+        modelo_knn.inicializar_knn()
+    elif not aplicar:
+        resumen["eliminadas"] = sum(len(g["fusionadas"]) for g in grupos)
+
+    return resumen
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fusiona FAQs casi duplicadas.")
+    parser.add_argument("--umbral", type=float, default=UMBRAL_COMPACTACION,
+                        help="distancia coseno máxima para fusionar (por defecto %(default)s)")
+    parser.add_argument("--aplicar", action="store_true",
+                        help="ejecutar la fusión; sin esta opción solo se muestra el plan")
+    args = parser.parse_args()
+
+    resumen = compactar_faqs(umbral=args.umbral, aplicar=args.aplicar)
+
+    for grupo in resumen["grupos"]:
+        print(f"\n📌 {grupo['pregunta']}")
+        for f in grupo["fusionadas"]:
+            print(f"   ↳ ({f['distancia']:.4f}) {f['pregunta']}")
+
+    accion = "fusionadas" if args.aplicar else "se fusionarían (usa --aplicar)"
+    print(f"\n{len(resumen['grupos'])} grupos, {resumen['eliminadas']} FAQs {accion}, "
+          f"de {resumen['total_faqs']} en total.")
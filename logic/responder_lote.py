@@ -0,0 +1,113 @@
+# --- responder_lote.py ---
+"""
+Responde offline una lista de preguntas con el mismo selector que el chatbot
+(caché FAQ → RAG), usando SelectorDeModelo.responder_lote: las preguntas
+repetidas se responden una vez, los embeddings se piden en lote y las
+generaciones del LLM se envían con concurrencia acotada.
+
+Sirve para pre-responder las preguntas de un curso nuevo o revisar qué
+respondería el bot antes de publicar cambios en los documentos.
+
+Fuentes:
+- un archivo de texto con una pregunta por línea, o
+- un CSV con columna "Pregunta" (--csv), p. ej. data/faq.csv.
+
+Uso:
+    python -m logic.responder_lote preguntas.txt [--programa X]
+                                   [--concurrencia 4] [--salida respuestas.csv]
+                                   [--guardar]
+
+--guardar inserta como FAQ las respuestas nuevas del LLM, igual que una
+consulta del chat (no bloqueadas; revisarlas en el panel admin).
+"""
+import argparse
+import csv
+import os
+import sys
+import time
+from collections import Counter
+
+# --- CONFIGURACIÓN DE RUTAS ---
+current_dir  = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from logic.seleccion_modelo import SelectorDeModelo, debe_aprenderse, LOTE_CONCURRENCIA_LLM
+
+
+# ──────────────────────────────────────────────────────────────
+# CARGA DE PREGUNTAS
+# ──────────────────────────────────────────────────────────────
+
+def cargar_texto(ruta: str) -> list[str]:
+    """Una pregunta por línea (se ignoran las vacías y las que empiezan por #)."""
+    with open(ruta, 'r', encoding='utf-8-sig') as f:
+        lineas = [linea.strip() for linea in f]
+    return [linea for linea in lineas if linea and not linea.startswith("#")]
+
+
+def cargar_csv(ruta: str) -> list[str]:
+    """Columna Pregunta de un CSV."""
+    with open(ruta, 'r', encoding='utf-8-sig', newline='') as f:
+        return [
+            fila["Pregunta"].strip()
+            for fila in csv.DictReader(f)
+            if (fila.get("Pregunta") or "").strip()
+        ]
+
+
+def escribir_csv(ruta: str, preguntas: list[str], resultados: list[tuple]) -> None:
+    with open(ruta, 'w', encoding='utf-8', newline='') as f:
+        escritor = csv.writer(f)
+        escritor.writerow(["Pregunta", "Respuesta", "Fuente", "Bloqueado"])
+        for pregunta, (respuesta, fuente, bloqueado) in zip(preguntas, resultados):
+            escritor.writerow([pregunta, respuesta, fuente, int(bloqueado)])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Responde una lista de preguntas con el chatbot.")
+    parser.add_argument("archivo", nargs="?", help="archivo de texto con una pregunta por línea")
+    parser.add_argument("--csv", help="CSV con columna Pregunta en lugar del archivo de texto")
+    parser.add_argument("--programa", default="", help="programa de las preguntas (filtra documentos y shard)")
+    parser.add_argument("--concurrencia", type=int, default=LOTE_CONCURRENCIA_LLM,
+                        help="generaciones del LLM simultáneas (por defecto %(default)s)")
+    parser.add_argument("--salida", help="CSV donde escribir Pregunta,Respuesta,Fuente,Bloqueado")
+    parser.add_argument("--guardar", action="store_true",
+                        help="guardar como FAQ las respuestas nuevas del LLM")
+    args = parser.parse_args()
+
+    if bool(args.archivo) == bool(args.csv):
+        parser.error("indica un archivo de preguntas o --csv (solo uno)")
+
+    preguntas = cargar_csv(args.csv) if args.csv else cargar_texto(args.archivo)
+    if not preguntas:
+        sys.exit("❌ No hay preguntas para responder.")
+
+    selector = SelectorDeModelo()
+    inicio = time.monotonic()
+    resultados = selector.responder_lote(preguntas, programa=args.programa,
+                                         max_concurrencia=args.concurrencia)
+    segundos = time.monotonic() - inicio
+
+    if args.guardar:
+        # Import diferido: el blueprint del chat crea su propio selector
+        from routes.app_chatbot import guardar_faq_db
+        guardadas = set()
+        for pregunta, (respuesta, fuente, bloqueado) in zip(preguntas, resultados):
+            if debe_aprenderse(fuente, bloqueado) and respuesta not in guardadas:
+                guardar_faq_db(pregunta, respuesta, args.programa)
+                guardadas.add(respuesta)
+        print(f"💾 {len(guardadas)} respuestas nuevas guardadas como FAQ.")
+
+    if args.salida:
+        escribir_csv(args.salida, preguntas, resultados)
+        print(f"📄 Resultados escritos en {args.salida}")
+    else:
+        for pregunta, (respuesta, fuente, _) in zip(preguntas, resultados):
+            print(f"\n❓ {pregunta}\n[{fuente}] {respuesta}")
+
+    print(f"\n✅ {len(preguntas)} preguntas respondidas en {segundos:.1f}s.")
+    for fuente, total in Counter(fuente for _, fuente, _ in resultados).most_common():
+        print(f"   {fuente:<20} {total}")
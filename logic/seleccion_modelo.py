@@ -1,21 +1,103 @@
 # --- seleccion_modelo.py ---
-import time
-from models.modelo_knn import obtener_respuesta_knn
+import os
+import json
+import asyncio
+import threading
+from models.modelo_knn import obtener_respuesta_knn, buscar_respuesta_exacta, obtener_respuestas_knn_lote
 from models.modelo_llm import obtener_cadena_rag
+from models.proveedores_llm import Circuito, LLMNoDisponible, LLM_PLAZO_SEGUNDOS
+from models.version_conocimiento import version_actual
+from models.proveedor_embeddings import embedding_consulta, aembedding_consulta, embeddings_consultas
+from logic.cache_semantico import registrar_hit
+from logic.vuelo_unico import VuelosEnCurso
+from models.normalizacion import normalizar_texto
+from models.shards import shard_de
+from models.metricas import medir, ACIERTOS_KNN
 
-# Tiempo mínimo entre reintentos de conexión al LLM (segundos)
-_MIN_SEGUNDOS_REINTENTO_LLM = 60
+# Espera tras un fallo al construir la cadena RAG (p. ej. Chroma caído) antes
+# de dejar pasar un nuevo intento. Los fallos del LLM en sí no tiran la
+# cadena: los maneja cada proveedor (ver models/proveedores_llm.py).
+_SEGUNDOS_REINTENTO_CADENA = 15
+
+# Espera máxima de una petición idéntica a la generación en curso: el plazo
+# del LLM más un margen para la recuperación en Chroma. Pasado ese tiempo la
+# seguidora genera por su cuenta (p. ej. si el líder es un stream que nadie lee).
+_SEGUNDOS_MAX_VUELO = LLM_PLAZO_SEGUNDOS + 10
+
+# Generaciones del LLM simultáneas en responder_lote
+LOTE_CONCURRENCIA_LLM = int(os.getenv("LOTE_CONCURRENCIA_LLM", "4"))
+
+# Fuentes de respuesta (se guardan en chat_logs como "modelo")
+FUENTE_KNN_BLOQUEADO  = "KNN (Bloqueado)"
+FUENTE_KNN_CACHE      = "KNN (Caché Semántico)"
+FUENTE_LLM            = "LLM (RAG Generativo)"
+FUENTE_LLM_COMPARTIDO = "LLM (Compartido)"   # misma generación que otra petición idéntica
+FUENTE_ERROR          = "Error"
+FUENTE_NULO           = "Nulo"
+
+MENSAJE_ERROR_LLM = "Ocurrió un error al generar la respuesta. Por favor, intenta de nuevo en unos momentos."
+MENSAJE_LLM_NO_DISPONIBLE = (
+    "El sistema de respuestas no está disponible en este momento. "
+    "Por favor, intenta de nuevo en unos minutos."
+)
+
+# Umbral de distancia coseno para aceptar una respuesta del caché KNN.
+# Se puede ajustar con logic/calibracion_umbral.py, que lo guarda en RUTA_CONFIG_SELECTOR.
+UMBRAL_DISTANCIA_POR_DEFECTO = 0.2
+RUTA_CONFIG_SELECTOR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'config_selector.json'
+)
+
+
+def leer_umbral_configurado() -> float:
+    """Umbral guardado por la calibración, o el valor por defecto si no hay configuración."""
+    try:
+        with open(RUTA_CONFIG_SELECTOR, 'r', encoding='utf-8') as f:
+            return float(json.load(f)["umbral_distancia"])
+    except FileNotFoundError:
+        return UMBRAL_DISTANCIA_POR_DEFECTO
+    except Exception as e:
+        print(f"⚠️ [Selector] Configuración inválida en {RUTA_CONFIG_SELECTOR}: {e}")
+        return UMBRAL_DISTANCIA_POR_DEFECTO
+
+
+def guardar_umbral_configurado(umbral: float, detalles: dict | None = None) -> None:
+    """Guarda el umbral (y datos de la calibración que lo eligió) para el próximo arranque."""
+    datos = {"umbral_distancia": round(float(umbral), 4), **(detalles or {})}
+    temporal = f"{RUTA_CONFIG_SELECTOR}.tmp"
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(datos, f, ensure_ascii=False, indent=2)
+    os.replace(temporal, RUTA_CONFIG_SELECTOR)
+
+
+def debe_aprenderse(fuente: str, bloqueado: bool) -> bool:
+    """
+    True si la respuesta es una generación nueva del LLM que debe guardarse
+    como FAQ. Las compartidas ya las guarda la petición líder.
+    """
+    return fuente == FUENTE_LLM and not bloqueado
 
 
 class SelectorDeModelo:
-    def __init__(self, usar_knn=True, usar_llm=True, umbral_distancia=0.2):
+    def __init__(self, usar_knn=True, usar_llm=True, umbral_distancia=None):
         self.usar_knn = usar_knn
         self.usar_llm = usar_llm
-        self.UMBRAL_DISTANCIA_COSINE = umbral_distancia
+        # None → el umbral calibrado (data/config_selector.json) o 0.2
+        self.UMBRAL_DISTANCIA_COSINE = (
+            leer_umbral_configurado() if umbral_distancia is None else umbral_distancia
+        )
         self.rag_chain = None
 
-        # Control de reintentos: 0.0 → el primer intento se hace en la primera consulta
-        self._ultimo_intento_llm = 0.0
+        # Control de reintentos de la conexión: tras un fallo, un intento cada _SEGUNDOS_REINTENTO_CADENA
+        self._circuito_cadena = Circuito(fallos_para_abrir=1, segundos_abierto=_SEGUNDOS_REINTENTO_CADENA)
+        # Peticiones simultáneas esperan a la conexión en curso en vez de recibir "Nulo"
+        self._lock_llm = threading.Lock()
+        # Versión de la base de conocimiento con la que se creó rag_chain
+        self._version_cadena = None
+        # Resultado del último intento de conexión (ver estado_cadena)
+        self._estado_cadena = "pendiente" if usar_llm else "desactivado"
+        # Generaciones del LLM en curso por pregunta (ver _clave_vuelo)
+        self._vuelos = VuelosEnCurso(segundos_max=_SEGUNDOS_MAX_VUELO)
 
     # ──────────────────────────────────────────────────────────
     # Inicialización diferida del LLM
@@ -23,38 +105,230 @@ class SelectorDeModelo:
 
     def _init_llm_si_necesario(self):
         """
-        Conecta con Chroma Cloud y crea la cadena RAG de forma diferida.
-        Solo reintenta si han pasado al menos _MIN_SEGUNDOS_REINTENTO_LLM
-        desde el último intento fallido, evitando bloquear cada petición.
+        Conecta con el vectorstore y crea la cadena RAG de forma diferida.
+        Tras un intento fallido, solo se reintenta cuando han pasado
+        _SEGUNDOS_REINTENTO_CADENA, evitando bloquear cada petición.
+
+        Si la base de conocimiento se reentrenó (en este u otro worker), la
+        colección se recreó: la cadena se vuelve a construir.
         """
-        if self.rag_chain is not None:
+        if self._cadena_vigente():
             return   # ya está listo
 
         if not self.usar_llm:
             return   # desactivado permanentemente por configuración
 
-        segundos_desde_ultimo = time.monotonic() - self._ultimo_intento_llm
-        if segundos_desde_ultimo < _MIN_SEGUNDOS_REINTENTO_LLM:
-            return   # aún en período de espera tras un fallo anterior
+        with self._lock_llm:
+            if self.rag_chain is not None:
+                return   # otra petición conectó mientras esperábamos
 
-        self._ultimo_intento_llm = time.monotonic()
+            if not self._circuito_cadena.permite():
+                return   # aún en período de espera tras un fallo anterior
 
-        try:
-            print("🔄 Intentando conectar con el LLM (RAG)...")
-            cadena = obtener_cadena_rag()
-            if cadena:
-                self.rag_chain = cadena
-                print("✅ Modelo LLM listo.")
-            else:
-                print("⚠️ LLM: colección Chroma no encontrada. Entrena el modelo desde el panel admin.")
-        except Exception as e:
-            print(f"❌ Error conectando con LLM: {e}. Se reintentará en {_MIN_SEGUNDOS_REINTENTO_LLM}s.")
+            try:
+                print("🔄 Intentando conectar con el LLM (RAG)...")
+                version = version_actual()
+                cadena = obtener_cadena_rag()
+                if cadena:
+                    self.rag_chain = cadena
+                    self._version_cadena = version
+                    self._circuito_cadena.exito()
+                    self._estado_cadena = "listo"
+                    print("✅ Modelo LLM listo.")
+                else:
+                    self._circuito_cadena.fallo()
+                    self._estado_cadena = "sin_entrenar"
+                    print("⚠️ LLM: colección Chroma no encontrada. Entrena el modelo desde el panel admin.")
+            except Exception as e:
+                self._circuito_cadena.fallo()
+                self._estado_cadena = "error"
+                print(f"❌ Error conectando con LLM: {e}. Se reintentará en {_SEGUNDOS_REINTENTO_CADENA}s.")
+
+    @property
+    def estado_cadena(self) -> str:
+        """
+        "listo", "pendiente" (sin intentos aún), "sin_entrenar" (no hay
+        colección en Chroma), "error" (falló la conexión) o "desactivado".
+        """
+        if self._estado_cadena == "listo" and self.rag_chain is None:
+            return "pendiente"   # invalidada: se reconstruye en la próxima consulta
+        return self._estado_cadena
+
+    def calentar(self):
+        """Construye la cadena RAG sin esperar a la primera consulta (ver logic/calentamiento.py)."""
+        self._init_llm_si_necesario()
+        return self.estado_cadena
+
+    def _cadena_vigente(self):
+        """True si hay cadena RAG y corresponde a la versión actual de la base de conocimiento."""
+        if self.rag_chain is None:
+            return False
+        if self._version_cadena == version_actual():
+            return True
+        print("🔄 Base de conocimiento reentrenada: se reconstruye la cadena RAG.")
+        self.rag_chain = None
+        return False
 
     # ──────────────────────────────────────────────────────────
     # Lógica principal de respuesta
     # ──────────────────────────────────────────────────────────
 
-    def responder(self, pregunta, historial="", forzar_llm=False):
+    def _consultar_cache(self, pregunta, forzar_llm=False, programa=""):
+        """
+        Paso 1 del selector: busca la pregunta en el caché FAQ (KNN).
+
+        Retorna (respuesta_knn, vector): respuesta_knn es la tupla
+        (respuesta, fuente, bloqueado) si el caché responde, o None; vector es
+        el embedding de la pregunta (None si no se calculó), para reutilizarlo en el RAG.
+        """
+        vector = None
+        if not self.usar_knn:
+            return None, vector
+
+        # El módulo KNN gestiona su propia inicialización diferida
+        resultado = buscar_respuesta_exacta(pregunta, programa)
+        if resultado is None:
+            try:
+                with medir("embedding"):
+                    vector = embedding_consulta(pregunta)
+                with medir("knn"):
+                    # La coincidencia exacta ya se probó arriba
+                    resultado = obtener_respuesta_knn(
+                        pregunta, vector=vector, programa=programa, probar_exacta=False
+                    )
+            except Exception as e:
+                print(f"[Selector] Error calculando embedding: {e}")
+                resultado = (None, 1.0, False, None)
+
+        return self._decidir_cache(resultado, forzar_llm), vector
+
+    async def _aconsultar_cache(self, pregunta, forzar_llm=False, programa=""):
+        """Versión async de _consultar_cache: el embedding usa el cliente async del proveedor."""
+        vector = None
+        if not self.usar_knn:
+            return None, vector
+
+        # En un hilo: si el KNN aún no está listo, la consulta puede reconstruirlo
+        resultado = await asyncio.to_thread(buscar_respuesta_exacta, pregunta, programa)
+        if resultado is None:
+            try:
+                with medir("embedding"):
+                    vector = await aembedding_consulta(pregunta)
+                with medir("knn"):
+                    # Solo la búsqueda (la exacta ya se probó), y fuera del event loop:
+                    # el producto de matrices no debe frenar las demás conversaciones
+                    resultado = await asyncio.to_thread(
+                        obtener_respuesta_knn, pregunta,
+                        vector=vector, programa=programa, probar_exacta=False,
+                    )
+            except Exception as e:
+                print(f"[Selector] Error calculando embedding: {e}")
+                resultado = (None, 1.0, False, None)
+
+        return self._decidir_cache(resultado, forzar_llm), vector
+
+    def _decidir_cache(self, resultado, forzar_llm, contar=True):
+        """
+        Aplica el umbral y las reglas de bloqueo a un resultado del KNN.
+        contar=False no registra el acierto (popularidad de la FAQ y métricas):
+        para lotes del panel, que no son tráfico de alumnos.
+        """
+        respuesta_knn, distancia, bloqueado, faq_id = resultado
+
+        if respuesta_knn and distancia <= self.UMBRAL_DISTANCIA_COSINE:
+            if bloqueado:
+                if contar:
+                    print(f"[Selector] FAQ BLOQUEADA activada (distancia={distancia:.4f})")
+                    registrar_hit(faq_id)
+                    ACIERTOS_KNN.incrementar("bloqueado")
+                return respuesta_knn, FUENTE_KNN_BLOQUEADO, True
+
+            if not forzar_llm:
+                if contar:
+                    print(f"[Selector] KNN caché activado (distancia={distancia:.4f})")
+                    registrar_hit(faq_id)
+                    ACIERTOS_KNN.incrementar("cache")
+                return respuesta_knn, FUENTE_KNN_CACHE, False
+
+        return None
+
+    def _invalidar_cadena(self, error):
+        if isinstance(error, LLMNoDisponible):
+            # Respaldo y cortacircuitos ya actuaron por proveedor: la cadena sigue sirviendo
+            print(f"[Selector] LLM no disponible: {error}")
+            return
+        print(f"[Selector] Error en RAG: {error}. Invalidando cadena para forzar reconexión.")
+        # Invalida la cadena para que el siguiente intento reconecte
+        self.rag_chain = None
+
+    # ──────────────────────────────────────────────────────────
+    # Coalescencia de preguntas idénticas en curso
+    # ──────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _clave_vuelo(pregunta, historial, forzar_llm, programa=""):
+        """
+        Clave para compartir una generación: solo preguntas sin historial
+        (la respuesta no depende de la conversación) y que no sean
+        regeneraciones (el usuario pidió explícitamente otra respuesta).
+        Incluye el shard: cada programa recupera de sus propios documentos.
+        """
+        clave = normalizar_texto(pregunta)
+        if forzar_llm or historial.strip() or not clave:
+            return None
+        return shard_de(programa), clave
+
+    @staticmethod
+    def _como_seguidor(resultado):
+        respuesta, fuente, bloqueado = resultado
+        if fuente == FUENTE_LLM:
+            print("[Selector] Respuesta compartida con una petición idéntica en curso.")
+            return respuesta, FUENTE_LLM_COMPARTIDO, bloqueado
+        return resultado
+
+    def _en_vuelo_unico(self, clave, generar):
+        """Ejecuta generar() una sola vez por clave entre peticiones simultáneas."""
+        if clave is None:
+            return generar()
+
+        futuro, es_lider = self._vuelos.unirse(clave)
+        if not es_lider:
+            resultado = self._vuelos.esperar(futuro)
+            if resultado is not None:
+                return self._como_seguidor(resultado)
+            return generar()   # el líder no terminó a tiempo
+
+        resultado = None
+        try:
+            resultado = generar()
+            return resultado
+        finally:
+            self._vuelos.terminar(clave, futuro, resultado)
+
+    async def _aen_vuelo_unico(self, clave, agenerar):
+        """Versión async de _en_vuelo_unico (agenerar es una función que retorna una corrutina)."""
+        if clave is None:
+            return await agenerar()
+
+        futuro, es_lider = self._vuelos.unirse(clave)
+        if not es_lider:
+            resultado = await self._vuelos.aesperar(futuro)
+            if resultado is not None:
+                return self._como_seguidor(resultado)
+            return await agenerar()
+
+        resultado = None
+        try:
+            resultado = await agenerar()
+            return resultado
+        finally:
+            self._vuelos.terminar(clave, futuro, resultado)
+
+    # ──────────────────────────────────────────────────────────
+    # Respuesta completa
+    # ──────────────────────────────────────────────────────────
+
+    def responder(self, pregunta, historial="", forzar_llm=False, programa=""):
         """
         Lógica híbrida de selección de modelo:
 
@@ -63,42 +337,355 @@ class SelectorDeModelo:
            - FAQ normal + distancia aceptable + no forzar_llm → devuelve desde caché.
         2. LLM RAG: se usa cuando KNN no aplica o se fuerza regeneración (inicialización diferida aquí).
 
+        Una pregunta idéntica a una FAQ (tras normalizar mayúsculas, acentos y
+        signos) se resuelve sin embeddings. Si no, la pregunta se embebe una
+        sola vez: el mismo vector sirve para el KNN y para la búsqueda del RAG.
+
+        Si otra petición con la misma pregunta (sin historial) ya está
+        generando, se espera su respuesta y se devuelve con FUENTE_LLM_COMPARTIDO.
+
         Retorna: (respuesta: str, fuente: str, bloqueado: bool)
         """
+        # 1. Intentar KNN
+        respuesta_knn, vector = self._consultar_cache(pregunta, forzar_llm, programa)
+        if respuesta_knn:
+            return respuesta_knn
 
-        # 1. Intentar KNN (el módulo gestiona su propia inicialización diferida)
-        if self.usar_knn:
-            respuesta_knn, distancia, bloqueado = obtener_respuesta_knn(pregunta)
+        # 2. LLM RAG (una sola generación por pregunta idéntica en curso)
+        return self._en_vuelo_unico(
+            self._clave_vuelo(pregunta, historial, forzar_llm, programa),
+            lambda: self._generar(pregunta, historial, vector, programa),
+        )
 
-            if respuesta_knn and distancia <= self.UMBRAL_DISTANCIA_COSINE:
-                if bloqueado:
-                    print(f"[Selector] FAQ BLOQUEADA activada (distancia={distancia:.4f})")
-                    return respuesta_knn, "KNN (Bloqueado)", True
+    def _generar(self, pregunta, historial, vector, programa=""):
+        # Inicializar si aún no está listo
+        self._init_llm_si_necesario()
 
-                if not forzar_llm:
-                    print(f"[Selector] KNN caché activado (distancia={distancia:.4f})")
-                    return respuesta_knn, "KNN (Caché Semántico)", False
+        cadena = self.rag_chain   # referencia local: otro hilo puede invalidarla
+        if cadena:
+            try:
+                respuesta_llm = cadena.invoke({
+                    "question":  pregunta,
+                    "history":   historial,
+                    "embedding": vector,
+                    "programa":  programa,
+                })
+                return respuesta_llm, FUENTE_LLM, False
+            except Exception as e:
+                self._invalidar_cadena(e)
+                return MENSAJE_ERROR_LLM, FUENTE_ERROR, False
+
+        return MENSAJE_LLM_NO_DISPONIBLE, FUENTE_NULO, False
+
+    # ──────────────────────────────────────────────────────────
+    # Respuesta por fragmentos (streaming)
+    # ──────────────────────────────────────────────────────────
+
+    def responder_stream(self, pregunta, historial="", forzar_llm=False, programa=""):
+        """
+        Igual que responder(), pero la respuesta del LLM se entrega por
+        fragmentos a medida que se genera (rag_chain.stream).
+
+        Retorna una RespuestaEnStream. Si responde el caché, no hay LLM o la
+        respuesta se comparte con otra petición idéntica en curso, en_stream
+        es False y la respuesta completa ya está disponible.
+        """
+        respuesta_knn, vector = self._consultar_cache(pregunta, forzar_llm, programa)
+        if respuesta_knn:
+            return RespuestaEnStream.completa(*respuesta_knn)
+
+        clave = self._clave_vuelo(pregunta, historial, forzar_llm, programa)
+        futuro = None
+        if clave is not None:
+            futuro, es_lider = self._vuelos.unirse(clave)
+            if not es_lider:
+                compartido = self._vuelos.esperar(futuro)
+                if compartido is not None:
+                    return RespuestaEnStream.completa(*self._como_seguidor(compartido))
+                futuro = None   # el líder no terminó: se genera sin coalescencia
 
-        # 2. LLM RAG — inicializar si aún no está listo
         self._init_llm_si_necesario()
+        cadena = self.rag_chain
+        if not cadena:
+            self._terminar_vuelo(clave, futuro, (MENSAJE_LLM_NO_DISPONIBLE, FUENTE_NULO, False))
+            return RespuestaEnStream.completa(MENSAJE_LLM_NO_DISPONIBLE, FUENTE_NULO, False)
+
+        resultado = RespuestaEnStream(FUENTE_LLM, False)
 
-        if self.rag_chain:
+        def fragmentos():
+            completo = False
             try:
-                respuesta_llm = self.rag_chain.invoke({
-                    "question": pregunta,
-                    "history":  historial
+                yield from cadena.stream({
+                    "question":  pregunta,
+                    "history":   historial,
+                    "embedding": vector,
+                    "programa":  programa,
                 })
-                return respuesta_llm, "LLM (RAG Generativo)", False
+                completo = True
             except Exception as e:
-                print(f"[Selector] Error en RAG: {e}. Invalidando cadena para forzar reconexión.")
-                # Invalida la cadena para que el siguiente intento reconecte
-                self.rag_chain = None
-                self._ultimo_intento_llm = 0.0
-                return "Ocurrió un error al generar la respuesta. Por favor, intenta de nuevo en unos momentos.", "Error", False
-
-        return (
-            "El sistema de respuestas no está disponible en este momento. "
-            "Por favor, intenta de nuevo en unos minutos.",
-            "Nulo",
-            False
+                self._invalidar_cadena(e)
+                resultado.fuente = FUENTE_ERROR
+                # Lo ya enviado se descarta en el cliente al recibir el error
+                resultado.partes.clear()
+                resultado.partes.append(MENSAJE_ERROR_LLM)
+                completo = True
+                yield MENSAJE_ERROR_LLM
+            finally:
+                # Si el cliente se desconectó a mitad, las seguidoras generan por su cuenta
+                self._terminar_vuelo(clave, futuro, resultado.como_tupla() if completo else None)
+
+        resultado.fragmentos = fragmentos()
+        # Si la respuesta se cierra sin haberse leído, el finally de arriba no corre
+        resultado.al_cerrar = lambda: self._terminar_vuelo(clave, futuro, None)
+        return resultado
+
+    def _terminar_vuelo(self, clave, futuro, resultado):
+        if futuro is not None:
+            self._vuelos.terminar(clave, futuro, resultado)
+
+    # ──────────────────────────────────────────────────────────
+    # Versiones async (ruta ASGI, ver asgi.py)
+    # ──────────────────────────────────────────────────────────
+
+    async def _ainit_llm_si_necesario(self):
+        # La conexión inicial con Chroma es síncrona: se hace en un hilo
+        if not self._cadena_vigente():
+            await asyncio.to_thread(self._init_llm_si_necesario)
+
+    async def aresponder(self, pregunta, historial="", forzar_llm=False, programa=""):
+        """
+        Igual que responder(), sin bloquear el event loop: embedding,
+        búsqueda en Chroma y llamada al LLM usan sus clientes async
+        (rag_chain.ainvoke), así que un proceso atiende muchas
+        conversaciones en espera a la vez.
+
+        Retorna: (respuesta: str, fuente: str, bloqueado: bool)
+        """
+        respuesta_knn, vector = await self._aconsultar_cache(pregunta, forzar_llm, programa)
+        if respuesta_knn:
+            return respuesta_knn
+
+        return await self._aen_vuelo_unico(
+            self._clave_vuelo(pregunta, historial, forzar_llm, programa),
+            lambda: self._agenerar(pregunta, historial, vector, programa),
         )
+
+    async def _agenerar(self, pregunta, historial, vector, programa=""):
+        await self._ainit_llm_si_necesario()
+
+        cadena = self.rag_chain
+        if cadena:
+            try:
+                respuesta_llm = await cadena.ainvoke({
+                    "question":  pregunta,
+                    "history":   historial,
+                    "embedding": vector,
+                    "programa":  programa,
+                })
+                return respuesta_llm, FUENTE_LLM, False
+            except Exception as e:
+                self._invalidar_cadena(e)
+                return MENSAJE_ERROR_LLM, FUENTE_ERROR, False
+
+        return MENSAJE_LLM_NO_DISPONIBLE, FUENTE_NULO, False
+
+    async def aresponder_stream(self, pregunta, historial="", forzar_llm=False, programa=""):
+        """Versión async de responder_stream(): se itera con `async for` (rag_chain.astream)."""
+        respuesta_knn, vector = await self._aconsultar_cache(pregunta, forzar_llm, programa)
+        if respuesta_knn:
+            return RespuestaEnStream.completa(*respuesta_knn)
+
+        clave = self._clave_vuelo(pregunta, historial, forzar_llm, programa)
+        futuro = None
+        if clave is not None:
+            futuro, es_lider = self._vuelos.unirse(clave)
+            if not es_lider:
+                compartido = await self._vuelos.aesperar(futuro)
+                if compartido is not None:
+                    return RespuestaEnStream.completa(*self._como_seguidor(compartido))
+                futuro = None
+
+        await self._ainit_llm_si_necesario()
+        cadena = self.rag_chain
+        if not cadena:
+            self._terminar_vuelo(clave, futuro, (MENSAJE_LLM_NO_DISPONIBLE, FUENTE_NULO, False))
+            return RespuestaEnStream.completa(MENSAJE_LLM_NO_DISPONIBLE, FUENTE_NULO, False)
+
+        resultado = RespuestaEnStream(FUENTE_LLM, False)
+
+        async def fragmentos():
+            completo = False
+            try:
+                async for fragmento in cadena.astream({
+                    "question":  pregunta,
+                    "history":   historial,
+                    "embedding": vector,
+                    "programa":  programa,
+                }):
+                    yield fragmento
+                completo = True
+            except Exception as e:
+                self._invalidar_cadena(e)
+                resultado.fuente = FUENTE_ERROR
+                resultado.partes.clear()
+                resultado.partes.append(MENSAJE_ERROR_LLM)
+                completo = True
+                yield MENSAJE_ERROR_LLM
+            finally:
+                self._terminar_vuelo(clave, futuro, resultado.como_tupla() if completo else None)
+
+        resultado.fragmentos = fragmentos()
+        resultado.al_cerrar = lambda: self._terminar_vuelo(clave, futuro, None)
+        return resultado
+
+    # ──────────────────────────────────────────────────────────
+    # Respuesta por lotes (pre-responder listas de preguntas)
+    # ──────────────────────────────────────────────────────────
+
+    def responder_lote(self, preguntas, programa="", max_concurrencia=LOTE_CONCURRENCIA_LLM):
+        """
+        Responde una lista de preguntas sin historial, como N llamadas a
+        responder() pero:
+
+        1. Las preguntas repetidas (tras normalizar) se resuelven una sola vez.
+        2. Las coincidencias exactas con una FAQ no necesitan embedding; el
+           resto se embebe en una sola llamada al proveedor y se busca en el
+           KNN con un único producto de matrices.
+        3. Las que el caché no resuelve van al LLM con rag_chain.batch, como
+           mucho max_concurrencia a la vez (reutilizando el vector ya calculado).
+
+        Los aciertos del caché no cuentan como popularidad de la FAQ.
+
+        Retorna una lista de (respuesta, fuente, bloqueado), en el orden de `preguntas`.
+        """
+        unicas = {}   # pregunta normalizada → primera forma en que aparece
+        for pregunta in preguntas:
+            unicas.setdefault(normalizar_texto(pregunta), pregunta)
+        resultados = {}
+        pendientes = list(unicas.items())
+
+        # 1. Caché FAQ: exactas, y por lote de vectores las demás
+        vectores = {}
+        if self.usar_knn and pendientes:
+            sin_exacta = []
+            for clave, pregunta in pendientes:
+                exacta = buscar_respuesta_exacta(pregunta, programa)
+                decision = self._decidir_cache(exacta, False, contar=False) if exacta else None
+                if decision:
+                    resultados[clave] = decision
+                else:
+                    sin_exacta.append((clave, pregunta))
+
+            if sin_exacta:
+                textos = [pregunta for _, pregunta in sin_exacta]
+                try:
+                    lista = embeddings_consultas(textos)
+                    knn = obtener_respuestas_knn_lote(textos, vectores=lista, programa=programa)
+                except Exception as e:
+                    print(f"[Selector] Error en el lote de embeddings: {e}")
+                    lista, knn = [None] * len(textos), [None] * len(textos)
+                for (clave, pregunta), vector, resultado in zip(sin_exacta, lista, knn):
+                    vectores[clave] = vector
+                    decision = self._decidir_cache(resultado, False, contar=False) if resultado else None
+                    if decision:
+                        resultados[clave] = decision
+
+            pendientes = [(c, p) for c, p in pendientes if c not in resultados]
+            print(f"[Selector] Lote: {len(unicas) - len(pendientes)} de {len(unicas)} "
+                  f"preguntas distintas resueltas por el caché.")
+
+        # 2. LLM para el resto, con concurrencia acotada
+        if pendientes:
+            self._init_llm_si_necesario()
+            cadena = self.rag_chain
+            if not cadena:
+                for clave, _ in pendientes:
+                    resultados[clave] = (MENSAJE_LLM_NO_DISPONIBLE, FUENTE_NULO, False)
+            else:
+                respuestas = cadena.batch(
+                    [
+                        {
+                            "question":  pregunta,
+                            "history":   "",
+                            "embedding": vectores.get(clave),
+                            "programa":  programa,
+                        }
+                        for clave, pregunta in pendientes
+                    ],
+                    config={"max_concurrency": max(1, max_concurrencia)},
+                    return_exceptions=True,
+                )
+                errores = [r for r in respuestas if isinstance(r, Exception)]
+                if errores:
+                    self._invalidar_cadena(errores[0])
+                    print(f"[Selector] Lote: {len(errores)} de {len(respuestas)} generaciones fallaron.")
+                for (clave, _), respuesta in zip(pendientes, respuestas):
+                    resultados[clave] = (
+                        (MENSAJE_ERROR_LLM, FUENTE_ERROR, False) if isinstance(respuesta, Exception)
+                        else (respuesta, FUENTE_LLM, False)
+                    )
+
+        return [resultados[normalizar_texto(pregunta)] for pregunta in preguntas]
+
+
+class RespuestaEnStream:
+    """
+    Respuesta del selector entregada por fragmentos.
+
+    Iterar sobre ella produce los fragmentos de texto y los acumula; al
+    terminar, `respuesta` contiene el texto completo. `fuente` puede cambiar
+    a "Error" si la generación falla a mitad del stream.
+
+    Quien la sirve debe llamar a cerrar() / acerrar() cuando termina la
+    respuesta HTTP: si nunca se iteró, libera la generación compartida para
+    que las peticiones idénticas no esperen a un stream que nadie lee.
+    """
+
+    def __init__(self, fuente, bloqueado, fragmentos=(), en_stream=True):
+        self.fuente = fuente
+        self.bloqueado = bloqueado
+        self.fragmentos = fragmentos
+        self.en_stream = en_stream
+        self.partes = []
+        self.al_cerrar = None
+
+    @classmethod
+    def completa(cls, respuesta, fuente, bloqueado):
+        resultado = cls(fuente, bloqueado, en_stream=False)
+        resultado.partes.append(respuesta)
+        return resultado
+
+    def __iter__(self):
+        for fragmento in self.fragmentos:
+            self.partes.append(fragmento)
+            yield fragmento
+
+    async def __aiter__(self):
+        # Para aresponder_stream (fragmentos es un generador async)
+        async for fragmento in self.fragmentos:
+            self.partes.append(fragmento)
+            yield fragmento
+
+    def cerrar(self):
+        """Cierra el generador de fragmentos y libera la clave de vuelo (idempotente)."""
+        cerrar = getattr(self.fragmentos, "close", None)
+        if cerrar is not None:
+            cerrar()
+        if self.al_cerrar is not None:
+            self.al_cerrar()
+
+    async def acerrar(self):
+        """Versión async de cerrar() (generador async de aresponder_stream)."""
+        cerrar = getattr(self.fragmentos, "aclose", None)
+        if cerrar is not None:
+            await cerrar()
+        if self.al_cerrar is not None:
+            self.al_cerrar()
+
+    @property
+    def respuesta(self) -> str:
+        return "".join(self.partes)
+
+    def como_tupla(self):
+        """(respuesta, fuente, bloqueado), como responder()."""
+        return self.respuesta, self.fuente, self.bloqueado
@@ -0,0 +1,113 @@
+# --- servidor_llm_falso.py ---
+"""
+Servidor falso compatible con la API de chat de OpenAI, para probar la capa
+de proveedores del LLM (models/proveedores_llm.py) sin red ni cuota.
+
+Responde a POST /v1/chat/completions (con y sin "stream") con un texto fijo
+que incluye el inicio de la pregunta, tras una latencia configurable, y falla
+a propósito una fracción de las peticiones.
+
+Uso:
+    python -m logic.servidor_llm_falso [--puerto 8089] [--latencia 0.5]
+                                       [--variacion 0.2] [--tasa-error 0.1]
+
+y en .env, p. ej. con el servidor falso como respaldo de Groq:
+    LLM_PROVEEDORES=groq:openai/gpt-oss-120b,openai:falso@http://localhost:8089/v1
+"""
+import argparse
+import json
+import random
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class ManejadorLLMFalso(BaseHTTPRequestHandler):
+    latencia = 0.5
+    variacion = 0.0
+    tasa_error = 0.0
+
+    def _json(self, estado, cuerpo):
+        datos = json.dumps(cuerpo).encode("utf-8")
+        self.send_response(estado)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._json(200, {"object": "list", "data": [{"id": "falso", "object": "model"}]})
+        else:
+            self._json(404, {"error": {"message": "no encontrado"}})
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._json(404, {"error": {"message": "no encontrado"}})
+            return
+
+        peticion = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        time.sleep(max(0.0, random.gauss(self.latencia, self.variacion)))
+
+        if random.random() < self.tasa_error:
+            self._json(503, {"error": {"message": "error simulado", "type": "server_error"}})
+            return
+
+        mensajes = peticion.get("messages") or [{}]
+        pregunta = str(mensajes[-1].get("content", ""))[-80:].strip()
+        texto = f"Respuesta de prueba del servidor falso. Última parte del prompt: {pregunta}"
+        modelo = peticion.get("model", "falso")
+        base = {"id": f"chatcmpl-{uuid.uuid4().hex}", "created": int(time.time()), "model": modelo}
+
+        if not peticion.get("stream"):
+            self._json(200, {
+                **base,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": texto}}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        palabras = texto.split(" ")
+        for i, palabra in enumerate(palabras):
+            delta = {"role": "assistant", "content": palabra} if i == 0 else {"content": " " + palabra}
+            self._evento({**base, "object": "chat.completion.chunk",
+                          "choices": [{"index": 0, "delta": delta, "finish_reason": None}]})
+            time.sleep(0.01)
+        self._evento({**base, "object": "chat.completion.chunk",
+                      "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _evento(self, datos):
+        self.wfile.write(f"data: {json.dumps(datos)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def log_message(self, formato, *args):
+        print(f"[LLM falso] {self.address_string()} {formato % args}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor falso compatible con la API de chat de OpenAI.")
+    parser.add_argument("--puerto", type=int, default=8089)
+    parser.add_argument("--latencia", type=float, default=0.5, help="segundos por respuesta (media)")
+    parser.add_argument("--variacion", type=float, default=0.2, help="desviación estándar de la latencia")
+    parser.add_argument("--tasa-error", type=float, default=0.0, help="fracción de peticiones que responden 503")
+    args = parser.parse_args()
+
+    ManejadorLLMFalso.latencia = args.latencia
+    ManejadorLLMFalso.variacion = args.variacion
+    ManejadorLLMFalso.tasa_error = args.tasa_error
+
+    servidor = ThreadingHTTPServer(("127.0.0.1", args.puerto), ManejadorLLMFalso)
+    print(f"🧪 LLM falso en http://127.0.0.1:{args.puerto}/v1 "
+          f"(latencia {args.latencia}s ± {args.variacion}s, errores {args.tasa_error:.0%})")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
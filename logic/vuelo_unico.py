@@ -0,0 +1,71 @@
+# --- vuelo_unico.py ---
+"""
+Coalescencia de peticiones idénticas en curso ("single flight").
+
+Cuando sale un aviso, muchos alumnos hacen la misma pregunta en segundos.
+La primera petición (líder) genera la respuesta; las que llegan con la misma
+clave mientras tanto (seguidoras) esperan ese resultado en vez de lanzar su
+propia llamada al LLM.
+
+El resultado se publica en un concurrent.futures.Future, así que pueden
+esperarlo tanto hilos (Flask) como corrutinas (ruta ASGI) sin ocupar hilos.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError, TimeoutError as TiempoAgotado
+
+# Una seguridad: si el líder nunca termina (p. ej. un stream que nadie
+# consumió), pasado este tiempo la clave se considera libre y las seguidoras
+# dejan de esperar. El selector lo ajusta al plazo del LLM.
+SEGUNDOS_MAX_VUELO = 120
+
+
+class VuelosEnCurso:
+    def __init__(self, segundos_max=SEGUNDOS_MAX_VUELO):
+        self.segundos_max = segundos_max
+        self._lock = threading.Lock()
+        self._vuelos = {}   # clave → (Future, inicio)
+
+    def unirse(self, clave):
+        """
+        Retorna (futuro, es_lider). El líder DEBE llamar a terminar() con el
+        mismo futuro; las seguidoras esperan con esperar() / aesperar().
+        """
+        with self._lock:
+            vuelo = self._vuelos.get(clave)
+            if vuelo is not None and time.monotonic() - vuelo[1] < self.segundos_max:
+                return vuelo[0], False
+            futuro = Future()
+            self._vuelos[clave] = (futuro, time.monotonic())
+            return futuro, True
+
+    def terminar(self, clave, futuro, resultado):
+        """Publica el resultado del líder (None = sin resultado útil) y libera la clave."""
+        with self._lock:
+            vuelo = self._vuelos.get(clave)
+            if vuelo is not None and vuelo[0] is futuro:
+                del self._vuelos[clave]
+        # Puede llamarse dos veces (el finally del líder y el cierre del stream):
+        # el segundo set_result encuentra el futuro ya resuelto
+        try:
+            futuro.set_result(resultado)
+        except InvalidStateError:
+            pass
+
+    def esperar(self, futuro):
+        """Resultado del líder, o None si no llegó a tiempo."""
+        try:
+            return futuro.result(timeout=self.segundos_max)
+        except TiempoAgotado:
+            return None
+
+    async def aesperar(self, futuro):
+        """Versión async de esperar(): no bloquea el event loop ni ocupa un hilo."""
+        try:
+            # shield: al agotar el tiempo no se cancela el futuro compartido
+            return await asyncio.wait_for(
+                asyncio.shield(asyncio.wrap_future(futuro)), timeout=self.segundos_max
+            )
+        except asyncio.TimeoutError:
+            return None
@@ -0,0 +1,77 @@
+# models/almacen_embeddings.py
+"""
+Almacén persistente de embeddings de preguntas FAQ.
+
+Cada vector se guarda en la colección `faq_embeddings` de MongoDB bajo una
+clave de contenido: el hash del texto normalizado (y del modelo que lo generó).
+Así un reinicio, un redeploy o un reintento tras un fallo recuperan los
+vectores sin llamar a la API de embeddings; solo se calculan los de preguntas
+que nunca se habían visto.
+"""
+import os
+import sys
+import numpy as np
+
+# --- CONFIGURACIÓN DE RUTAS ---
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from database import get_faq_embeddings, upsert_faq_embeddings
+from models.normalizacion import clave_texto
+
+
+def _serializar(vector) -> bytes:
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+
+def _deserializar(datos: bytes) -> np.ndarray:
+    return np.frombuffer(datos, dtype=np.float32)
+
+
+def obtener_embeddings(textos: list[str], embedder, modelo: str) -> np.ndarray:
+    """
+    Retorna una matriz (len(textos), dim) con el embedding de cada texto.
+
+    Los vectores ya conocidos se leen de MongoDB; los faltantes se calculan
+    en una sola llamada a embedder.embed_documents y se guardan para la
+    próxima vez. Si MongoDB falla, se calcula todo sin persistir.
+    """
+    if not textos:
+        return np.empty((0, 0), dtype=np.float32)
+
+    claves = [clave_texto(t, modelo) for t in textos]
+
+    try:
+        guardados = get_faq_embeddings(list(set(claves)))
+    except Exception as e:
+        print(f"⚠️ [Embeddings] No se pudo leer el almacén persistente: {e}")
+        guardados = None
+
+    if guardados is None:
+        return np.asarray(embedder.embed_documents(textos), dtype=np.float32)
+
+    # Textos distintos pueden compartir clave (solo difieren en acentos o signos):
+    # se calcula un embedding por clave, no por texto.
+    faltantes = {}
+    for clave, texto in zip(claves, textos):
+        if clave not in guardados and clave not in faltantes:
+            faltantes[clave] = texto
+
+    nuevos = {}
+    if faltantes:
+        vectores = embedder.embed_documents(list(faltantes.values()))
+        nuevos = {clave: _serializar(v) for clave, v in zip(faltantes, vectores)}
+        try:
+            upsert_faq_embeddings(nuevos)
+        except Exception as e:
+            print(f"⚠️ [Embeddings] No se pudieron persistir {len(nuevos)} vectores: {e}")
+
+    print(
+        f"[Embeddings] {len(set(claves)) - len(faltantes)} reutilizados, "
+        f"{len(faltantes)} calculados por el proveedor."
+    )
+
+    guardados.update(nuevos)
+    return np.vstack([_deserializar(guardados[c]) for c in claves])
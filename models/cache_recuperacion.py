@@ -0,0 +1,64 @@
+# models/cache_recuperacion.py
+"""
+Caché de recuperación del RAG: fragmentos devueltos por la búsqueda MMR en
+el vectorstore, por shard (ver models/shards.py), pregunta normalizada y
+versión de la base de conocimiento.
+
+Las preguntas repetidas y las regeneraciones (mode == 'regenerate') reutilizan
+los mismos fragmentos sin otro viaje al vectorstore. Al reentrenar cambia la
+versión (ver models/version_conocimiento.py) y todo el caché se descarta.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from models.normalizacion import normalizar_texto
+from models.version_conocimiento import version_actual
+from models.shards import SHARD_GENERAL
+
+# Número máximo de conjuntos de fragmentos guardados (0 = caché desactivado)
+RAG_CACHE_RECUPERACION = int(os.getenv("RAG_CACHE_RECUPERACION", "256"))
+
+_entradas = OrderedDict()   # (shard, pregunta normalizada) → lista de Document
+_version_entradas = None    # versión de la base de conocimiento de _entradas
+_lock = threading.Lock()
+
+
+def _sincronizar_version():
+    """Vacía el caché si la base de conocimiento cambió. Requiere _lock."""
+    global _version_entradas
+    version = version_actual()
+    if version != _version_entradas:
+        _entradas.clear()
+        _version_entradas = version
+    return version
+
+
+def obtener_fragmentos(pregunta: str, shard: str = SHARD_GENERAL):
+    """Fragmentos guardados para la pregunta, o None si no están en caché."""
+    if RAG_CACHE_RECUPERACION <= 0:
+        return None
+    clave = (shard, normalizar_texto(pregunta))
+    with _lock:
+        _sincronizar_version()
+        fragmentos = _entradas.get(clave)
+        if fragmentos is not None:
+            _entradas.move_to_end(clave)
+        return fragmentos
+
+
+def guardar_fragmentos(pregunta: str, fragmentos, version: int, shard: str = SHARD_GENERAL) -> None:
+    """
+    Guarda los fragmentos recuperados. `version` es la versión leída ANTES de
+    la búsqueda: si hubo un reentrenamiento mientras tanto, no se guardan.
+    """
+    if RAG_CACHE_RECUPERACION <= 0:
+        return
+    clave = (shard, normalizar_texto(pregunta))
+    with _lock:
+        if _sincronizar_version() != version:
+            return
+        _entradas[clave] = list(fragmentos)
+        _entradas.move_to_end(clave)
+        while len(_entradas) > RAG_CACHE_RECUPERACION:
+            _entradas.popitem(last=False)
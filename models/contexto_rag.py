@@ -0,0 +1,123 @@
+# models/contexto_rag.py
+"""
+Empaquetado del contexto del RAG con presupuesto de tokens.
+
+Entre el recuperador y el prompt: recibe los fragmentos en el orden del
+recuperador (MMR, de mayor a menor relevancia marginal) y arma el bloque
+{context} sin exceder RAG_PRESUPUESTO_TOKENS:
+
+1. Quita fragmentos casi idénticos a uno ya elegido (p. ej. el mismo artículo
+   en dos versiones del Estatuto), comparando conjuntos de 5-gramas de palabras.
+2. Quita frases ya incluidas por otro fragmento (el solapamiento de
+   CHUNK_OVERLAP entre fragmentos consecutivos del mismo documento).
+3. Agrega fragmentos en orden hasta agotar el presupuesto; el último que no
+   cabe completo se recorta en un límite de frase si aún queda espacio útil.
+
+Los tokens se estiman por caracteres (RAG_CARACTERES_POR_TOKEN), sin
+depender del tokenizador del proveedor.
+"""
+import os
+import re
+
+from models.normalizacion import normalizar_texto
+
+# --- CONFIGURACIÓN ---
+RAG_PRESUPUESTO_TOKENS = int(os.getenv("RAG_PRESUPUESTO_TOKENS", "1500"))
+RAG_CARACTERES_POR_TOKEN = float(os.getenv("RAG_CARACTERES_POR_TOKEN", "4"))
+
+# Similitud de Jaccard (5-gramas de palabras) a partir de la cual dos fragmentos son duplicados
+_SIMILITUD_DUPLICADO = 0.8
+_N_GRAMA = 5
+# No vale la pena recortar un fragmento para dejar menos de esto
+_MIN_TOKENS_RECORTE = 80
+
+_SEPARADOR = "\n\n---\n\n"
+# Separa frases conservando el separador (grupo de captura) para rearmar el texto
+_FRASES = re.compile(r'((?<=[.!?;:])\s+|\n+)')
+# Frases más cortas que esto (normalizadas) se dejan aunque se repitan: "Artículo 5."
+_MIN_CARACTERES_FRASE = 20
+
+
+def estimar_tokens(texto: str) -> int:
+    return int(len(texto) / RAG_CARACTERES_POR_TOKEN) + 1
+
+
+def _n_gramas(texto: str) -> set:
+    palabras = normalizar_texto(texto).split()
+    if len(palabras) < _N_GRAMA:
+        return {" ".join(palabras)} if palabras else set()
+    return {" ".join(palabras[i:i + _N_GRAMA]) for i in range(len(palabras) - _N_GRAMA + 1)}
+
+
+def _jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _recortar_a(texto: str, max_tokens: int) -> str:
+    """Corta el texto en el último fin de frase que cabe en max_tokens."""
+    max_caracteres = int(max_tokens * RAG_CARACTERES_POR_TOKEN)
+    if len(texto) <= max_caracteres:
+        return texto
+    corte = texto[:max_caracteres]
+    fin = max(corte.rfind(". "), corte.rfind(".\n"), corte.rfind("\n"))
+    return (corte[:fin + 1] if fin > max_caracteres // 2 else corte).rstrip() + " [...]"
+
+
+def _fuente(doc) -> str:
+    return doc.metadata.get('fuente', doc.metadata.get('source', 'documento'))
+
+
+def _sin_frases_repetidas(texto: str, frases_vistas: set) -> str:
+    """Quita las frases que ya aportó otro fragmento y registra las nuevas en frases_vistas."""
+    partes = _FRASES.split(texto)
+    resultado = []
+    # partes alterna [frase, separador, frase, separador, ..., frase]
+    for i in range(0, len(partes), 2):
+        frase = partes[i]
+        separador = partes[i + 1] if i + 1 < len(partes) else ""
+        clave = normalizar_texto(frase)
+        if len(clave) >= _MIN_CARACTERES_FRASE:
+            if clave in frases_vistas:
+                continue
+            frases_vistas.add(clave)
+        resultado.append(frase + separador)
+    return "".join(resultado).strip()
+
+
+def empaquetar_contexto(docs, presupuesto_tokens: int = None) -> str:
+    """Texto para {context}: fragmentos sin duplicados ni solapamientos, dentro del presupuesto."""
+    presupuesto = RAG_PRESUPUESTO_TOKENS if presupuesto_tokens is None else presupuesto_tokens
+
+    bloques = []
+    gramas_elegidos = []
+    frases_vistas = set()
+    usados = 0
+
+    for doc in docs:
+        gramas = _n_gramas(doc.page_content)
+        if any(_jaccard(gramas, g) >= _SIMILITUD_DUPLICADO for g in gramas_elegidos):
+            continue
+
+        texto = _sin_frases_repetidas(doc.page_content, frases_vistas)
+        if not texto:
+            continue
+
+        encabezado = f"[Fuente: {_fuente(doc)}]\n"
+        costo = estimar_tokens(encabezado + texto + _SEPARADOR)
+        if usados + costo > presupuesto:
+            restante = presupuesto - usados - estimar_tokens(encabezado + _SEPARADOR)
+            if restante >= _MIN_TOKENS_RECORTE:
+                texto = _recortar_a(texto, restante)
+                bloques.append(encabezado + texto)
+                usados += estimar_tokens(encabezado + texto + _SEPARADOR)
+            break
+
+        bloques.append(encabezado + texto)
+        gramas_elegidos.append(gramas)
+        usados += costo
+
+    print(f"[RAG] Contexto: {len(bloques)}/{len(docs)} fragmentos, ~{usados} tokens "
+          f"(presupuesto {presupuesto}).")
+    return _SEPARADOR.join(bloques)
@@ -0,0 +1,231 @@
+# models/indice_lexico.py
+"""
+Índice léxico BM25 en memoria sobre los mismos fragmentos que el vectorstore.
+
+Los reglamentos están llenos de términos exactos (números de artículo,
+nombres de cuotas del tabulador, nombres de trámites) que la búsqueda por
+embeddings recupera mal. El entrenamiento (data/admin_db.py) guarda los
+fragmentos en RUTA_INDICE_LEXICO y cada worker construye aquí un índice
+invertido BM25; la recuperación del RAG (models/modelo_llm.py) lo combina con
+la búsqueda vectorial por Reciprocal Rank Fusion y, si se activa
+RAG_LEXICO_CONTUNDENTE y hay una coincidencia léxica contundente, responde sin
+consultar el vectorstore.
+
+Como models/version_conocimiento.py, el archivo se vuelve a leer solo cuando
+cambia su fecha de modificación, así que un reentrenamiento llega a todos los
+workers sin coordinación adicional. Hay un archivo por shard (ver models/shards.py).
+"""
+import os
+import json
+import math
+import threading
+from collections import Counter, defaultdict
+
+from langchain_core.documents import Document
+
+from models.normalizacion import normalizar_texto
+from models.shards import SHARD_GENERAL, sufijo
+
+current_dir  = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+
+# --- CONFIGURACIÓN ---
+RUTA_INDICE_LEXICO = os.path.join(project_root, 'data', 'indice_lexico.json')
+# Fragmentos léxicos que entran a la fusión
+RAG_LEXICO_K = int(os.getenv("RAG_LEXICO_K", "10"))
+# Puntaje relativo (0-1, ver IndiceBM25.buscar) a partir del cual el mejor resultado
+# léxico basta y se omite la búsqueda vectorial (> 1 = nunca, el valor por defecto:
+# el atajo responde solo con fragmentos BM25 y cache_recuperacion los memoriza)
+RAG_LEXICO_CONTUNDENTE = float(os.getenv("RAG_LEXICO_CONTUNDENTE", "1.1"))
+# Términos distintos de la consulta que debe contener el mejor fragmento para ser
+# contundente: con uno o dos términos el puntaje relativo llega a 1.0 con facilidad
+RAG_LEXICO_MIN_TERMINOS = int(os.getenv("RAG_LEXICO_MIN_TERMINOS", "3"))
+
+# Parámetros clásicos de BM25
+_K1 = 1.5
+_B = 0.75
+# Constante de Reciprocal Rank Fusion (Cormack et al.)
+_K_RRF = 60
+# El mejor resultado debe superar al segundo por este factor para ser contundente
+_MARGEN_CONTUNDENTE = 1.3
+
+_PALABRAS_VACIAS = frozenset("""
+a al algo ante con como cual cuales cuando de del donde durante el ella ellas ellos en entre es esa
+ese eso esta este esto estos estas fue ha hay la las le les lo los mas me mi mis muy no nos o para
+pero por que quien se ser si sin sobre son su sus te tiene tu un una uno unos unas y ya yo
+puedo debo hacer hago quiero necesito saber dice dicen significa cuanto cuanta cuantos cuantas
+""".split())
+
+
+def tokenizar(texto: str) -> list:
+    """Palabras normalizadas sin palabras vacías. Los números (p. ej. de artículo) se conservan."""
+    return [
+        t for t in normalizar_texto(texto).split()
+        if t not in _PALABRAS_VACIAS and (len(t) > 1 or t.isdigit())
+    ]
+
+
+def clave_fragmento(doc) -> tuple:
+    """Identidad de un fragmento, igual venga del índice léxico o del vectorstore."""
+    return (doc.metadata.get('fuente', doc.metadata.get('source', '')), doc.page_content)
+
+
+class IndiceBM25:
+    def __init__(self, documentos):
+        self.documentos = list(documentos)
+        self._postings = defaultdict(list)   # término → [(índice del documento, frecuencia)]
+        self._longitudes = []
+
+        for i, doc in enumerate(self.documentos):
+            frecuencias = Counter(tokenizar(doc.page_content))
+            self._longitudes.append(sum(frecuencias.values()))
+            for termino, tf in frecuencias.items():
+                self._postings[termino].append((i, tf))
+
+        n = len(self.documentos)
+        self._longitud_media = (sum(self._longitudes) / n) if n else 0.0
+        self._idf = {
+            termino: math.log(1 + (n - len(lista) + 0.5) / (len(lista) + 0.5))
+            for termino, lista in self._postings.items()
+        }
+
+    def __len__(self):
+        return len(self.documentos)
+
+    def buscar(self, consulta: str, k: int = RAG_LEXICO_K) -> list:
+        """
+        Retorna [(Document, puntaje_relativo, terminos)] de mayor a menor. El
+        puntaje relativo (0-1) compara el BM25 con el de un fragmento que contiene
+        todos los términos de la consulta: 1.0 = la consulta aparece completa.
+        `terminos` es cuántos términos distintos de la consulta contiene el fragmento.
+        """
+        consulta_terminos = set(tokenizar(consulta))
+        terminos = [t for t in consulta_terminos if t in self._postings]
+        if not terminos or not self._longitud_media:
+            return []
+
+        puntajes = defaultdict(float)
+        coincidencias = Counter()
+        for termino in terminos:
+            idf = self._idf[termino]
+            for i, tf in self._postings[termino]:
+                normalizacion = _K1 * (1 - _B + _B * self._longitudes[i] / self._longitud_media)
+                puntajes[i] += idf * tf * (_K1 + 1) / (tf + normalizacion)
+                coincidencias[i] += 1
+
+        # Referencia: un fragmento de longitud media con cada término una vez
+        # (BM25 = idf por término). Un término que no aparece en ningún fragmento
+        # cuenta con el idf medio: sin él la coincidencia no puede ser completa.
+        idf_ausente = sum(self._idf.values()) / len(self._idf)
+        referencia = sum(self._idf.get(t, idf_ausente) for t in consulta_terminos)
+        mejores = sorted(puntajes.items(), key=lambda par: par[1], reverse=True)[:k]
+        return [
+            (self.documentos[i], min(1.0, puntaje / referencia), coincidencias[i])
+            for i, puntaje in mejores
+        ]
+
+
+def es_contundente(resultados) -> bool:
+    """
+    True si el primer resultado léxico basta por sí solo: puntaje de al menos
+    RAG_LEXICO_CONTUNDENTE, RAG_LEXICO_MIN_TERMINOS términos de la consulta y
+    ventaja clara sobre el segundo.
+    """
+    if not resultados or resultados[0][1] < RAG_LEXICO_CONTUNDENTE:
+        return False
+    if resultados[0][2] < RAG_LEXICO_MIN_TERMINOS:
+        return False
+    return len(resultados) == 1 or resultados[0][1] >= _MARGEN_CONTUNDENTE * resultados[1][1]
+
+
+def fragmentos_contundentes(resultados, k: int):
+    """
+    Fragmentos para responder sin búsqueda vectorial (los que puntúan al menos
+    la mitad que el mejor), o None si la coincidencia léxica no es contundente.
+    """
+    if not es_contundente(resultados):
+        return None
+    minimo = resultados[0][1] / 2
+    return [doc for doc, puntaje, _ in resultados[:k] if puntaje >= minimo]
+
+
+def fusionar(*rankings, k: int) -> list:
+    """Reciprocal Rank Fusion de varias listas de Document (cada una ordenada por relevancia)."""
+    puntajes = defaultdict(float)
+    documentos = {}
+    for ranking in rankings:
+        for posicion, doc in enumerate(ranking):
+            clave = clave_fragmento(doc)
+            puntajes[clave] += 1.0 / (_K_RRF + posicion + 1)
+            documentos.setdefault(clave, doc)
+    orden = sorted(puntajes, key=puntajes.get, reverse=True)
+    return [documentos[clave] for clave in orden[:k]]
+
+
+# ──────────────────────────────────────────────────────────────
+# PERSISTENCIA
+# ──────────────────────────────────────────────────────────────
+
+def ruta_indice(shard: str = SHARD_GENERAL) -> str:
+    base, extension = os.path.splitext(RUTA_INDICE_LEXICO)
+    return f"{base}{sufijo(shard)}{extension}"
+
+
+def guardar_indice(fragmentos, shard: str = SHARD_GENERAL) -> int:
+    """Guarda los fragmentos del entrenamiento de un shard (escritura atómica). Retorna cuántos."""
+    datos = {
+        "documentos": [
+            {"texto": doc.page_content, "metadata": doc.metadata} for doc in fragmentos
+        ]
+    }
+    ruta = ruta_indice(shard)
+    temporal = f"{ruta}.tmp"
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(datos, f, ensure_ascii=False, default=str)
+    os.replace(temporal, ruta)
+    return len(datos["documentos"])
+
+
+_lock = threading.Lock()
+_indices = {}   # shard → (mtime leído, IndiceBM25)
+
+
+def obtener_indice(shard: str = SHARD_GENERAL):
+    """Índice BM25 vigente del shard, o None si aún no se ha entrenado con índice léxico."""
+    ruta = ruta_indice(shard)
+    try:
+        mtime = os.stat(ruta).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    cargado = _indices.get(shard)
+    if cargado is None or cargado[0] != mtime:
+        with _lock:
+            cargado = _indices.get(shard)
+            if cargado is None or cargado[0] != mtime:
+                try:
+                    with open(ruta, 'r', encoding='utf-8') as f:
+                        datos = json.load(f)
+                    indice = IndiceBM25(
+                        Document(page_content=d["texto"], metadata=d.get("metadata") or {})
+                        for d in datos["documentos"]
+                    )
+                    _indices[shard] = cargado = (mtime, indice)
+                    print(f"📚 [BM25] Índice léxico '{shard}' cargado: {len(indice)} fragmentos.")
+                except Exception as e:
+                    print(f"⚠️ [BM25] No se pudo leer {ruta}: {e}")
+    return cargado[1] if cargado else None
+
+
+def buscar(consulta: str, shards=(SHARD_GENERAL,), k: int = RAG_LEXICO_K) -> list:
+    """
+    IndiceBM25.buscar sobre los índices vigentes de los shards, mezclados por
+    puntaje relativo ([] si no hay índice léxico).
+    """
+    resultados = []
+    for shard in shards:
+        indice = obtener_indice(shard)
+        if indice is not None:
+            resultados.extend(indice.buscar(consulta, k))
+    resultados.sort(key=lambda par: par[1], reverse=True)
+    return resultados[:k]
@@ -0,0 +1,377 @@
+# models/indice_vectorial.py
+import os
+import json
+import threading
+from contextlib import contextmanager
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:   # Windows
+    fcntl = None
+
+# Número de consultas procesadas por bloque en query_many: limita la matriz
+# de similitudes intermedia a _BLOQUE_CONSULTAS × N en memoria.
+_BLOQUE_CONSULTAS = 1024
+
+
+@contextmanager
+def _bloqueo_archivo(ruta):
+    """Exclusión entre procesos con flock (sin efecto en Windows)."""
+    if fcntl is None:
+        yield
+        return
+    with open(ruta, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def normalizar_l2(vectores) -> np.ndarray:
+    """Matriz float32 contigua con cada fila de norma 1 (filas nulas se dejan en 0)."""
+    matriz = np.ascontiguousarray(np.atleast_2d(vectores), dtype=np.float32)
+    normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+    normas[normas == 0] = 1.0
+    return matriz / normas
+
+
+class IndiceCoseno:
+    """
+    Índice exacto de vecinos más cercanos por distancia coseno.
+
+    Guarda los vectores L2-normalizados en una única matriz float32 contigua,
+    de modo que la similitud coseno contra todo el índice es un solo producto
+    matriz-vector, y el top-k se obtiene con argpartition (O(N)) en lugar de
+    ordenar todo el resultado.
+
+    Los métodos con_vector() y sin() no modifican la instancia: devuelven un
+    índice nuevo. Un índice ya publicado puede leerse desde varios hilos sin
+    bloqueos.
+
+    Distancia = 1 - similitud coseno (0.0 = idéntico), igual que la métrica
+    'cosine' de scikit-learn que se usaba antes.
+
+    Con normalizados=True, una matriz float32 mapeada en memoria
+    (np.load(..., mmap_mode='r'), ver models/instantanea_compartida.py) se usa
+    sin copiarla: varios procesos comparten las mismas páginas.
+    """
+
+    def __init__(self, ids, vectores, normalizados=False):
+        self.ids = tuple(ids)
+        self.matriz = (
+            np.ascontiguousarray(vectores, dtype=np.float32)
+            if normalizados else normalizar_l2(vectores)
+        )
+        if len(self.ids) != len(self.matriz):
+            raise ValueError("ids y vectores deben tener la misma longitud")
+        self._posiciones = {faq_id: i for i, faq_id in enumerate(self.ids)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, faq_id):
+        return faq_id in self._posiciones
+
+    def vector(self, faq_id) -> np.ndarray:
+        """Vector normalizado guardado para faq_id."""
+        return self.matriz[self._posiciones[faq_id]]
+
+    # ──────────────────────────────────────────────────────────
+    # Consultas
+    # ──────────────────────────────────────────────────────────
+
+    def query(self, vector, k=1):
+        """
+        Top-k para un solo vector.
+        Retorna (ids, distancias) ordenados de más a menos similar.
+        """
+        ids, distancias = self.query_many(np.asarray(vector).reshape(1, -1), k)
+        return ids[0], distancias[0]
+
+    def query_many(self, vectores, k=1):
+        """
+        Top-k para varios vectores a la vez.
+
+        Retorna (ids, distancias): ids es una lista con una lista de ids por
+        consulta; distancias es un array (n_consultas, k) en el mismo orden.
+        """
+        consultas = normalizar_l2(vectores)
+        k = min(k, len(self.ids))
+        if k == 0:
+            return [[] for _ in range(len(consultas))], np.ones((len(consultas), 0), dtype=np.float32)
+
+        todos_ids, todas_dist = [], []
+        for inicio in range(0, len(consultas), _BLOQUE_CONSULTAS):
+            similitudes = consultas[inicio:inicio + _BLOQUE_CONSULTAS] @ self.matriz.T
+
+            if k < similitudes.shape[1]:
+                candidatos = np.argpartition(-similitudes, k - 1, axis=1)[:, :k]
+            else:
+                candidatos = np.broadcast_to(np.arange(k), (len(similitudes), k))
+            sims_candidatos = np.take_along_axis(similitudes, candidatos, axis=1)
+
+            orden = np.argsort(-sims_candidatos, axis=1)
+            posiciones = np.take_along_axis(candidatos, orden, axis=1)
+            sims = np.take_along_axis(sims_candidatos, orden, axis=1)
+
+            todos_ids.extend([self.ids[p] for p in fila] for fila in posiciones)
+            todas_dist.append(np.clip(1.0 - sims, 0.0, 2.0))
+
+        return todos_ids, np.vstack(todas_dist)
+
+    # ──────────────────────────────────────────────────────────
+    # Copias modificadas (la instancia original no cambia)
+    # ──────────────────────────────────────────────────────────
+
+    def con_vector(self, faq_id, vector) -> "IndiceCoseno":
+        """Índice nuevo con faq_id añadido, o con su vector reemplazado si ya existía."""
+        fila = normalizar_l2(vector)
+        if faq_id in self._posiciones:
+            matriz = self.matriz.copy()
+            matriz[self._posiciones[faq_id]] = fila[0]
+            return IndiceCoseno(self.ids, matriz, normalizados=True)
+        matriz = fila if len(self.ids) == 0 else np.vstack([self.matriz, fila])
+        return IndiceCoseno(self.ids + (faq_id,), matriz, normalizados=True)
+
+    def sin(self, faq_id) -> "IndiceCoseno":
+        """Índice nuevo sin faq_id (o el mismo si no estaba)."""
+        if faq_id not in self._posiciones:
+            return self
+        i = self._posiciones[faq_id]
+        return IndiceCoseno(
+            self.ids[:i] + self.ids[i + 1:],
+            np.delete(self.matriz, i, axis=0),
+            normalizados=True,
+        )
+
+
+class _GrafoHNSW:
+    """Grafo hnswlib compartido por todas las versiones de un IndiceHNSW."""
+
+    def __init__(self, grafo, siguiente, activos):
+        self.grafo = grafo
+        self.lock = threading.RLock()
+        self.siguiente = siguiente   # próxima etiqueta libre (nunca se reutiliza)
+        self.activos = activos       # elementos sin marca de borrado
+
+
+class IndiceHNSW:
+    """
+    Índice aproximado (HNSW, paquete opcional `hnswlib`) con la misma interfaz
+    que IndiceCoseno, para colecciones FAQ grandes donde la búsqueda exacta
+    O(N) empieza a pesar.
+
+    Parámetros de recall/latencia:
+    - m:               vecinos por nodo del grafo (más = mejor recall, más memoria).
+    - ef_construccion: calidad del grafo al insertar (más = inserciones más lentas).
+    - ef_busqueda:     candidatos explorados por consulta (más = mejor recall, más latencia).
+
+    Reconstruir un grafo HNSW por cada cambio anularía su ventaja, así que
+    todas las versiones comparten un solo grafo, pero cada instancia es
+    inmutable como IndiceCoseno: con_vector() y sin() devuelven una versión
+    nueva con su propio mapa faq_id ↔ etiqueta. Cada inserción usa una
+    etiqueta nueva (las etiquetas no se reutilizan) y un reemplazo marca como
+    borrada la anterior, de modo que una versión vieja nunca empareja el
+    vector de una versión posterior con sus datos: las etiquetas que no
+    conoce se descartan en la consulta. Como mucho deja de ver una FAQ que se
+    cambió o borró después. Los borrados son marcas: el espacio se reutiliza
+    en inserciones posteriores. Un lock protege al grafo de lecturas y
+    escrituras simultáneas.
+    """
+
+    # Resultados extra pedidos al grafo para compensar las etiquetas de
+    # versiones posteriores que esta versión descarta
+    _MARGEN_VERSIONES = 8
+
+    def __init__(self, ids, vectores, m=16, ef_construccion=200, ef_busqueda=64):
+        try:
+            import hnswlib
+        except ImportError as e:
+            raise ImportError(
+                "KNN_INDICE=hnsw requiere el paquete 'hnswlib' (pip install hnswlib)."
+            ) from e
+
+        matriz = normalizar_l2(vectores)
+        grafo = hnswlib.Index(space='cosine', dim=matriz.shape[1])
+        grafo.init_index(
+            max_elements=max(1024, 2 * len(matriz)),
+            ef_construction=ef_construccion,
+            M=m,
+            allow_replace_deleted=True,
+        )
+        grafo.set_ef(ef_busqueda)
+        self._compartido = _GrafoHNSW(grafo, 0, 0)
+        self.ef_busqueda = ef_busqueda
+        self._etiquetas = {}        # faq_id → etiqueta entera del grafo
+        self._ids = {}              # etiqueta → faq_id
+        if len(ids):
+            self._agregar(list(ids), matriz)
+
+    # ──────────────────────────────────────────────────────────
+    # Interfaz común con IndiceCoseno
+    # ──────────────────────────────────────────────────────────
+
+    @property
+    def ids(self):
+        return tuple(self._etiquetas)
+
+    def __len__(self):
+        return len(self._etiquetas)
+
+    def __contains__(self, faq_id):
+        return faq_id in self._etiquetas
+
+    def vector(self, faq_id) -> np.ndarray:
+        with self._compartido.lock:
+            return np.asarray(
+                self._compartido.grafo.get_items([self._etiquetas[faq_id]])[0], dtype=np.float32
+            )
+
+    def query(self, vector, k=1):
+        ids, distancias = self.query_many(np.asarray(vector).reshape(1, -1), k)
+        return ids[0], distancias[0]
+
+    def query_many(self, vectores, k=1):
+        """
+        Como IndiceCoseno.query_many, pero distancias es una lista con un array
+        por consulta: si el grafo ya tiene cambios posteriores a esta versión,
+        una fila puede traer menos de k resultados.
+        """
+        consultas = normalizar_l2(vectores)
+        compartido = self._compartido
+        with compartido.lock:
+            k = min(k, len(self._etiquetas))
+            k_grafo = min(k + self._MARGEN_VERSIONES, compartido.activos)
+            if k == 0 or k_grafo == 0:
+                return [[] for _ in range(len(consultas))], [np.ones(0, dtype=np.float32) for _ in consultas]
+            # ef debe ser >= k para que HNSW pueda devolver k resultados
+            compartido.grafo.set_ef(max(self.ef_busqueda, k_grafo))
+            while True:
+                try:
+                    etiquetas, distancias = compartido.grafo.knn_query(consultas, k=k_grafo)
+                    break
+                except RuntimeError:
+                    # Con k cercano al total, el grafo puede no alcanzar k vecinos
+                    # por consulta: se piden menos
+                    if k_grafo == 1:
+                        raise
+                    k_grafo //= 2
+
+        todos_ids, todas_dist = [], []
+        for fila_etiquetas, fila_dist in zip(etiquetas, distancias):
+            conocidas = [j for j, e in enumerate(fila_etiquetas) if int(e) in self._ids][:k]
+            todos_ids.append([self._ids[int(fila_etiquetas[j])] for j in conocidas])
+            todas_dist.append(np.clip(fila_dist[conocidas].astype(np.float32), 0.0, 2.0))
+        return todos_ids, todas_dist
+
+    def con_vector(self, faq_id, vector) -> "IndiceHNSW":
+        """Versión nueva con faq_id añadido, o con su vector reemplazado si ya existía."""
+        return self.con_cambios(ids=[faq_id], vectores=normalizar_l2(vector))
+
+    def sin(self, faq_id) -> "IndiceHNSW":
+        """Versión nueva sin faq_id (o la misma si no estaba)."""
+        if faq_id not in self._etiquetas:
+            return self
+        return self.con_cambios(quitar=[faq_id])
+
+    def con_cambios(self, quitar=(), ids=(), vectores=None) -> "IndiceHNSW":
+        """
+        Versión nueva sin los ids de `quitar` y con `ids` añadidos o
+        reemplazados por `vectores`. Una sola copia de los mapas para varios
+        cambios (sincronización con MongoDB al cargar de disco). Solo sobre
+        la versión más reciente: los escritores están serializados.
+        """
+        nueva = self._derivar()
+        with self._compartido.lock:
+            for faq_id in (*quitar, *ids):
+                if faq_id in nueva._etiquetas:
+                    nueva._marcar_borrado(faq_id)
+            if len(ids):
+                nueva._agregar(list(ids), normalizar_l2(vectores))
+        return nueva
+
+    # ──────────────────────────────────────────────────────────
+    # Persistencia
+    # ──────────────────────────────────────────────────────────
+
+    def guardar(self, ruta_base, metadatos=None):
+        """
+        Guarda el grafo en <ruta_base>.bin y los ids en <ruta_base>.json.
+        metadatos (dict opcional) se guarda junto a los ids.
+
+        Llamar con la versión más reciente: el grafo incluye sus cambios.
+        Con varios workers, los temporales llevan el pid y el reemplazo del par
+        .bin/.json se hace con flock sobre <ruta_base>.lock, así que nunca
+        queda un .bin de un proceso con el .json de otro.
+        """
+        os.makedirs(os.path.dirname(ruta_base) or '.', exist_ok=True)
+        sufijo = f"{os.getpid()}.tmp"
+        with self._compartido.lock:
+            self._compartido.grafo.save_index(f"{ruta_base}.bin.{sufijo}")
+            datos = {
+                "ids": {faq_id: int(e) for faq_id, e in self._etiquetas.items()},
+                "siguiente": self._compartido.siguiente,
+                "dim": self._compartido.grafo.dim,
+                "metadatos": metadatos or {},
+            }
+        with open(f"{ruta_base}.json.{sufijo}", 'w', encoding='utf-8') as f:
+            json.dump(datos, f)
+        with _bloqueo_archivo(f"{ruta_base}.lock"):
+            os.replace(f"{ruta_base}.bin.{sufijo}", f"{ruta_base}.bin")
+            os.replace(f"{ruta_base}.json.{sufijo}", f"{ruta_base}.json")
+
+    @classmethod
+    def cargar(cls, ruta_base, ef_busqueda=64):
+        """Carga un índice guardado con guardar(). Retorna (indice, metadatos)."""
+        import hnswlib
+
+        # Mismo bloqueo que guardar(): el .bin y el .json se leen como un par
+        with _bloqueo_archivo(f"{ruta_base}.lock"):
+            with open(f"{ruta_base}.json", 'r', encoding='utf-8') as f:
+                datos = json.load(f)
+            grafo = hnswlib.Index(space='cosine', dim=datos["dim"])
+            grafo.load_index(f"{ruta_base}.bin", allow_replace_deleted=True)
+        grafo.set_ef(ef_busqueda)
+
+        indice = cls.__new__(cls)
+        indice.ef_busqueda = ef_busqueda
+        indice._etiquetas = dict(datos["ids"])
+        indice._ids = {e: faq_id for faq_id, e in indice._etiquetas.items()}
+        indice._compartido = _GrafoHNSW(grafo, datos["siguiente"], len(indice._etiquetas))
+        return indice, datos.get("metadatos", {})
+
+    # ──────────────────────────────────────────────────────────
+    # Internos
+    # ──────────────────────────────────────────────────────────
+
+    def _derivar(self):
+        """Copia de los mapas de esta versión sobre el mismo grafo."""
+        nueva = IndiceHNSW.__new__(IndiceHNSW)
+        nueva._compartido = self._compartido
+        nueva.ef_busqueda = self.ef_busqueda
+        nueva._etiquetas = dict(self._etiquetas)
+        nueva._ids = dict(self._ids)
+        return nueva
+
+    def _agregar(self, ids, matriz):
+        """Requiere el lock del grafo (o un índice aún no publicado)."""
+        compartido = self._compartido
+        necesarios = compartido.activos + len(ids)
+        if necesarios > compartido.grafo.get_max_elements():
+            compartido.grafo.resize_index(2 * necesarios)
+        etiquetas = np.arange(compartido.siguiente, compartido.siguiente + len(ids))
+        compartido.grafo.add_items(matriz, etiquetas, replace_deleted=True)
+        for faq_id, e in zip(ids, etiquetas):
+            self._etiquetas[faq_id] = int(e)
+            self._ids[int(e)] = faq_id
+        compartido.siguiente += len(ids)
+        compartido.activos += len(ids)
+
+    def _marcar_borrado(self, faq_id):
+        """Requiere el lock del grafo."""
+        etiqueta = self._etiquetas.pop(faq_id)
+        del self._ids[etiqueta]
+        self._compartido.grafo.mark_deleted(etiqueta)
+        self._compartido.activos -= 1
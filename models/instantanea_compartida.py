@@ -0,0 +1,195 @@
+# models/instantanea_compartida.py
+"""
+Instantánea del caché FAQ compartida entre los workers de un servidor.
+
+Con varios workers de gunicorn, cada proceso construía su propio índice KNN
+(con sus propios embeddings) y un cambio hecho desde el panel admin solo
+llegaba al worker que atendió la petición. Ahora el worker que cambia el
+índice publica una versión nueva en DIRECTORIO_COMPARTIDO:
+
+    faq_000042.npy   matriz float32 de vectores L2-normalizados
+    faq_000042.json  ids y datos de cada FAQ (pregunta, respuesta, bloqueo...)
+    actual.json      puntero a la versión vigente (se reemplaza de forma atómica)
+
+Los demás workers vigilan el puntero (un os.stat por consulta, como
+models/version_conocimiento.py) y, si cambió, mapean la matriz nueva en modo
+solo lectura con np.load(mmap_mode='r'): el sistema operativo comparte esas
+páginas entre procesos, así que N workers no suponen N copias de los vectores.
+
+Los escritores se coordinan con flock sobre RUTA_BLOQUEO y siempre parten de
+la última versión publicada, de modo que dos cambios simultáneos en workers
+distintos no se pisan. Como cada versión reescribe la matriz completa, los
+cambios incrementales se agrupan en models/modelo_knn.py (KNN_PUBLICAR_CADA). En Windows (sin fcntl) no hay bloqueo entre procesos:
+usa un solo worker.
+"""
+import os
+import json
+import uuid
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:   # Windows
+    fcntl = None
+
+current_dir  = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+
+# --- CONFIGURACIÓN ---
+KNN_COMPARTIDO = os.getenv("KNN_COMPARTIDO", "1").strip().lower() in ("1", "true", "si")
+DIRECTORIO_COMPARTIDO = os.path.join(project_root, 'data', 'knn_compartido')
+RUTA_PUNTERO = os.path.join(DIRECTORIO_COMPARTIDO, 'actual.json')
+RUTA_BLOQUEO = os.path.join(DIRECTORIO_COMPARTIDO, 'escritura.lock')
+# Versiones que se conservan en disco (un worker puede estar leyendo una anterior)
+_VERSIONES_CONSERVADAS = 3
+
+# Identifica al servidor en curso: gunicorn.conf.py la fija en el maestro antes del
+# fork, así que todos sus workers la comparten. Un proceso suelto tiene la suya.
+VARIABLE_GENERACION = "GOIT_GENERACION_SERVIDOR"
+_generacion_proceso = uuid.uuid4().hex
+
+
+def activo() -> bool:
+    return KNN_COMPARTIDO
+
+
+def generacion() -> str:
+    return os.environ.get(VARIABLE_GENERACION) or _generacion_proceso
+
+
+@contextmanager
+def bloqueo():
+    """Exclusión entre procesos para los escritores (flock sobre RUTA_BLOQUEO)."""
+    if not KNN_COMPARTIDO or fcntl is None:
+        yield
+        return
+    os.makedirs(DIRECTORIO_COMPARTIDO, exist_ok=True)
+    with open(RUTA_BLOQUEO, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+# ──────────────────────────────────────────────────────────────
+# PUNTERO A LA VERSIÓN VIGENTE
+# ──────────────────────────────────────────────────────────────
+
+_lock = threading.Lock()
+_mtime_leido = None
+_puntero = None
+
+
+def puntero_actual() -> dict | None:
+    """
+    {"version", "modelo", "generacion", "matriz", "datos", ...} de la versión
+    publicada, o None. Solo cuesta un os.stat si el puntero no cambió.
+    """
+    global _mtime_leido, _puntero
+    if not KNN_COMPARTIDO:
+        return None
+    try:
+        mtime = os.stat(RUTA_PUNTERO).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    if mtime != _mtime_leido:
+        with _lock:
+            if mtime != _mtime_leido:
+                try:
+                    with open(RUTA_PUNTERO, 'r', encoding='utf-8') as f:
+                        _puntero = json.load(f)
+                    _mtime_leido = mtime
+                except Exception as e:
+                    print(f"⚠️ [KNN] No se pudo leer {RUTA_PUNTERO}: {e}")
+    return _puntero
+
+
+def _escribir_atomico(ruta, escribir, binario=False):
+    temporal = f"{ruta}.tmp"
+    with open(temporal, 'wb' if binario else 'w', encoding=None if binario else 'utf-8') as f:
+        escribir(f)
+    os.replace(temporal, ruta)
+
+
+# ──────────────────────────────────────────────────────────────
+# PUBLICAR Y CARGAR
+# ──────────────────────────────────────────────────────────────
+
+def publicar(ids, matriz, faqs: dict, modelo: str) -> dict:
+    """
+    Publica una versión nueva (ids, matriz normalizada y faqs: faq_id → dict)
+    y mueve el puntero a ella. Requiere bloqueo(). Retorna el puntero nuevo.
+    """
+    os.makedirs(DIRECTORIO_COMPARTIDO, exist_ok=True)
+    anterior = _leer_puntero()
+    version = (anterior["version"] if anterior else 0) + 1
+    nombre = f"faq_{version:06d}"
+
+    # Una matriz vacía no se puede mapear: sin FAQs no se guarda
+    con_matriz = len(ids) > 0
+    if con_matriz:
+        _escribir_atomico(
+            os.path.join(DIRECTORIO_COMPARTIDO, f"{nombre}.npy"),
+            lambda f: np.save(f, np.ascontiguousarray(matriz, dtype=np.float32)),
+            binario=True,
+        )
+    _escribir_atomico(
+        os.path.join(DIRECTORIO_COMPARTIDO, f"{nombre}.json"),
+        lambda f: json.dump({"ids": list(ids), "faqs": faqs}, f, ensure_ascii=False),
+    )
+
+    puntero = {
+        "version":    version,
+        "modelo":     modelo,
+        "generacion": generacion(),
+        "matriz":     f"{nombre}.npy" if con_matriz else None,
+        "datos":      f"{nombre}.json",
+        "publicada":  datetime.now().isoformat(timespec='seconds'),
+    }
+    _escribir_atomico(RUTA_PUNTERO, lambda f: json.dump(puntero, f))
+    _limpiar(version)
+    return puntero
+
+
+def mapear_matriz(puntero) -> np.ndarray | None:
+    """Matriz de la versión, mapeada en memoria en modo solo lectura (None si no hay FAQs)."""
+    if not puntero.get("matriz"):
+        return None
+    return np.load(os.path.join(DIRECTORIO_COMPARTIDO, puntero["matriz"]), mmap_mode='r')
+
+
+def cargar(puntero):
+    """Retorna (ids, matriz mapeada o None, faqs: faq_id → dict) de una versión publicada."""
+    with open(os.path.join(DIRECTORIO_COMPARTIDO, puntero["datos"]), 'r', encoding='utf-8') as f:
+        datos = json.load(f)
+    return datos["ids"], mapear_matriz(puntero), datos["faqs"]
+
+
+def _leer_puntero():
+    try:
+        with open(RUTA_PUNTERO, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _limpiar(version_actual):
+    """Borra versiones viejas. En Linux un worker que aún las tenga mapeadas no se ve afectado."""
+    for archivo in os.listdir(DIRECTORIO_COMPARTIDO):
+        if not archivo.startswith("faq_"):
+            continue
+        try:
+            version = int(archivo[4:10])
+        except ValueError:
+            continue
+        if version <= version_actual - _VERSIONES_CONSERVADAS:
+            try:
+                os.remove(os.path.join(DIRECTORIO_COMPARTIDO, archivo))
+            except OSError:
+                pass   # Windows: archivo aún mapeado por otro proceso
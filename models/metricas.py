@@ -0,0 +1,147 @@
+# models/metricas.py
+"""
+Métricas del camino de una petición de chat, en formato de texto de Prometheus.
+
+Cada etapa (embedding, búsqueda KNN, recuperación del RAG, generación del LLM,
+escritura en FAQ, registro en MongoDB) se mide con `medir(etapa)` en un
+histograma de latencias; un error dentro del bloque suma además al contador
+de errores de esa etapa. GET /metrics (routes/app_metricas.py) expone todo.
+Los lotes de la cola de escrituras diferidas (logic/cola_escritura.py) se miden
+en etapas propias (p. ej. registro_mongo_lote), no en las de una petición.
+
+Los valores son por proceso: con varios workers, Prometheus debe consultar
+cada uno (o agregarse por instancia), como con cualquier cliente sin estado
+compartido.
+"""
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Límites (segundos) de las cubetas: de lookups en memoria (~ms) a respuestas del LLM
+CUBETAS_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_registro = []   # métricas en orden de declaración
+
+
+def _etiquetas(nombres, valores, extra="") -> str:
+    pares = [f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _numero(valor) -> str:
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Contador:
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._lock = threading.Lock()
+        self._valores = {}   # valores de etiquetas → total
+        _registro.append(self)
+
+    def incrementar(self, *valores, n=1):
+        with self._lock:
+            self._valores[valores] = self._valores.get(valores, 0) + n
+
+    def exponer(self) -> list:
+        with self._lock:
+            valores = sorted(self._valores.items())
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} counter"]
+        lineas += [f"{self.nombre}{_etiquetas(self.etiquetas, v)} {_numero(t)}" for v, t in valores]
+        return lineas
+
+
+class Histograma:
+    def __init__(self, nombre, ayuda, etiquetas=(), cubetas=CUBETAS_SEGUNDOS):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.cubetas = tuple(cubetas)
+        self._lock = threading.Lock()
+        self._series = {}   # valores de etiquetas → [conteo por cubeta (+Inf al final), suma]
+        _registro.append(self)
+
+    def observar(self, valor, *valores):
+        with self._lock:
+            serie = self._series.get(valores)
+            if serie is None:
+                serie = self._series[valores] = [[0] * (len(self.cubetas) + 1), 0.0]
+            serie[0][bisect_left(self.cubetas, valor)] += 1
+            serie[1] += valor
+
+    def exponer(self) -> list:
+        with self._lock:
+            series = sorted((v, (list(c), s)) for v, (c, s) in self._series.items())
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} histogram"]
+        for valores, (conteos, suma) in series:
+            acumulado = 0
+            for limite, conteo in zip((*self.cubetas, "+Inf"), conteos):
+                acumulado += conteo
+                le = f'le="{limite}"'
+                lineas.append(f"{self.nombre}_bucket{_etiquetas(self.etiquetas, valores, le)} {acumulado}")
+            lineas.append(f"{self.nombre}_sum{_etiquetas(self.etiquetas, valores)} {_numero(suma)}")
+            lineas.append(f"{self.nombre}_count{_etiquetas(self.etiquetas, valores)} {acumulado}")
+        return lineas
+
+
+# ──────────────────────────────────────────────────────────────
+# MÉTRICAS DE LA APLICACIÓN
+# ──────────────────────────────────────────────────────────────
+
+LATENCIA_ETAPAS = Histograma(
+    "goit_etapa_segundos", "Duración de cada etapa de una petición de chat.", ("etapa",)
+)
+ERRORES = Contador(
+    "goit_errores_total", "Errores por etapa de una petición de chat.", ("etapa",)
+)
+ACIERTOS_KNN = Contador(
+    "goit_knn_aciertos_total", "Respuestas servidas por el caché FAQ (tipo: cache o bloqueado).", ("tipo",)
+)
+LLAMADAS_LLM = Contador(
+    "goit_llm_llamadas_total", "Peticiones enviadas a cada proveedor del LLM (incluye respaldos y coberturas).",
+    ("proveedor", "modo"),
+)
+FALLOS_LLM = Contador(
+    "goit_llm_fallos_total", "Peticiones fallidas por proveedor del LLM.", ("proveedor",)
+)
+ESCRITURAS_DIFERIDAS = Contador(
+    "goit_escrituras_diferidas_total",
+    "Escrituras de la cola write-behind por destino (resultado: encolada, escrita, reintento, error si se descartó tras los reintentos o sincrona si la cola estaba llena).",
+    ("destino", "resultado"),
+)
+
+
+@contextmanager
+def medir(etapa: str):
+    """Mide la duración del bloque en goit_etapa_segundos y cuenta sus excepciones como errores."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        ERRORES.incrementar(etapa)
+        raise
+    finally:
+        LATENCIA_ETAPAS.observar(time.perf_counter() - inicio, etapa)
+
+
+def contar_error(etapa: str) -> None:
+    """Para errores que el código captura sin propagar (p. ej. el registro en MongoDB)."""
+    ERRORES.incrementar(etapa)
+
+
+def exposicion(extra=()) -> str:
+    """Todas las métricas en formato de texto de Prometheus (más líneas `extra` ya formateadas)."""
+    lineas = []
+    for metrica in _registro:
+        lineas.extend(metrica.exponer())
+    lineas.extend(extra)
+    return "\n".join(lineas) + "\n"
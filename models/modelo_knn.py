@@ -2,9 +2,12 @@
 import os
 import sys
 import time
-import numpy as np
-from sklearn.neighbors import NearestNeighbors
-from langchain_huggingface import HuggingFaceEndpointEmbeddings
+import atexit
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+from types import MappingProxyType
+from typing import NamedTuple
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -17,124 +20,725 @@ if project_root not in sys.path:
 
 # --- IMPORTS DE BASE DE DATOS (MongoDB) ---
 from database import faq_collection
+from models.almacen_embeddings import obtener_embeddings
+from models.indice_vectorial import IndiceCoseno, IndiceHNSW
+from models.proveedor_embeddings import obtener_proveedor, identificador_modelo, embedding_consulta
+from models.normalizacion import normalizar_texto, clave_texto
+from models import shards
+from models.shards import SHARD_GENERAL
+from models import instantanea_compartida as compartida
+
+# --- MODELO DE EMBEDDINGS (backend según EMBEDDINGS_BACKEND) ---
+modelo_embedding = obtener_proveedor()
+ID_MODELO_EMBEDDING = identificador_modelo()
+
+# --- TIPO DE ÍNDICE ---
+# "exacto" (por defecto): búsqueda exacta por fuerza bruta, ideal para corpus pequeños.
+# "hnsw":   índice aproximado HNSW (paquete opcional hnswlib), guardado en disco.
+# "auto":   exacto hasta KNN_HNSW_MIN_FAQS preguntas y HNSW a partir de ahí.
+KNN_INDICE           = os.getenv("KNN_INDICE", "exacto").strip().lower()
+KNN_HNSW_MIN_FAQS    = int(os.getenv("KNN_HNSW_MIN_FAQS", "20000"))
+HNSW_M               = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCCION = int(os.getenv("HNSW_EF_CONSTRUCCION", "200"))
+HNSW_EF_BUSQUEDA     = int(os.getenv("HNSW_EF_BUSQUEDA", "64"))
+HNSW_GUARDAR_CADA    = int(os.getenv("HNSW_GUARDAR_CADA", "50"))   # cambios entre guardados
+HNSW_RUTA            = os.path.join(project_root, 'data', 'knn_hnsw', 'faq')
+
+# Instantánea compartida entre workers (models/instantanea_compartida.py). Solo
+# con el índice exacto: el grafo HNSW no se puede mapear en memoria.
+_COMPARTIR = compartida.activo() and KNN_INDICE == "exacto"
+# Segundos mínimos entre publicaciones de cambios incrementales en la instantánea
+# compartida (cada una reescribe la matriz y las FAQs completas). 0 = en cada cambio.
+KNN_PUBLICAR_CADA = float(os.getenv("KNN_PUBLICAR_CADA", "5"))
+
+# Candidatos por consulta; se usa el primero que esté en la instantánea.
+_K_CANDIDATOS = 3
+# Con SHARDS_POR_PROGRAMA, si entre los candidatos no hay FAQs del shard, la
+# búsqueda se repite con este factor más candidatos (hasta cubrir el índice).
+_FACTOR_AMPLIACION = 8
+
+# ──────────────────────────────────────────────────────────────
+# INSTANTÁNEA INMUTABLE DEL ÍNDICE
+# ──────────────────────────────────────────────────────────────
+
+@dataclass(frozen=True)
+class EntradaFAQ:
+    pregunta: str
+    respuesta: str
+    bloqueado: bool = False
+    # Preguntas fusionadas en esta FAQ (ver logic/compactacion_faq.py)
+    alias: tuple = ()
+    # Programa al que pertenece (ver models/shards.py)
+    shard: str = SHARD_GENERAL
+
+
+@dataclass(frozen=True)
+class InstantaneaKNN:
+    """
+    Versión completa y coherente del caché semántico: el índice de vectores
+    y los datos de cada FAQ (indexados por _id de MongoDB como str).
+
+    Nunca se modifica. Los cambios construyen una instantánea nueva aparte y
+    la publican con una sola asignación a _instantanea, de modo que un lector
+    que tomó la referencia siempre ve índice, respuestas y bloqueos de la
+    misma versión, sin necesidad de locks.
+    """
+    indice: IndiceCoseno | IndiceHNSW | None = None      # None si no hay FAQs
+    faqs: MappingProxyType = field(default_factory=lambda: MappingProxyType({}))
+    # (shard, pregunta normalizada) → _id, para coincidencias exactas sin embeddings
+    exactas: MappingProxyType = field(default_factory=lambda: MappingProxyType({}))
+    # True cuando refleja la colección FAQ (aunque esté vacía). Mientras sea
+    # False, los cambios incrementales se ignoran: la próxima inicialización
+    # completa ya los leerá desde MongoDB.
+    cargada: bool = False
+    # Versión publicada en la instantánea compartida de la que proviene (None = solo local)
+    version: int | None = None
+
+
+class ResultadoKNN(NamedTuple):
+    """Resultado de una búsqueda en el caché semántico."""
+    respuesta: str | None
+    distancia: float          # 0.0 = idéntico, 1.0 = completamente diferente
+    bloqueado: bool
+    faq_id: str | None = None # _id de la FAQ servida (para contar aciertos)
+
+
+_SIN_RESULTADO = ResultadoKNN(None, 1.0, False)
+
 
-# --- MODELO DE EMBEDDINGS VÍA API ---
-HF_TOKEN = os.getenv("HF_TOKEN")
+_instantanea = InstantaneaKNN()
 
-print("🔄 Conectando con API de embeddings (HuggingFace)...")
-modelo_embedding = HuggingFaceEndpointEmbeddings(
-    model="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2",
-    huggingfacehub_api_token=HF_TOKEN
-)
-print("✅ API de embeddings lista.")
+# Serializa a los ESCRITORES (reconstrucción completa y cambios incrementales)
+# para que ningún cambio se pierda. Los lectores nunca lo toman.
+_lock_escritura = threading.Lock()
 
-# --- VARIABLES GLOBALES DEL MODELO KNN ---
-knn_model       = None
-respuestas_knn  = []
-bloqueado_flags = []
+# Cambios incrementales aplicados en este proceso y aún no publicados en la
+# instantánea compartida (ver _aplicar). Protegidos por _lock_escritura.
+_cambios_pendientes = []
+_temporizador = None
+_ultima_publicacion = 0.0
 
 # Control de reintentos: evita llamadas repetidas al arrancar
 _ultimo_intento  = 0.0
 _MIN_SEGUNDOS_REINTENTO = 30   # no reintentar más frecuente que cada 30 s
 
 
-def inicializar_knn():
+def obtener_instantanea() -> InstantaneaKNN:
+    """Instantánea vigente del índice KNN (lectura sin bloqueo)."""
+    return _instantanea
+
+
+def _mapa_exactas(faqs):
+    """
+    (shard, pregunta o alias normalizada) → _id. Si dos FAQs del mismo shard
+    normalizan igual gana la bloqueada, para que una respuesta fija nunca quede oculta.
+    """
+    exactas = {}
+    for faq_id, faq in faqs.items():
+        for texto in (faq.pregunta, *faq.alias):
+            clave = (faq.shard, normalizar_texto(texto))
+            previa = exactas.get(clave)
+            if previa is None or (faq.bloqueado and not faqs[previa].bloqueado):
+                exactas[clave] = faq_id
+    return exactas
+
+
+def _publicar(indice, faqs, compartir=True):
+    """
+    Publica una instantánea nueva en este proceso y, con la instantánea
+    compartida, para los demás workers. Requiere _escritura() o, en una
+    reconstrucción completa, _lock_escritura y compartida.bloqueo().
+
+    compartir=False solo la publica en este proceso (con cambios pendientes,
+    ver _aplicar): conserva la versión compartida de la que parte. Requiere
+    _lock_escritura.
+    """
+    global _instantanea
+    if indice is not None and len(indice) == 0:
+        indice = None
+
+    version = None if compartir else _instantanea.version
+    if _COMPARTIR and compartir:
+        try:
+            puntero = compartida.publicar(
+                indice.ids if indice is not None else (),
+                indice.matriz if indice is not None else None,
+                {faq_id: asdict(faq) for faq_id, faq in faqs.items()},
+                ID_MODELO_EMBEDDING,
+            )
+            version = puntero["version"]
+            if indice is not None:
+                # La copia privada se sustituye por la matriz mapeada (compartida con los demás workers)
+                indice = IndiceCoseno(indice.ids, compartida.mapear_matriz(puntero), normalizados=True)
+        except Exception as e:
+            print(f"⚠️ [KNN] No se pudo publicar la instantánea compartida: {e}")
+
+    _instantanea = InstantaneaKNN(
+        indice=indice,
+        faqs=MappingProxyType(faqs),
+        exactas=MappingProxyType(_mapa_exactas(faqs)),
+        cargada=True,
+        version=version,
+    )
+
+
+def _adoptar(puntero):
+    """Toma como propia una versión publicada por otro proceso (sin embeddings ni MongoDB)."""
+    global _instantanea
+    ids, matriz, datos = compartida.cargar(puntero)
+    faqs = {
+        faq_id: EntradaFAQ(
+            d["pregunta"], d["respuesta"], d["bloqueado"], tuple(d["alias"]), _shard_guardado(d["shard"])
+        )
+        for faq_id, d in datos.items()
+    }
+    indice = IndiceCoseno(ids, matriz, normalizados=True) if ids else None
+    _instantanea = InstantaneaKNN(
+        indice=indice,
+        faqs=MappingProxyType(faqs),
+        exactas=MappingProxyType(_mapa_exactas(faqs)),
+        cargada=True,
+        version=puntero["version"],
+    )
+
+
+def _version_nueva():
+    """Puntero publicado si es más reciente que la instantánea de este proceso, o None."""
+    if not _COMPARTIR or not _instantanea.cargada:
+        return None
+    puntero = compartida.puntero_actual()
+    if puntero is None or puntero["version"] == _instantanea.version:
+        return None
+    if puntero.get("modelo") != ID_MODELO_EMBEDDING:
+        return None   # publicada con otro modelo de embeddings: vectores incompatibles
+    return puntero
+
+
+def _sincronizar():
+    """
+    Adopta la última versión publicada si es más reciente, con los cambios
+    pendientes de este proceso aplicados encima. Requiere _lock_escritura.
+    """
+    puntero = _version_nueva()
+    if puntero is None:
+        return
+    try:
+        _adoptar(puntero)
+        if _cambios_pendientes:
+            actual = _instantanea
+            faqs = dict(actual.faqs)
+            indice = actual.indice
+            for cambio in _cambios_pendientes:
+                indice = cambio(indice, faqs)
+            _publicar(indice, faqs, compartir=False)
+        print(f"[KNN] Instantánea compartida v{puntero['version']} cargada ({len(_instantanea.faqs)} FAQs).")
+    except Exception as e:
+        print(f"⚠️ [KNN] No se pudo cargar la instantánea compartida v{puntero['version']}: {e}")
+
+
+@contextmanager
+def _escritura():
+    """
+    Sección de escritura incremental: excluye a los demás hilos y procesos
+    escritores y parte de la última versión publicada, para que dos cambios
+    simultáneos en workers distintos no se pisen.
+    """
+    with _lock_escritura, compartida.bloqueo():
+        _sincronizar()
+        yield
+
+
+def _embeddings(preguntas):
+    return obtener_embeddings(preguntas, modelo_embedding, ID_MODELO_EMBEDDING)
+
+
+def _shard_guardado(shard):
+    """Shard de una FAQ de MongoDB (sin SHARDS_POR_PROGRAMA, todas son generales)."""
+    return shard if shards.activo() and shard else SHARD_GENERAL
+
+
+def _candidatos_del_shard(instantanea, vectores, shard):
     """
-    Carga los datos desde MongoDB y entrena el modelo KNN.
-    Puede llamarse al arrancar y también de forma diferida desde
-    obtener_respuesta_knn() si el arranque falló.
+    [(faq_id, distancia)] por consulta, de más a menos similar, solo entre las
+    FAQs de la instantánea que corresponden al shard (las suyas y las generales;
+    todas con los shards desactivados).
+
+    Busca en el índice global, exacto o HNSW, y filtra los resultados: no hay
+    índices por shard que reconstruir en cada cambio. Las consultas sin ningún
+    candidato del shard se repiten con más candidatos hasta cubrir el índice.
     """
-    global knn_model, respuestas_knn, bloqueado_flags, _ultimo_intento
+    indice = instantanea.indice
+    filtrar = shards.activo()
+    resultados = [[] for _ in vectores]
+    pendientes = list(range(len(vectores)))
+    k = _K_CANDIDATOS
+    while pendientes:
+        ids, distancias = indice.query_many([vectores[n] for n in pendientes], k=k)
+        siguientes = []
+        for n, fila, dists in zip(pendientes, ids, distancias):
+            resultados[n] = [
+                (faq_id, float(d)) for faq_id, d in zip(fila, dists)
+                if faq_id in instantanea.faqs
+                and (not filtrar or instantanea.faqs[faq_id].shard in (shard, SHARD_GENERAL))
+            ][:_K_CANDIDATOS]
+            if not resultados[n] and filtrar:
+                siguientes.append(n)
+        if k >= len(indice):
+            break
+        pendientes = siguientes
+        k *= _FACTOR_AMPLIACION
+    return resultados
+
+
+# ──────────────────────────────────────────────────────────────
+# CONSTRUCCIÓN DEL ÍNDICE (exacto o HNSW)
+# ──────────────────────────────────────────────────────────────
+
+_cambios_sin_guardar = 0
+
+
+def _usar_hnsw(total):
+    return KNN_INDICE == "hnsw" or (KNN_INDICE == "auto" and total >= KNN_HNSW_MIN_FAQS)
+
+
+def _nuevo_hnsw(ids, vectores):
+    return IndiceHNSW(
+        ids, vectores, m=HNSW_M,
+        ef_construccion=HNSW_EF_CONSTRUCCION, ef_busqueda=HNSW_EF_BUSQUEDA,
+    )
+
+
+def _guardar_hnsw(indice, faqs):
+    """Guarda el grafo con la clave de cada pregunta para detectar cambios al recargar."""
+    global _cambios_sin_guardar
+    try:
+        indice.guardar(HNSW_RUTA, metadatos={
+            "modelo": ID_MODELO_EMBEDDING,
+            "claves": {faq_id: clave_texto(f.pregunta) for faq_id, f in faqs.items()},
+        })
+        _cambios_sin_guardar = 0
+    except Exception as e:
+        print(f"⚠️ [KNN] No se pudo guardar el índice HNSW: {e}")
+
+
+def _construir_hnsw(faqs):
+    """
+    Carga el índice HNSW guardado y lo sincroniza con MongoDB: quita las FAQs
+    borradas y solo inserta las nuevas o cuya pregunta cambió. Si no hay
+    índice en disco (o es de otro modelo de embeddings) lo construye de cero.
+    """
+    indice, guardadas = None, {}
+    try:
+        indice, metadatos = IndiceHNSW.cargar(HNSW_RUTA, ef_busqueda=HNSW_EF_BUSQUEDA)
+        if metadatos.get("modelo") == ID_MODELO_EMBEDDING:
+            guardadas = metadatos.get("claves", {})
+        else:
+            indice = None
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"⚠️ [KNN] Índice HNSW en disco inutilizable ({e}); se reconstruye.")
+        indice = None
+
+    if indice is None:
+        indice = _nuevo_hnsw(list(faqs), _embeddings([f.pregunta for f in faqs.values()]))
+    else:
+        borradas = [faq_id for faq_id in indice.ids if faq_id not in faqs]
+        pendientes = [i for i, f in faqs.items() if guardadas.get(i) != clave_texto(f.pregunta)]
+        vectores = _embeddings([faqs[i].pregunta for i in pendientes]) if pendientes else None
+        indice = indice.con_cambios(quitar=borradas, ids=pendientes, vectores=vectores)
+        print(f"[KNN] Índice HNSW cargado de disco ({len(pendientes)} FAQs actualizadas).")
+
+    _guardar_hnsw(indice, faqs)
+    return indice
+
+
+def _construir_indice(faqs):
+    if _usar_hnsw(len(faqs)):
+        return _construir_hnsw(faqs)
+    return IndiceCoseno(list(faqs), _embeddings([f.pregunta for f in faqs.values()]))
+
+
+def _reconstruir():
+    """Construye una instantánea completa desde MongoDB. Requiere _lock_escritura y compartida.bloqueo()."""
+    global _ultimo_intento
 
     _ultimo_intento = time.monotonic()
+    # MongoDB ya tiene los cambios pendientes: la instantánea nueva los incluye
+    _cambios_pendientes.clear()
 
     try:
         print("🔄 Cargando base de conocimiento FAQ desde MongoDB...")
 
         documentos = list(faq_collection.find(
-            {}, {"_id": 0, "pregunta": 1, "respuesta": 1, "bloqueado": 1}
+            {}, {"_id": 1, "pregunta": 1, "respuesta": 1, "bloqueado": 1, "alias": 1, "shard": 1}
         ))
 
         if not documentos:
             print("⚠️ La colección FAQ está vacía. KNN desactivado hasta que haya FAQs.")
-            knn_model       = None
-            respuestas_knn  = []
-            bloqueado_flags = []
+            _publicar(None, {})
             return
 
-        preguntas       = [doc['pregunta'] for doc in documentos]
-        respuestas_knn  = [doc['respuesta'] for doc in documentos]
-        bloqueado_flags = [doc.get('bloqueado', False) for doc in documentos]
+        faqs = {
+            str(doc['_id']): EntradaFAQ(
+                doc['pregunta'], doc['respuesta'],
+                doc.get('bloqueado', False), tuple(doc.get('alias', ())),
+                _shard_guardado(doc.get('shard')),
+            )
+            for doc in documentos
+        }
 
-        # Generar embeddings de todas las preguntas vía API
-        X_dataset = np.array(modelo_embedding.embed_documents(preguntas))
+        # Embeddings persistidos; la API solo se llama para preguntas nuevas
+        indice = _construir_indice(faqs)
+        _publicar(indice, faqs)
 
-        # n_neighbors=min(3, total): top-3 candidatos para mayor robustez
-        n_vecinos = min(3, len(preguntas))
-        knn_model = NearestNeighbors(n_neighbors=n_vecinos, metric='cosine')
-        knn_model.fit(X_dataset)
-
-        bloqueadas = sum(1 for b in bloqueado_flags if b)
+        bloqueadas = sum(1 for f in faqs.values() if f.bloqueado)
         print(
-            f"✅ Modelo KNN listo. Total: {len(respuestas_knn)} FAQs "
-            f"({bloqueadas} bloqueadas, {n_vecinos} vecinos activos)."
+            f"✅ Modelo KNN listo. Total: {len(indice)} FAQs "
+            f"({bloqueadas} bloqueadas, índice {type(indice).__name__})."
         )
 
     except Exception as e:
-        print(f"⚠️ No se pudo inicializar KNN. Usando solo LLM. Detalle: {e}")
-        knn_model = None
+        # Se conserva la instantánea anterior: mejor un índice algo viejo que ninguno
+        print(f"⚠️ No se pudo inicializar KNN. Detalle: {e}")
 
 
-# --- Intento de carga al arrancar (puede fallar si la red no está lista) ---
-try:
-    inicializar_knn()
-except Exception as e:
-    print(f"⚠️ KNN: fallo silencioso en el arranque ({e}). Se reintentará en la primera consulta.")
-    knn_model = None
+def inicializar_knn():
+    """
+    Carga los datos desde MongoDB y construye el índice KNN (p. ej. tras una
+    compactación). Los workers arrancan con cargar_knn(), que reutiliza la
+    instantánea compartida si otro worker ya la construyó.
 
+    La instantánea nueva se construye aparte y se publica de una vez: las
+    consultas concurrentes siguen usando la anterior mientras tanto. Con
+    KNN_COMPARTIDO, los demás workers la adoptan en su siguiente consulta.
 
-def obtener_respuesta_knn(pregunta_usuario):
+    Los embeddings se leen del almacén persistente (models/almacen_embeddings.py);
+    solo se calculan vía API los de preguntas nuevas. Para cambios puntuales
+    usa agregar_faq / actualizar_faq / eliminar_faq / marcar_bloqueo.
     """
-    Busca la FAQ más similar usando embeddings semánticos.
+    with _lock_escritura, compartida.bloqueo():
+        _reconstruir()
+
+
+def cargar_knn():
+    """
+    Como inicializar_knn(), pero si otro worker de este mismo servidor ya
+    publicó la instantánea compartida, la mapea en vez de reconstruirla
+    (sin leer MongoDB ni calcular embeddings). No se ejecuta al importar el
+    módulo: la llama el calentamiento en segundo plano de cada worker
+    (logic/calentamiento.py) y, de forma diferida, buscar_respuesta_exacta()
+    si aún no hay índice.
+    """
+    with _lock_escritura:
+        _cargar()
+
+
+def _cargar():
+    """Requiere _lock_escritura."""
+    global _ultimo_intento
+    with compartida.bloqueo():
+        puntero = compartida.puntero_actual() if _COMPARTIR else None
+        if (puntero is not None and puntero.get("generacion") == compartida.generacion()
+                and puntero.get("modelo") == ID_MODELO_EMBEDDING):
+            _ultimo_intento = time.monotonic()
+            try:
+                _adoptar(puntero)
+                print(f"✅ Modelo KNN listo desde la instantánea compartida v{puntero['version']} "
+                      f"({len(_instantanea.faqs)} FAQs).")
+                return
+            except Exception as e:
+                print(f"⚠️ [KNN] Instantánea compartida inutilizable ({e}); se reconstruye.")
+        # Primer worker del servidor (o instantánea de un arranque anterior): desde MongoDB
+        _reconstruir()
+
+
+# ──────────────────────────────────────────────────────────────
+# CAMBIOS INCREMENTALES (una FAQ a la vez)
+# ──────────────────────────────────────────────────────────────
+
+def _con_vector(indice, faq_id, vector):
+    """
+    Índice con faq_id añadido/reemplazado. En modo "auto" pasa de exacto a
+    HNSW cuando la colección cruza KNN_HNSW_MIN_FAQS.
+    """
+    total = (len(indice) if indice is not None else 0) + 1
+    if indice is None:
+        return _nuevo_hnsw([faq_id], [vector]) if _usar_hnsw(total) else IndiceCoseno([faq_id], [vector])
+    if isinstance(indice, IndiceCoseno) and _usar_hnsw(total):
+        print(f"[KNN] {total} FAQs: migrando a índice HNSW.")
+        indice = _nuevo_hnsw(indice.ids, indice.matriz)
+    return indice.con_vector(faq_id, vector)
+
+
+def _publicar_cambio(indice, faqs):
+    """Publica una instantánea tras un cambio incremental. Requiere _escritura()."""
+    global _cambios_sin_guardar
+    _publicar(indice, faqs)
+    if isinstance(indice, IndiceHNSW):
+        _cambios_sin_guardar += 1
+        if _cambios_sin_guardar >= HNSW_GUARDAR_CADA:
+            _guardar_hnsw(indice, faqs)
+
+
+def _aplicar(cambio):
+    """
+    Aplica un cambio incremental. cambio(indice, faqs) modifica `faqs` (una
+    copia) y retorna el índice resultante; debe tolerar partir de una versión
+    en la que la FAQ ya no esté.
+
+    Sin instantánea compartida (o con KNN_PUBLICAR_CADA=0) se publica al
+    momento. Con ella, publicar reescribe la matriz y las FAQs completas, así
+    que el cambio se aplica solo en este proceso y queda pendiente: los
+    pendientes se publican juntos como mucho cada KNN_PUBLICAR_CADA segundos
+    (publicar_pendientes), rehechos sobre la última versión de los demás workers.
+    """
+    if not _COMPARTIR or KNN_PUBLICAR_CADA <= 0:
+        with _escritura():
+            actual = _instantanea
+            if not actual.cargada:
+                return
+            faqs = dict(actual.faqs)
+            _publicar_cambio(cambio(actual.indice, faqs), faqs)
+        return
+
+    with _lock_escritura:
+        _sincronizar()
+        actual = _instantanea
+        if not actual.cargada:
+            return
+        faqs = dict(actual.faqs)
+        _publicar(cambio(actual.indice, faqs), faqs, compartir=False)
+        _cambios_pendientes.append(cambio)
+        _programar_publicacion()
+
+
+def _programar_publicacion():
+    """Programa publicar_pendientes() si no lo está ya. Requiere _lock_escritura."""
+    global _temporizador
+    if _temporizador is not None and _temporizador.is_alive():
+        return
+    espera = max(0.0, _ultima_publicacion + KNN_PUBLICAR_CADA - time.monotonic())
+    _temporizador = threading.Timer(espera, publicar_pendientes)
+    _temporizador.daemon = True
+    _temporizador.start()
+
+
+def publicar_pendientes():
+    """
+    Publica en la instantánea compartida los cambios incrementales pendientes
+    de este proceso. La llama un temporizador tras cada cambio y, al apagar el
+    worker, atexit/worker_exit/lifespan; sin pendientes no hace nada.
+    """
+    global _ultima_publicacion
+    with _lock_escritura, compartida.bloqueo():
+        if not _cambios_pendientes:
+            return
+        _sincronizar()
+        actual = _instantanea
+        total = len(_cambios_pendientes)
+        _publicar(actual.indice, dict(actual.faqs))
+        _cambios_pendientes.clear()
+        _ultima_publicacion = time.monotonic()
+    print(f"[KNN] {total} cambio(s) publicados en la instantánea compartida v{_instantanea.version}.")
+
+
+atexit.register(publicar_pendientes)
+
+
+def agregar_faq(faq_id, pregunta, respuesta, bloqueado=False, shard=SHARD_GENERAL):
+    """Añade una FAQ nueva al índice calculando solo su embedding."""
+    if not _instantanea.cargada:
+        return
+
+    # El embedding (llamada de red) se calcula antes de tomar el lock
+    vector = _embeddings([pregunta])[0]
+    entrada = EntradaFAQ(pregunta, respuesta, bloqueado, shard=_shard_guardado(shard))
+
+    def cambio(indice, faqs):
+        faqs[faq_id] = entrada
+        return _con_vector(indice, faq_id, vector)
+
+    _aplicar(cambio)
+    print(f"[KNN] FAQ agregada al índice ({len(_instantanea.faqs)} en total).")
+
+
+def actualizar_faq(faq_id, pregunta, respuesta):
+    """
+    Actualiza pregunta y respuesta de una FAQ del índice.
+    Solo recalcula el embedding si el texto de la pregunta cambió.
+    """
+    actual = _instantanea
+    if not actual.cargada:
+        return
+    previa = actual.faqs.get(faq_id)
+    if previa is None:
+        agregar_faq(faq_id, pregunta, respuesta)
+        return
+
+    vector = _embeddings([pregunta])[0] if previa.pregunta != pregunta else None
+
+    def cambio(indice, faqs):
+        base = faqs.get(faq_id, previa)
+        faqs[faq_id] = EntradaFAQ(pregunta, respuesta, base.bloqueado, base.alias, base.shard)
+        return indice if vector is None else _con_vector(indice, faq_id, vector)
+
+    _aplicar(cambio)
+
+
+def eliminar_faq(faq_id):
+    """Quita una FAQ del índice sin recalcular ningún embedding."""
+    if faq_id not in _instantanea.faqs:
+        return
+
+    def cambio(indice, faqs):
+        faqs.pop(faq_id, None)
+        return indice.sin(faq_id) if indice is not None else None
+
+    _aplicar(cambio)
+
+
+def marcar_bloqueo(faq_id, bloqueado):
+    """Cambia el indicador de bloqueo de una FAQ; los vectores no se tocan."""
+    if faq_id not in _instantanea.faqs:
+        return
+
+    def cambio(indice, faqs):
+        previa = faqs.get(faq_id)
+        if previa is not None:
+            faqs[faq_id] = EntradaFAQ(previa.pregunta, previa.respuesta, bloqueado, previa.alias, previa.shard)
+        return indice
+
+    _aplicar(cambio)
+
+
+def _reintentar_si_necesario():
+    """
+    Inicialización diferida: si aún no hay índice (el calentamiento no ha
+    terminado o falló), reintenta respetando el intervalo mínimo. Si otro hilo ya está reconstruyendo, no espera.
+    """
+    if _instantanea.cargada:
+        # Otro worker publicó cambios: se adoptan (un os.stat si no hay nada nuevo)
+        if _version_nueva() is not None and _lock_escritura.acquire(blocking=False):
+            try:
+                _sincronizar()
+            finally:
+                _lock_escritura.release()
+        return
+    if time.monotonic() - _ultimo_intento < _MIN_SEGUNDOS_REINTENTO:
+        return
+    if not _lock_escritura.acquire(blocking=False):
+        return
+    try:
+        if not _instantanea.cargada:
+            print("[KNN] Reintentando inicialización diferida...")
+            _cargar()
+    finally:
+        _lock_escritura.release()
+
+
+def buscar_respuesta_exacta(pregunta_usuario, programa=None):
+    """
+    Atajo sin embeddings: busca una FAQ cuya pregunta coincida con la del
+    usuario tras normalizar mayúsculas, acentos, signos y espacios
+    (en el shard del programa y luego en el general).
+
+    Retorna ResultadoKNN(respuesta, 0.0, bloqueado, faq_id) si hay coincidencia, o None.
+    """
+    _reintentar_si_necesario()
+
+    instantanea = _instantanea
+    clave = normalizar_texto(pregunta_usuario)
+    faq_id = None
+    for shard in shards.shards_consulta(programa):
+        faq_id = instantanea.exactas.get((shard, clave))
+        if faq_id is not None:
+            break
+    if faq_id is None:
+        return None
+
+    faq = instantanea.faqs[faq_id]
+    print(f"[KNN] Coincidencia exacta | Bloqueado: {faq.bloqueado}")
+    return ResultadoKNN(faq.respuesta, 0.0, faq.bloqueado, faq_id)
+
+
+def obtener_respuesta_knn(pregunta_usuario, vector=None, programa=None, probar_exacta=True):
+    """
+    Busca la FAQ más similar usando embeddings semánticos. Con
+    SHARDS_POR_PROGRAMA solo entre las FAQs del programa y las generales.
+
+    Primero prueba la coincidencia exacta normalizada (buscar_respuesta_exacta),
+    que no necesita embedding. probar_exacta=False se la salta: para quien ya
+    la consultó (el selector), así la búsqueda no repite la coincidencia exacta
+    ni la inicialización diferida.
+
+    vector: embedding ya calculado de la pregunta (ver embedding_consulta).
+    Si no se pasa, se obtiene del LRU de consultas o del proveedor.
 
     Si el modelo no está listo (falló al arrancar), intenta inicializarlo
     de forma diferida antes de responder. El reintento respeta un intervalo
     mínimo para no bloquear cada petición.
 
-    Retorna (respuesta, distancia_coseno, bloqueado):
+    Retorna ResultadoKNN(respuesta, distancia_coseno, bloqueado, faq_id):
     - respuesta    : texto de la FAQ más cercana, o None.
     - distancia    : 0.0 = idéntico, 1.0 = completamente diferente.
     - bloqueado    : True si la FAQ tiene respuesta fija e inamovible.
+    - faq_id       : _id de la FAQ encontrada, o None.
     """
-    global knn_model, _ultimo_intento
-
-    # Inicialización diferida: si falló al arrancar, reintenta ahora
-    if knn_model is None:
-        segundos_desde_ultimo = time.monotonic() - _ultimo_intento
-        if segundos_desde_ultimo >= _MIN_SEGUNDOS_REINTENTO:
-            print("[KNN] Reintentando inicialización diferida...")
-            inicializar_knn()
+    if probar_exacta:
+        exacta = buscar_respuesta_exacta(pregunta_usuario, programa)
+        if exacta is not None:
+            return exacta
 
-    if knn_model is None:
-        return None, 1.0, False
+    # Una sola lectura de la referencia: índice y datos de la misma versión
+    instantanea = _instantanea
+    if instantanea.indice is None:
+        return _SIN_RESULTADO
 
     try:
-        X_usuario = np.array(
-            modelo_embedding.embed_query(pregunta_usuario)
-        ).reshape(1, -1)
-
-        distancias, indices = knn_model.kneighbors(X_usuario)
+        if vector is None:
+            vector = embedding_consulta(pregunta_usuario)
 
-        indice_mejor   = indices[0][0]
-        distancia_mejor = distancias[0][0]
+        validos = _candidatos_del_shard(instantanea, [vector], shards.shard_de(programa))[0]
+        if not validos:
+            return _SIN_RESULTADO
 
-        respuesta = respuestas_knn[indice_mejor]
-        bloqueado = bloqueado_flags[indice_mejor] if bloqueado_flags else False
+        faq_id          = validos[0][0]
+        faq             = instantanea.faqs[faq_id]
+        distancia_mejor = float(validos[0][1])
 
-        print(f"[KNN] Distancia coseno: {distancia_mejor:.4f} | Bloqueado: {bloqueado}")
+        print(f"[KNN] Distancia coseno: {distancia_mejor:.4f} | Bloqueado: {faq.bloqueado}")
 
-        return respuesta, distancia_mejor, bloqueado
+        return ResultadoKNN(faq.respuesta, distancia_mejor, faq.bloqueado, faq_id)
 
     except Exception as e:
         print(f"[KNN] Error en predicción: {e}")
-        return None, 1.0, False
+        return _SIN_RESULTADO
+
+
+def obtener_respuestas_knn_lote(preguntas, vectores=None, programa=None):
+    """
+    Versión por lotes de obtener_respuesta_knn (evaluaciones offline y
+    SelectorDeModelo.responder_lote). No prueba coincidencias exactas.
+
+    Calcula los embeddings de todas las preguntas en una sola llamada (salvo
+    que se pasen en `vectores`) y resuelve todas las búsquedas con un único
+    producto de matrices (ver _candidatos_del_shard). Retorna una lista de
+    ResultadoKNN, una por pregunta.
+    """
+    instantanea = _instantanea
+    if instantanea.indice is None or not preguntas:
+        return [_SIN_RESULTADO for _ in preguntas]
+
+    if vectores is None:
+        vectores = modelo_embedding.embed_documents(list(preguntas))
+
+    resultados = []
+    for validos in _candidatos_del_shard(instantanea, list(vectores), shards.shard_de(programa)):
+        if not validos:
+            resultados.append(_SIN_RESULTADO)
+            continue
+        faq_id = validos[0][0]
+        faq = instantanea.faqs[faq_id]
+        resultados.append(ResultadoKNN(faq.respuesta, float(validos[0][1]), faq.bloqueado, faq_id))
+    return resultados
@@ -1,67 +1,136 @@
 # --- modelo_llm.py ---
-import os
+import asyncio
 from operator import itemgetter
 from dotenv import load_dotenv
-import chromadb
 from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEndpointEmbeddings
-from langchain_groq import ChatGroq
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import RunnableLambda
+from models.proveedor_embeddings import obtener_proveedor, embedding_consulta, aembedding_consulta
+from models.cache_recuperacion import obtener_fragmentos, guardar_fragmentos
+from models.version_conocimiento import version_actual
+from models import vectorstore as almacen_vectores
+from models.contexto_rag import empaquetar_contexto
+from models import indice_lexico
+from models import shards
+from models.shards import SHARD_GENERAL
+from models.proveedores_llm import crear_llm
+from models.metricas import medir
 
 load_dotenv()
 
 # --- CONFIGURACIÓN ---
-MODELO_EMBEDDING = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
-MODELO_GROQ = "openai/gpt-oss-120b"
+K_FRAGMENTOS = 6   # fragmentos que llegan al empaquetado del contexto
 
 # --- CLAVES ---
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-HF_TOKEN = os.getenv("HF_TOKEN")
-CHROMA_API_KEY = os.getenv("CHROMA_API_KEY")
-CHROMA_TENANT = os.getenv("CHROMA_TENANT")
-CHROMA_DATABASE = os.getenv("CHROMA_DATABASE")
-
-if not GROQ_API_KEY:
-    raise ValueError("❌ Error: No se encontró la GROQ_API_KEY en el archivo .env")
-if not CHROMA_API_KEY:
+# Las de los proveedores del LLM se validan en models/proveedores_llm.py
+if not almacen_vectores.es_local() and not almacen_vectores.CHROMA_API_KEY:
     raise ValueError("❌ Error: No se encontró la CHROMA_API_KEY en el archivo .env")
 
 
-def obtener_cadena_rag():
+def _vectorstores_por_shard(chroma_client, embedding_function):
+    """shard → Chroma, para cada colección entrenada (ver models/shards.py)."""
+    prefijo = almacen_vectores.CHROMA_COLLECTION
+    vectorstores = {}
+    for nombre in almacen_vectores.colecciones_existentes(chroma_client):
+        if nombre == prefijo:
+            shard = SHARD_GENERAL
+        elif nombre.startswith(f"{prefijo}__") and shards.activo():
+            shard = nombre[len(prefijo) + 2:]
+        else:
+            continue
+        vectorstores[shard] = Chroma(
+            client=chroma_client,
+            collection_name=nombre,
+            embedding_function=embedding_function
+        )
+    return vectorstores
 
-    # Conectar a Chroma Cloud
-    chroma_client = chromadb.CloudClient(
-        api_key=CHROMA_API_KEY,
-        tenant=CHROMA_TENANT,
-        database=CHROMA_DATABASE
-    )
 
-    # Verificar si la colección existe
-    colecciones = [c.name for c in chroma_client.list_collections()]
-    if "goit_vectores" not in colecciones:
-        print("⚠️ La colección 'goit_vectores' no existe en Chroma Cloud. Entrena primero desde el panel admin.")
-        return None
+def obtener_cadena_rag():
 
-    # Embeddings vía API de HuggingFace
-    embedding_function = HuggingFaceEndpointEmbeddings(
-        model=MODELO_EMBEDDING,
-        huggingfacehub_api_token=HF_TOKEN
-    )
+    # Chroma Cloud o Chroma local según VECTORSTORE_BACKEND (ver models/vectorstore.py)
+    chroma_client = almacen_vectores.crear_cliente()
 
-    # Conectar vectorstore a Chroma Cloud
-    vectorstore = Chroma(
-        client=chroma_client,
-        collection_name="goit_vectores",
-        embedding_function=embedding_function
-    )
+    # Mismo proveedor de embeddings que el KNN (ver models/proveedor_embeddings.py)
+    embedding_function = obtener_proveedor()
 
-    # MMR (Maximal Marginal Relevance): recupera resultados diversos y relevantes.
-    # fetch_k=20 candidatos → selecciona los k=6 más variados (lambda_mult controla relevancia vs diversidad).
-    retriever = vectorstore.as_retriever(
-        search_type="mmr",
-        search_kwargs={"k": 6, "fetch_k": 20, "lambda_mult": 0.7}
-    )
+    # Una colección por shard; sin SHARDS_POR_PROGRAMA solo la general
+    vectorstores = _vectorstores_por_shard(chroma_client, embedding_function)
+    if not vectorstores:
+        print(f"⚠️ La colección '{almacen_vectores.CHROMA_COLLECTION}' no existe en "
+              f"{almacen_vectores.nombre_backend()}. Entrena primero desde el panel admin.")
+        return None
+
+    # Recuperación híbrida: BM25 en memoria (models/indice_lexico.py) + vectores,
+    # solo en los shards del programa de la pregunta y el general.
+    # - Si la coincidencia léxica es contundente (p. ej. "artículo 45", el nombre
+    #   exacto de una cuota), se responde con ella sin consultar el vectorstore
+    #   (desactivado por defecto, ver RAG_LEXICO_CONTUNDENTE).
+    # - Si no, MMR (Maximal Marginal Relevance) sobre los vectores: fetch_k=20
+    #   candidatos → los k más variados (lambda_mult controla relevancia vs
+    #   diversidad), fusionados con el ranking léxico por Reciprocal Rank Fusion.
+    # La búsqueda es por vector: si la entrada trae "embedding" (calculado por el
+    # selector para el KNN) se reutiliza y la pregunta no se vuelve a embeber.
+    # Los fragmentos se memorizan por shard, pregunta y versión de la base de conocimiento
+    # (ver models/cache_recuperacion.py): repeticiones y regeneraciones no vuelven a Chroma.
+    def buscar_lexico(pregunta, shards_pregunta):
+        lexicos = indice_lexico.buscar(pregunta, shards_pregunta)
+        contundentes = indice_lexico.fragmentos_contundentes(lexicos, k=K_FRAGMENTOS)
+        if contundentes is not None:
+            print(f"[RAG] Coincidencia léxica contundente: {len(contundentes)} fragmento(s), sin búsqueda vectorial.")
+        return [doc for doc, *_ in lexicos], contundentes
+
+    def recuperar(entrada):
+        shards_pregunta = shards.shards_consulta(entrada.get("programa"))
+        fragmentos = obtener_fragmentos(entrada["question"], shards_pregunta[0])
+        if fragmentos is not None:
+            return fragmentos
+
+        version = version_actual()
+        with medir("recuperacion"):
+            lexicos, fragmentos = buscar_lexico(entrada["question"], shards_pregunta)
+            if fragmentos is None:
+                vector = entrada.get("embedding")
+                if vector is None:
+                    vector = embedding_consulta(entrada["question"])
+                vectoriales = [
+                    vectorstores[shard].max_marginal_relevance_search_by_vector(
+                        vector, k=K_FRAGMENTOS, fetch_k=20, lambda_mult=0.7
+                    )
+                    for shard in shards_pregunta if shard in vectorstores
+                ]
+                fragmentos = indice_lexico.fusionar(*vectoriales, lexicos, k=K_FRAGMENTOS)
+        guardar_fragmentos(entrada["question"], fragmentos, version, shards_pregunta[0])
+        return fragmentos
+
+    # Variante usada por ainvoke/astream (ruta ASGI): no bloquea el event loop
+    # (la búsqueda léxica va a un hilo: la primera tras un reentrenamiento lee el JSON
+    # y construye el BM25; los shards del vectorstore se consultan a la vez)
+    async def arecuperar(entrada):
+        shards_pregunta = shards.shards_consulta(entrada.get("programa"))
+        fragmentos = obtener_fragmentos(entrada["question"], shards_pregunta[0])
+        if fragmentos is not None:
+            return fragmentos
+
+        version = version_actual()
+        with medir("recuperacion"):
+            lexicos, fragmentos = await asyncio.to_thread(
+                buscar_lexico, entrada["question"], shards_pregunta
+            )
+            if fragmentos is None:
+                vector = entrada.get("embedding")
+                if vector is None:
+                    vector = await aembedding_consulta(entrada["question"])
+                vectoriales = await asyncio.gather(*(
+                    vectorstores[shard].amax_marginal_relevance_search_by_vector(
+                        vector, k=K_FRAGMENTOS, fetch_k=20, lambda_mult=0.7
+                    )
+                    for shard in shards_pregunta if shard in vectorstores
+                ))
+                fragmentos = indice_lexico.fusionar(*vectoriales, lexicos, k=K_FRAGMENTOS)
+        guardar_fragmentos(entrada["question"], fragmentos, version, shards_pregunta[0])
+        return fragmentos
 
     template = """Eres Goit-IA, el asistente virtual oficial de la Universidad Veracruzana (UV), especializado en responder preguntas a partir de los documentos institucionales que tienes disponibles.
 
@@ -105,18 +174,13 @@ Ejemplo de respuesta cuando no hay información:
 """
 
     prompt = ChatPromptTemplate.from_template(template)
-    llm = ChatGroq(model=MODELO_GROQ, api_key=GROQ_API_KEY)
-
-    def format_docs(docs):
-        partes = []
-        for doc in docs:
-            fuente = doc.metadata.get('fuente', doc.metadata.get('source', 'documento'))
-            partes.append(f"[Fuente: {fuente}]\n{doc.page_content}")
-        return "\n\n---\n\n".join(partes)
+    # Groq y/o servidores compatibles con OpenAI, con plazo, respaldo y
+    # cortacircuitos (ver models/proveedores_llm.py)
+    llm = crear_llm()
 
     rag_chain = (
         {
-            "context": itemgetter("question") | retriever | format_docs,
+            "context": RunnableLambda(recuperar, afunc=arecuperar) | empaquetar_contexto,
             "question": itemgetter("question"),
             "history": itemgetter("history")
         }
@@ -0,0 +1,29 @@
+# models/normalizacion.py
+import hashlib
+import re
+import unicodedata
+
+_NO_ALFANUMERICO = re.compile(r'[^0-9a-zñ]+')
+
+
+def normalizar_texto(texto: str) -> str:
+    """
+    Forma canónica de una pregunta: minúsculas, sin acentos, sin signos de
+    puntuación y con espacios colapsados. La ñ se conserva.
+
+    "¿Qué es una BAJA?" → "que es una baja"
+    """
+    texto = (texto or "").casefold().replace('ñ', '\0')
+    texto = unicodedata.normalize('NFKD', texto)
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    texto = texto.replace('\0', 'ñ')
+    return _NO_ALFANUMERICO.sub(' ', texto).strip()
+
+
+def clave_texto(texto: str, modelo: str = "") -> str:
+    """
+    Hash estable (sha256) del texto normalizado. Incluir el modelo evita
+    reutilizar vectores calculados con otro modelo de embeddings.
+    """
+    contenido = f"{modelo}\n{normalizar_texto(texto)}"
+    return hashlib.sha256(contenido.encode('utf-8')).hexdigest()
@@ -0,0 +1,221 @@
+# models/proveedor_embeddings.py
+"""
+Proveedor único de embeddings para KNN, RAG y entrenamiento.
+
+Se elige con la variable de entorno EMBEDDINGS_BACKEND:
+- "hf"    (por defecto): API de inferencia de HuggingFace (requiere HF_TOKEN).
+- "local": modelo ONNX en CPU dentro del proceso (paquete opcional `fastembed`).
+- "hash":  embeddings deterministas por hashing de palabras, sin red ni modelo.
+           Solo para pruebas offline y benchmarks.
+
+Todos implementan la interfaz Embeddings de LangChain, así que sirven tanto
+para Chroma como para el índice KNN.
+"""
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from dotenv import load_dotenv
+
+from models.normalizacion import normalizar_texto
+
+load_dotenv()
+
+# --- CONFIGURACIÓN ---
+MODELO_EMBEDDING = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+EMBEDDINGS_BACKEND = os.getenv("EMBEDDINGS_BACKEND", "hf").strip().lower()
+EMBEDDINGS_BATCH = int(os.getenv("EMBEDDINGS_BATCH", "32"))
+DIMENSION_HASH = 384   # misma dimensión que MiniLM-L12
+# Capacidad del LRU de embeddings de consultas (ver embedding_consulta)
+EMBEDDINGS_CACHE_CONSULTAS = int(os.getenv("EMBEDDINGS_CACHE_CONSULTAS", "512"))
+
+HF_TOKEN = os.getenv("HF_TOKEN")
+
+
+class EmbeddingsLocales(Embeddings):
+    """
+    Ejecuta el modelo de embeddings en CPU con ONNX Runtime (vía fastembed).
+    Evita el viaje de red por consulta; los lotes se procesan de EMBEDDINGS_BATCH en EMBEDDINGS_BATCH.
+    """
+
+    def __init__(self, modelo=MODELO_EMBEDDING, tam_lote=EMBEDDINGS_BATCH):
+        try:
+            from fastembed import TextEmbedding
+        except ImportError as e:
+            raise ImportError(
+                "EMBEDDINGS_BACKEND=local requiere el paquete 'fastembed' (pip install fastembed)."
+            ) from e
+        self.tam_lote = tam_lote
+        self._modelo = TextEmbedding(model_name=modelo)
+
+    def embed_documents(self, texts):
+        return [v.tolist() for v in self._modelo.embed(list(texts), batch_size=self.tam_lote)]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+class EmbeddingsHash(Embeddings):
+    """
+    Embeddings deterministas sin red: cada palabra normalizada y cada trigrama
+    de caracteres suma ±1 en una posición elegida por hash (feature hashing).
+    Textos con palabras en común quedan cerca en distancia coseno, lo que
+    basta para probar el flujo KNN/RAG completo sin depender de la API.
+    """
+
+    def __init__(self, dimension=DIMENSION_HASH):
+        self.dimension = dimension
+
+    def _rasgos(self, texto):
+        for palabra in normalizar_texto(texto).split():
+            yield palabra
+            relleno = f"#{palabra}#"
+            for i in range(len(relleno) - 2):
+                yield relleno[i:i + 3]
+
+    def _vector(self, texto):
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for rasgo in self._rasgos(texto):
+            digest = hashlib.blake2b(rasgo.encode('utf-8'), digest_size=8).digest()
+            valor = int.from_bytes(digest, 'little')
+            vector[valor % self.dimension] += 1.0 if (valor >> 63) else -1.0
+        norma = np.linalg.norm(vector)
+        return (vector / norma if norma else vector).tolist()
+
+    def embed_documents(self, texts):
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+def crear_proveedor(backend=EMBEDDINGS_BACKEND) -> Embeddings:
+    """Crea un proveedor nuevo del tipo indicado ('hf', 'local' o 'hash')."""
+    if backend == "hash":
+        return EmbeddingsHash()
+    if backend == "local":
+        print(f"🔄 Cargando modelo de embeddings local (ONNX, CPU): {MODELO_EMBEDDING}...")
+        return EmbeddingsLocales()
+    if backend == "hf":
+        from langchain_huggingface import HuggingFaceEndpointEmbeddings
+        print("🔄 Conectando con API de embeddings (HuggingFace)...")
+        return HuggingFaceEndpointEmbeddings(
+            model=MODELO_EMBEDDING,
+            huggingfacehub_api_token=HF_TOKEN
+        )
+    raise ValueError(f"❌ EMBEDDINGS_BACKEND desconocido: '{backend}' (usa hf, local o hash)")
+
+
+def identificador_modelo(backend=EMBEDDINGS_BACKEND) -> str:
+    """
+    Nombre que identifica el espacio vectorial del proveedor. Se usa en las
+    claves del almacén persistente para no mezclar vectores de backends distintos.
+    """
+    if backend == "hash":
+        return f"hash-{DIMENSION_HASH}"
+    if backend == "local":
+        return f"local:{MODELO_EMBEDDING}"
+    return MODELO_EMBEDDING
+
+
+_proveedor = None
+_lock_proveedor = threading.Lock()
+
+
+def obtener_proveedor() -> Embeddings:
+    """Proveedor compartido por todo el proceso (se crea en el primer uso)."""
+    global _proveedor
+    if _proveedor is None:
+        with _lock_proveedor:
+            if _proveedor is None:
+                _proveedor = crear_proveedor()
+                print(f"✅ Embeddings listos (backend={EMBEDDINGS_BACKEND}).")
+    return _proveedor
+
+
+# ──────────────────────────────────────────────────────────────
+# EMBEDDING DE CONSULTAS (una llamada por pregunta)
+# ──────────────────────────────────────────────────────────────
+
+_cache_consultas = OrderedDict()   # texto normalizado → vector (list[float])
+_lock_cache = threading.Lock()
+# Textos por llamada al proveedor en embeddings_consultas
+_BLOQUE_LOTE = 256
+
+
+def embedding_consulta(texto: str) -> list[float]:
+    """
+    Embedding de la pregunta de un usuario, memorizado en un LRU acotado
+    (EMBEDDINGS_CACHE_CONSULTAS entradas) por texto normalizado.
+
+    El selector lo calcula una vez por petición y pasa el mismo vector al KNN
+    y a la búsqueda en Chroma; si alguna etapa lo vuelve a pedir, lo obtiene
+    del LRU sin otra llamada al proveedor.
+    """
+    clave = normalizar_texto(texto)
+    with _lock_cache:
+        vector = _cache_consultas.get(clave)
+        if vector is not None:
+            _cache_consultas.move_to_end(clave)
+            return vector
+
+    vector = list(obtener_proveedor().embed_query(texto))
+    _memorizar(clave, vector)
+    return vector
+
+
+async def aembedding_consulta(texto: str) -> list[float]:
+    """
+    Versión async de embedding_consulta (mismo LRU). Usa aembed_query del
+    proveedor: cliente HTTP async con HuggingFace; los backends en proceso
+    se ejecutan en el pool de hilos del event loop.
+    """
+    clave = normalizar_texto(texto)
+    with _lock_cache:
+        vector = _cache_consultas.get(clave)
+        if vector is not None:
+            _cache_consultas.move_to_end(clave)
+            return vector
+
+    vector = list(await obtener_proveedor().aembed_query(texto))
+    _memorizar(clave, vector)
+    return vector
+
+
+def embeddings_consultas(textos) -> list:
+    """
+    Versión por lotes de embedding_consulta (mismo LRU): los textos que no
+    están memorizados se calculan con embed_documents, en bloques de
+    _BLOQUE_LOTE, en vez de una llamada al proveedor por pregunta.
+    """
+    claves = [normalizar_texto(t) for t in textos]
+    vectores = {}
+    with _lock_cache:
+        for clave in claves:
+            vector = _cache_consultas.get(clave)
+            if vector is not None:
+                vectores[clave] = vector
+
+    faltantes = {}
+    for clave, texto in zip(claves, textos):
+        if clave not in vectores:
+            faltantes.setdefault(clave, texto)
+    pendientes = list(faltantes.items())
+    for inicio in range(0, len(pendientes), _BLOQUE_LOTE):
+        bloque = pendientes[inicio:inicio + _BLOQUE_LOTE]
+        calculados = obtener_proveedor().embed_documents([texto for _, texto in bloque])
+        for (clave, _), vector in zip(bloque, calculados):
+            vectores[clave] = list(vector)
+            _memorizar(clave, vectores[clave])
+
+    return [vectores[clave] for clave in claves]
+
+
+def _memorizar(clave, vector):
+    with _lock_cache:
+        _cache_consultas[clave] = vector
+        _cache_consultas.move_to_end(clave)
+        while len(_cache_consultas) > EMBEDDINGS_CACHE_CONSULTAS:
+            _cache_consultas.popitem(last=False)
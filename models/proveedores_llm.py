@@ -0,0 +1,525 @@
+# models/proveedores_llm.py
+"""
+Proveedores del LLM con plazo, respaldo, cobertura y cortacircuitos.
+
+LLM_PROVEEDORES es una lista ordenada (separada por comas) de `tipo:modelo`
+o `tipo:modelo@base_url`. El primero es el preferido; los demás, respaldos:
+- groq:openai/gpt-oss-120b                  (requiere GROQ_API_KEY)
+- openai:llama-3.1-8b@http://localhost:8089/v1
+      Cualquier servidor compatible con la API de OpenAI (vLLM, Ollama,
+      OpenRouter o logic/servidor_llm_falso.py para pruebas). Requiere el
+      paquete opcional `langchain-openai`; la clave se toma de LLM_OPENAI_API_KEY.
+
+En cada llamada:
+1. Plazo: LLM_PLAZO_SEGUNDOS para obtener la respuesta (en streaming, el
+   primer fragmento). Si se agota, la llamada falla con LLMNoDisponible.
+2. Respaldo: si un proveedor falla, se prueba el siguiente dentro del mismo plazo.
+3. Cobertura (hedging): si el proveedor tarda más que el percentil
+   LLM_COBERTURA_PERCENTIL de sus latencias recientes, se lanza una segunda
+   petición (al siguiente proveedor, o al mismo si no hay otro) y se usa la
+   primera que responda.
+4. Cortacircuitos por proveedor: tras LLM_CIRCUITO_FALLOS fallos seguidos se
+   salta durante LLM_CIRCUITO_SEGUNDOS; después se deja pasar una petición de
+   prueba y, si responde, el proveedor vuelve a usarse.
+
+Los estados de los circuitos y las latencias son por proceso y sobreviven a
+la reconstrucción de la cadena RAG (ver obtener_proveedores).
+"""
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from dotenv import load_dotenv
+from langchain_core.runnables import Runnable
+
+from models.metricas import medir, LLAMADAS_LLM, FALLOS_LLM
+
+load_dotenv()
+
+# --- CONFIGURACIÓN ---
+MODELO_GROQ = "openai/gpt-oss-120b"
+LLM_PROVEEDORES = os.getenv("LLM_PROVEEDORES", f"groq:{MODELO_GROQ}")
+LLM_PLAZO_SEGUNDOS = float(os.getenv("LLM_PLAZO_SEGUNDOS", "30"))
+# 0 = sin peticiones de cobertura
+LLM_COBERTURA_PERCENTIL = float(os.getenv("LLM_COBERTURA_PERCENTIL", "95"))
+# Sin suficientes muestras no se sabe qué es "lento": no se cubre
+LLM_COBERTURA_MIN_MUESTRAS = int(os.getenv("LLM_COBERTURA_MIN_MUESTRAS", "20"))
+LLM_CIRCUITO_FALLOS = int(os.getenv("LLM_CIRCUITO_FALLOS", "3"))
+LLM_CIRCUITO_SEGUNDOS = float(os.getenv("LLM_CIRCUITO_SEGUNDOS", "30"))
+# Hilos para las llamadas síncronas (cada petición en curso ocupa uno o dos)
+LLM_HILOS = int(os.getenv("LLM_HILOS", "16"))
+_VENTANA_LATENCIAS = 200
+
+# --- CLAVES ---
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+LLM_OPENAI_API_KEY = os.getenv("LLM_OPENAI_API_KEY") or os.getenv("OPENAI_API_KEY") or "sin-clave"
+
+
+class LLMNoDisponible(Exception):
+    """Ningún proveedor respondió dentro del plazo (o todos tienen el circuito abierto)."""
+
+
+# ──────────────────────────────────────────────────────────────
+# CORTACIRCUITOS
+# ──────────────────────────────────────────────────────────────
+
+class Circuito:
+    """
+    cerrado → (N fallos seguidos) → abierto → (pasan `segundos_abierto`)
+    → semiabierto: una sola petición de prueba; si responde, cerrado; si no, abierto otra vez.
+    """
+
+    def __init__(self, fallos_para_abrir=LLM_CIRCUITO_FALLOS, segundos_abierto=LLM_CIRCUITO_SEGUNDOS):
+        self.fallos_para_abrir = fallos_para_abrir
+        self.segundos_abierto = segundos_abierto
+        self._lock = threading.Lock()
+        self._fallos = 0
+        self._abierto_desde = None
+        self._prueba_en_curso = False
+
+    @property
+    def estado(self) -> str:
+        if self._abierto_desde is None:
+            return "cerrado"
+        if time.monotonic() - self._abierto_desde < self.segundos_abierto:
+            return "abierto"
+        return "semiabierto"
+
+    def permite(self) -> bool:
+        """True si se puede llamar. En semiabierto reserva la petición de prueba."""
+        with self._lock:
+            estado = self.estado
+            if estado == "cerrado":
+                return True
+            if estado == "semiabierto" and not self._prueba_en_curso:
+                self._prueba_en_curso = True
+                return True
+            return False
+
+    def exito(self):
+        with self._lock:
+            self._fallos = 0
+            self._abierto_desde = None
+            self._prueba_en_curso = False
+
+    def fallo(self) -> bool:
+        """Registra un fallo. Retorna True si el circuito (re)abre."""
+        with self._lock:
+            self._fallos += 1
+            self._prueba_en_curso = False
+            if self._abierto_desde is not None or self._fallos >= self.fallos_para_abrir:
+                self._abierto_desde = time.monotonic()
+                return True
+            return False
+
+    def liberar(self):
+        """La petición se canceló sin resultado: no cuenta como éxito ni fallo."""
+        with self._lock:
+            self._prueba_en_curso = False
+
+
+# ──────────────────────────────────────────────────────────────
+# PROVEEDORES
+# ──────────────────────────────────────────────────────────────
+
+class Proveedor:
+    def __init__(self, nombre, llm):
+        self.nombre = nombre
+        self.llm = llm
+        self.circuito = Circuito()
+        # Segundos hasta la respuesta completa / hasta el primer fragmento
+        self._latencias = {
+            "completo": deque(maxlen=_VENTANA_LATENCIAS),
+            "stream":   deque(maxlen=_VENTANA_LATENCIAS),
+        }
+
+    def registrar_latencia(self, modo, segundos):
+        self._latencias[modo].append(segundos)
+
+    def umbral_cobertura(self, modo):
+        """Segundos tras los que conviene lanzar una petición de cobertura (None = no cubrir)."""
+        if LLM_COBERTURA_PERCENTIL <= 0:
+            return None
+        muestras = sorted(self._latencias[modo])
+        if len(muestras) < LLM_COBERTURA_MIN_MUESTRAS:
+            return None
+        indice = min(len(muestras) - 1, int(len(muestras) * LLM_COBERTURA_PERCENTIL / 100))
+        return muestras[indice]
+
+    def resumen(self) -> dict:
+        return {
+            "proveedor": self.nombre,
+            "circuito":  self.circuito.estado,
+            "p_cobertura_s": self.umbral_cobertura("completo"),
+        }
+
+
+def _crear_llm(tipo, modelo, base_url):
+    # Sin reintentos del SDK: el plazo y el respaldo los controla esta capa
+    comunes = {"model": modelo, "timeout": LLM_PLAZO_SEGUNDOS, "max_retries": 0}
+    if base_url:
+        comunes["base_url"] = base_url
+
+    if tipo == "groq":
+        if not GROQ_API_KEY:
+            raise ValueError("❌ Error: No se encontró la GROQ_API_KEY en el archivo .env")
+        from langchain_groq import ChatGroq
+        return ChatGroq(api_key=GROQ_API_KEY, **comunes)
+
+    if tipo == "openai":
+        try:
+            from langchain_openai import ChatOpenAI
+        except ImportError as e:
+            raise ImportError(
+                "Los proveedores 'openai:' requieren el paquete 'langchain-openai' (pip install langchain-openai)."
+            ) from e
+        return ChatOpenAI(api_key=LLM_OPENAI_API_KEY, **comunes)
+
+    raise ValueError(f"❌ Tipo de proveedor LLM desconocido: '{tipo}' (usa groq u openai)")
+
+
+def cargar_proveedores(especificacion: str = LLM_PROVEEDORES) -> list:
+    """Crea los proveedores de una especificación como la de LLM_PROVEEDORES."""
+    proveedores = []
+    for entrada in especificacion.split(","):
+        entrada = entrada.strip()
+        if not entrada:
+            continue
+        tipo, _, resto = entrada.partition(":")
+        modelo, _, base_url = resto.partition("@")
+        if not modelo:
+            raise ValueError(f"❌ Proveedor LLM sin modelo: '{entrada}' (formato tipo:modelo[@base_url])")
+        proveedores.append(Proveedor(entrada, _crear_llm(tipo.strip().lower(), modelo.strip(), base_url.strip())))
+    if not proveedores:
+        raise ValueError("❌ LLM_PROVEEDORES no contiene ningún proveedor.")
+    return proveedores
+
+
+_proveedores = None
+_lock_proveedores = threading.Lock()
+
+
+def obtener_proveedores() -> list:
+    """Proveedores del proceso (únicos: conservan circuitos y latencias entre cadenas)."""
+    global _proveedores
+    if _proveedores is None:
+        with _lock_proveedores:
+            if _proveedores is None:
+                _proveedores = cargar_proveedores()
+                print(f"🤖 [LLM] Proveedores: {', '.join(p.nombre for p in _proveedores)}")
+    return _proveedores
+
+
+def estado_proveedores() -> list:
+    return [p.resumen() for p in _proveedores or []]
+
+
+# ──────────────────────────────────────────────────────────────
+# CARRERA ENTRE PROVEEDORES
+# ──────────────────────────────────────────────────────────────
+
+class _Intento:
+    """Una petición a un proveedor. Registra su resultado en el circuito una sola vez."""
+
+    def __init__(self, proveedor, modo):
+        self.proveedor = proveedor
+        self.modo = modo
+        self.inicio = time.monotonic()
+        self._registrado = False
+        self._lock = threading.Lock()
+        LLAMADAS_LLM.incrementar(proveedor.nombre, modo)
+
+    def _primera_vez(self) -> bool:
+        with self._lock:
+            if self._registrado:
+                return False
+            self._registrado = True
+            return True
+
+    def exito(self):
+        if self._primera_vez():
+            self.proveedor.registrar_latencia(self.modo, time.monotonic() - self.inicio)
+            self.proveedor.circuito.exito()
+
+    def fallo(self, error):
+        if self._primera_vez():
+            print(f"⚠️ [LLM] {self.proveedor.nombre} falló: {error}")
+            FALLOS_LLM.incrementar(self.proveedor.nombre)
+            if self.proveedor.circuito.fallo():
+                print(f"🔌 [LLM] Circuito abierto para {self.proveedor.nombre} "
+                      f"({self.proveedor.circuito.segundos_abierto:.0f}s).")
+
+    def descartar(self):
+        if self._primera_vez():
+            self.proveedor.circuito.liberar()
+
+    def ejecutar(self, llamar):
+        try:
+            resultado = llamar(self.proveedor.llm)
+        except Exception as e:
+            self.fallo(e)
+            raise
+        self.exito()
+        return resultado
+
+    async def aejecutar(self, allamar):
+        try:
+            resultado = await allamar(self.proveedor.llm)
+        except asyncio.CancelledError:
+            raise   # quien cancela decide (descartar o fallo por plazo)
+        except Exception as e:
+            self.fallo(e)
+            raise
+        self.exito()
+        return resultado
+
+
+class _Turnos:
+    """Orden en que se prueban los proveedores dentro de una llamada."""
+
+    def __init__(self, proveedores):
+        self._pendientes = list(proveedores)
+        self._ultimo = None
+
+    def siguiente(self, modo, repetir_ultimo=False):
+        # El circuito se consulta al lanzar (no antes): permite() reserva la prueba en semiabierto
+        while self._pendientes:
+            proveedor = self._pendientes.pop(0)
+            if proveedor.circuito.permite():
+                self._ultimo = proveedor
+                return _Intento(proveedor, modo)
+        if repetir_ultimo and self._ultimo is not None and self._ultimo.circuito.permite():
+            return _Intento(self._ultimo, modo)
+        return None
+
+
+def _sin_respuesta(pendientes):
+    """Termina una carrera sin ganador: los intentos aún en curso cuentan como fallo por plazo."""
+    pendientes = list(pendientes)
+    if not pendientes:
+        raise LLMNoDisponible("Todos los proveedores del LLM fallaron.")
+    for intento in pendientes:
+        intento.fallo(f"plazo de {LLM_PLAZO_SEGUNDOS:g}s agotado")
+    raise LLMNoDisponible("Ningún proveedor del LLM respondió dentro del plazo.")
+
+
+_ejecutor = ThreadPoolExecutor(max_workers=LLM_HILOS, thread_name_prefix="llm")
+
+
+def _carrera(proveedores, modo, llamar, descartar=None):
+    """
+    Ejecuta llamar(llm) con plazo, respaldo y cobertura.
+    Retorna (proveedor, resultado) del primer intento que termina bien.
+    """
+    plazo = time.monotonic() + LLM_PLAZO_SEGUNDOS
+    turnos = _Turnos(proveedores)
+    en_curso = {}   # Future → _Intento
+    cubierto = False
+
+    def lanzar(intento):
+        if intento is None:
+            return False
+        en_curso[_ejecutor.submit(intento.ejecutar, llamar)] = intento
+        return True
+
+    def descartar_resto():
+        # Los intentos aún en curso terminan en su hilo y registran su propio
+        # resultado; si alguno responde después, su resultado se descarta
+        if descartar:
+            for otro in en_curso:
+                otro.add_done_callback(lambda f: f.exception() is None and descartar(f.result()))
+
+    if not lanzar(turnos.siguiente(modo)):
+        raise LLMNoDisponible("Todos los proveedores del LLM tienen el circuito abierto.")
+
+    while en_curso:
+        ahora = time.monotonic()
+        if ahora >= plazo:
+            break
+        espera = plazo - ahora
+        momento_cobertura = None
+        if not cubierto and len(en_curso) == 1:
+            intento = next(iter(en_curso.values()))
+            umbral = intento.proveedor.umbral_cobertura(modo)
+            if umbral is not None:
+                momento_cobertura = intento.inicio + umbral
+                espera = max(0.0, min(espera, momento_cobertura - ahora))
+
+        hechos, _ = wait(en_curso, timeout=espera, return_when=FIRST_COMPLETED)
+        for futuro in hechos:
+            intento = en_curso.pop(futuro)
+            if futuro.exception() is not None:
+                continue
+            descartar_resto()
+            return intento.proveedor, futuro.result()
+
+        if hechos:
+            if not en_curso:
+                lanzar(turnos.siguiente(modo))   # respaldo
+        elif momento_cobertura is not None and time.monotonic() >= momento_cobertura:
+            cubierto = True
+            cobertura = turnos.siguiente(modo, repetir_ultimo=True)
+            if cobertura is not None:
+                print(f"⏱️ [LLM] {intento.proveedor.nombre} supera su p{LLM_COBERTURA_PERCENTIL:g} "
+                      f"({umbral:.1f}s): petición de cobertura a {cobertura.proveedor.nombre}.")
+                lanzar(cobertura)
+
+    descartar_resto()
+    _sin_respuesta(en_curso.values())
+
+
+async def _acarrera(proveedores, modo, allamar, adescartar=None):
+    """Versión async de _carrera: los intentos son tareas y los perdedores se cancelan."""
+    plazo = time.monotonic() + LLM_PLAZO_SEGUNDOS
+    turnos = _Turnos(proveedores)
+    en_curso = {}   # Task → _Intento
+    cubierto = False
+
+    def lanzar(intento):
+        if intento is None:
+            return False
+        en_curso[asyncio.ensure_future(intento.aejecutar(allamar))] = intento
+        return True
+
+    async def cancelar_resto():
+        for tarea in en_curso:
+            tarea.cancel()
+        resultados = await asyncio.gather(*en_curso, return_exceptions=True)
+        for intento, resultado in zip(en_curso.values(), resultados):
+            # Un perdedor pudo terminar justo antes de la cancelación
+            if adescartar and not isinstance(resultado, BaseException):
+                await adescartar(resultado)
+            intento.descartar()
+        en_curso.clear()
+
+    if not lanzar(turnos.siguiente(modo)):
+        raise LLMNoDisponible("Todos los proveedores del LLM tienen el circuito abierto.")
+
+    try:
+        while en_curso:
+            ahora = time.monotonic()
+            if ahora >= plazo:
+                break
+            espera = plazo - ahora
+            momento_cobertura = None
+            if not cubierto and len(en_curso) == 1:
+                intento = next(iter(en_curso.values()))
+                umbral = intento.proveedor.umbral_cobertura(modo)
+                if umbral is not None:
+                    momento_cobertura = intento.inicio + umbral
+                    espera = max(0.0, min(espera, momento_cobertura - ahora))
+
+            hechos, _ = await asyncio.wait(en_curso, timeout=espera, return_when=asyncio.FIRST_COMPLETED)
+            for tarea in hechos:
+                intento = en_curso.pop(tarea)
+                if tarea.exception() is not None:
+                    continue
+                return intento.proveedor, tarea.result()   # finally cancela a los perdedores
+
+            if hechos:
+                if not en_curso:
+                    lanzar(turnos.siguiente(modo))
+            elif momento_cobertura is not None and time.monotonic() >= momento_cobertura:
+                cubierto = True
+                cobertura = turnos.siguiente(modo, repetir_ultimo=True)
+                if cobertura is not None:
+                    print(f"⏱️ [LLM] {intento.proveedor.nombre} supera su p{LLM_COBERTURA_PERCENTIL:g} "
+                          f"({umbral:.1f}s): petición de cobertura a {cobertura.proveedor.nombre}.")
+                    lanzar(cobertura)
+
+        _sin_respuesta(en_curso.values())
+    finally:
+        # También si cancelan la petición del alumno
+        await cancelar_resto()
+
+
+def _cerrar_stream(resultado):
+    _, fragmentos = resultado
+    if hasattr(fragmentos, "close"):
+        fragmentos.close()
+
+
+async def _acerrar_stream(resultado):
+    _, fragmentos = resultado
+    if hasattr(fragmentos, "aclose"):
+        await fragmentos.aclose()
+
+
+# ──────────────────────────────────────────────────────────────
+# RUNNABLE PARA LA CADENA RAG
+# ──────────────────────────────────────────────────────────────
+
+class LLMConRespaldo(Runnable):
+    """
+    Sustituye al modelo de chat en la cadena RAG (prompt | llm | StrOutputParser).
+    Recibe el prompt ya formateado y delega en los proveedores configurados.
+    """
+
+    def __init__(self, proveedores):
+        self.proveedores = proveedores
+
+    def invoke(self, entrada, config=None, **kwargs):
+        with medir("llm"):
+            _, respuesta = _carrera(
+                self.proveedores, "completo",
+                lambda llm: llm.invoke(entrada, config, **kwargs),
+            )
+        return respuesta
+
+    async def ainvoke(self, entrada, config=None, **kwargs):
+        async def llamar(llm):
+            return await llm.ainvoke(entrada, config, **kwargs)
+        with medir("llm"):
+            _, respuesta = await _acarrera(self.proveedores, "completo", llamar)
+        return respuesta
+
+    def stream(self, entrada, config=None, **kwargs):
+        # Se compite por el primer fragmento; el resto lo entrega el ganador
+        def primer_fragmento(llm):
+            fragmentos = iter(llm.stream(entrada, config, **kwargs))
+            return next(fragmentos, None), fragmentos
+
+        # En streaming se mide hasta el primer fragmento: el resto depende del cliente
+        with medir("llm_primer_fragmento"):
+            proveedor, (primero, fragmentos) = _carrera(
+                self.proveedores, "stream", primer_fragmento, descartar=_cerrar_stream
+            )
+        if primero is None:
+            return
+        yield primero
+        try:
+            yield from fragmentos
+        except Exception as e:
+            proveedor.circuito.fallo()
+            FALLOS_LLM.incrementar(proveedor.nombre)
+            raise LLMNoDisponible(f"{proveedor.nombre} falló a mitad de la respuesta: {e}") from e
+
+    async def astream(self, entrada, config=None, **kwargs):
+        async def primer_fragmento(llm):
+            fragmentos = llm.astream(entrada, config, **kwargs).__aiter__()
+            try:
+                return await fragmentos.__anext__(), fragmentos
+            except StopAsyncIteration:
+                return None, fragmentos
+
+        with medir("llm_primer_fragmento"):
+            proveedor, (primero, fragmentos) = await _acarrera(
+                self.proveedores, "stream", primer_fragmento, adescartar=_acerrar_stream
+            )
+        if primero is None:
+            return
+        yield primero
+        try:
+            async for fragmento in fragmentos:
+                yield fragmento
+        except Exception as e:
+            proveedor.circuito.fallo()
+            FALLOS_LLM.incrementar(proveedor.nombre)
+            raise LLMNoDisponible(f"{proveedor.nombre} falló a mitad de la respuesta: {e}") from e
+
+
+def crear_llm() -> LLMConRespaldo:
+    return LLMConRespaldo(obtener_proveedores())
@@ -0,0 +1,52 @@
+# models/shards.py
+"""
+Particiones ("shards") de la base de conocimiento por programa educativo.
+
+Con SHARDS_POR_PROGRAMA=1, cada FAQ y cada documento del registro pertenece
+a un shard: el del programa que lo originó o el compartido "general". Una
+pregunta solo busca en el shard de su programa y en el general, tanto en el
+caché semántico (KNN) como en la recuperación del RAG (un índice por shard en
+Chroma y en BM25), y cada shard se reentrena por separado.
+
+Desactivado (por defecto), todo vive en el shard general y el
+comportamiento es el de un único índice global.
+"""
+import os
+
+from models.normalizacion import normalizar_texto
+
+# --- CONFIGURACIÓN ---
+SHARDS_POR_PROGRAMA = os.getenv("SHARDS_POR_PROGRAMA", "0").strip().lower() in ("1", "true", "si")
+SHARD_GENERAL = "general"
+
+
+def activo() -> bool:
+    return SHARDS_POR_PROGRAMA
+
+
+def shard_de(programa) -> str:
+    """
+    Shard de un programa ("Ingeniería Química" → "ingenieria-quimica").
+    Sin programa, o con los shards desactivados, es el general. El nombre
+    solo usa [a-z0-9-] para poder formar nombres de colecciones y archivos.
+    """
+    if not SHARDS_POR_PROGRAMA or not programa:
+        return SHARD_GENERAL
+    nombre = normalizar_texto(programa).replace('ñ', 'n').replace(' ', '-')
+    return nombre or SHARD_GENERAL
+
+
+def shards_consulta(programa) -> tuple:
+    """Shards en los que busca una pregunta del programa: el propio y el general."""
+    shard = shard_de(programa)
+    return (SHARD_GENERAL,) if shard == SHARD_GENERAL else (shard, SHARD_GENERAL)
+
+
+def campo(shard: str) -> str | None:
+    """Valor del campo shard de una FAQ en MongoDB (las del general no lo guardan)."""
+    return None if shard == SHARD_GENERAL else shard
+
+
+def sufijo(shard: str) -> str:
+    """Sufijo para nombres de colecciones y archivos ("" para el general: nombres de siempre)."""
+    return "" if shard == SHARD_GENERAL else f"__{shard}"
@@ -0,0 +1,101 @@
+# models/vectorstore.py
+"""
+Acceso al vectorstore de documentos (Chroma), compartido por el
+entrenamiento (data/admin_db.py) y la consulta RAG (models/modelo_llm.py).
+
+Se elige con la variable de entorno VECTORSTORE_BACKEND:
+- "cloud" (por defecto): Chroma Cloud. Requiere CHROMA_API_KEY, CHROMA_TENANT y
+  CHROMA_DATABASE, y limita la colección a CHROMA_MAX_RECORDS fragmentos (cuota del plan).
+- "local": Chroma embebido y persistente en CHROMA_PATH (data/chroma_db_web).
+  Sin límite de fragmentos y sin viaje de red: la búsqueda ocurre dentro del
+  proceso. El directorio debe sobrevivir a los reinicios (disco persistente);
+  si no, hay que volver a entrenar desde el panel admin tras cada despliegue.
+
+Con SHARDS_POR_PROGRAMA=1 cada shard tiene su colección (ver models/shards.py):
+la del general conserva el nombre CHROMA_COLLECTION.
+"""
+import os
+import threading
+from dotenv import load_dotenv
+
+from models.shards import SHARD_GENERAL, sufijo
+
+load_dotenv()
+
+current_dir  = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+
+# --- CONFIGURACIÓN ---
+VECTORSTORE_BACKEND = os.getenv("VECTORSTORE_BACKEND", "cloud").strip().lower()
+CHROMA_PATH = os.getenv("CHROMA_PATH", os.path.join(project_root, 'data', 'chroma_db_web'))
+CHROMA_COLLECTION = "goit_vectores"
+
+# Chroma Cloud: el plan gratuito admite 300 registros; se deja margen de seguridad.
+CHROMA_MAX_RECORDS = 280
+
+CHROMA_API_KEY = os.getenv("CHROMA_API_KEY")
+CHROMA_TENANT = os.getenv("CHROMA_TENANT")
+CHROMA_DATABASE = os.getenv("CHROMA_DATABASE")
+
+if VECTORSTORE_BACKEND not in ("cloud", "local"):
+    raise ValueError(f"❌ VECTORSTORE_BACKEND desconocido: '{VECTORSTORE_BACKEND}' (usa cloud o local)")
+
+_cliente_local = None
+_lock_cliente = threading.Lock()
+
+
+def es_local() -> bool:
+    return VECTORSTORE_BACKEND == "local"
+
+
+def nombre_backend() -> str:
+    """Nombre legible para los mensajes de entrenamiento y de arranque."""
+    return "Chroma local" if es_local() else "Chroma Cloud"
+
+
+def limite_registros() -> int | None:
+    """Máximo de fragmentos que admite el backend (None = sin límite)."""
+    return None if es_local() else CHROMA_MAX_RECORDS
+
+
+def crear_cliente():
+    """
+    Cliente de Chroma del backend configurado. El cliente local es único
+    por proceso: abrir varios PersistentClient sobre el mismo directorio
+    no es seguro.
+    """
+    import chromadb
+
+    if not es_local():
+        if not CHROMA_API_KEY:
+            raise ValueError("❌ Error: No se encontró la CHROMA_API_KEY en el archivo .env")
+        return chromadb.CloudClient(
+            api_key=CHROMA_API_KEY,
+            tenant=CHROMA_TENANT,
+            database=CHROMA_DATABASE
+        )
+
+    global _cliente_local
+    if _cliente_local is None:
+        with _lock_cliente:
+            if _cliente_local is None:
+                os.makedirs(CHROMA_PATH, exist_ok=True)
+                _cliente_local = chromadb.PersistentClient(path=CHROMA_PATH)
+    return _cliente_local
+
+
+def nombre_coleccion(shard: str = SHARD_GENERAL) -> str:
+    return f"{CHROMA_COLLECTION}{sufijo(shard)}"
+
+
+def colecciones_existentes(cliente) -> set:
+    return {c.name for c in cliente.list_collections()}
+
+
+def registros_coleccion(cliente, nombre: str) -> int:
+    """Fragmentos guardados en la colección (cuentan para el límite de registros)."""
+    return cliente.get_collection(nombre).count()
+
+
+def existe_coleccion(cliente, nombre: str = CHROMA_COLLECTION) -> bool:
+    return nombre in colecciones_existentes(cliente)
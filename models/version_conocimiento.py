@@ -0,0 +1,64 @@
+# models/version_conocimiento.py
+"""
+Versión de la base de conocimiento (documentos vectorizados para el RAG).
+
+Cada entrenamiento desde el panel admin incrementa el número guardado en
+data/kb_version.json. Los cachés que dependen de los documentos (p. ej. la
+recuperación del RAG) incluyen la versión en su clave, así que un
+reentrenamiento los invalida en todos los workers del mismo servidor sin
+coordinación adicional. Leer la versión solo cuesta un os.stat: el archivo se
+vuelve a leer únicamente cuando cambia su fecha de modificación.
+"""
+import os
+import json
+import threading
+from datetime import datetime
+
+current_dir  = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+
+RUTA_VERSION = os.path.join(project_root, 'data', 'kb_version.json')
+
+_lock = threading.Lock()
+_mtime_leido = None
+_version = 0
+
+
+def version_actual() -> int:
+    """Versión vigente (0 si nunca se ha entrenado con control de versión)."""
+    global _mtime_leido, _version
+    try:
+        mtime = os.stat(RUTA_VERSION).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+    if mtime != _mtime_leido:
+        with _lock:
+            if mtime != _mtime_leido:
+                try:
+                    with open(RUTA_VERSION, 'r', encoding='utf-8') as f:
+                        _version = int(json.load(f)["version"])
+                    _mtime_leido = mtime
+                except Exception as e:
+                    print(f"⚠️ [KB] No se pudo leer {RUTA_VERSION}: {e}")
+    return _version
+
+
+def incrementar_version() -> int:
+    """Marca la base de conocimiento como modificada. Retorna la versión nueva."""
+    with _lock:
+        nueva = _leer_sin_cache() + 1
+        temporal = f"{RUTA_VERSION}.tmp"
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump({"version": nueva, "actualizado": datetime.now().isoformat(timespec='seconds')}, f)
+        os.replace(temporal, RUTA_VERSION)
+    print(f"🔖 [KB] Base de conocimiento en versión {nueva}.")
+    return nueva
+
+
+def _leer_sin_cache() -> int:
+    try:
+        with open(RUTA_VERSION, 'r', encoding='utf-8') as f:
+            return int(json.load(f)["version"])
+    except (FileNotFoundError, ValueError, KeyError):
+        return 0
@@ -48,20 +48,36 @@ try:
         insert_faq, update_faq_by_id, delete_faq_by_id, toggle_faq_block
     )
     from models import modelo_knn as _modelo_knn
+    from models import shards as _shards
+    from logic.compactacion_faq import compactar_faqs, UMBRAL_COMPACTACION
 except ImportError as e:
     print(f"❌ Error importando módulos locales: {e}")
     def obtener_estadisticas_diarias(): return {}
     def obtener_todos_los_registros(): return []
-    def actualizar_base_datos_completa(reg): pass
+    def actualizar_base_datos_completa(reg, programa=None): pass
     def get_all_chat_logs(limit=500): return []
     def get_all_faq_admin(): return []
-    def insert_faq(p, r): pass
+    def insert_faq(p, r, origen="manual"): return ""
     def update_faq_by_id(i, p, r): return False
     def delete_faq_by_id(i): return False
     def toggle_faq_block(i): return False
     class _modelo_knn:
         @staticmethod
-        def inicializar_knn(): pass
+        def agregar_faq(i, p, r, b=False): pass
+        @staticmethod
+        def actualizar_faq(i, p, r): pass
+        @staticmethod
+        def eliminar_faq(i): pass
+        @staticmethod
+        def marcar_bloqueo(i, b): pass
+    class _shards:
+        @staticmethod
+        def activo(): return False
+        @staticmethod
+        def shard_de(programa): return "general"
+    UMBRAL_COMPACTACION = 0.08
+    def compactar_faqs(umbral=0.08, aplicar=False):
+        return {"umbral": umbral, "total_faqs": 0, "grupos": [], "eliminadas": 0, "aplicado": False}
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
@@ -146,7 +162,8 @@ def dashboard():
                            stats=stats,
                            access_logs=access_logs,
                            chat_logs=chat_logs,
-                           faqs=faqs)
+                           faqs=faqs,
+                           shards_activos=_shards.activo())
 
 # ==========================================
 # 5. GESTIÓN DE PDF (SUBIR, BORRAR, EDITAR)
@@ -178,11 +195,16 @@ def upload_pdf():
         if 'pdfs' not in registry: registry['pdfs'] = []
 
         if not any(c['filename'] == filename for c in registry['pdfs']):
-            registry['pdfs'].append({
+            item = {
                 "filename": filename,
                 "path": rel_path,
                 "status": "En espera" 
-            })
+            }
+            # Shard del documento (solo con SHARDS_POR_PROGRAMA; vacío = general)
+            programa = request.form.get('programa', '').strip()
+            if programa:
+                item["programa"] = programa
+            registry['pdfs'].append(item)
             save_registry(registry)
             flash('PDF cargado correctamente.', 'success')
         else:
@@ -285,11 +307,15 @@ def add_url():
         if 'urls' not in registry: registry['urls'] = []
 
         if not any(u['url'] == url for u in registry['urls']):
-            registry['urls'].append({
+            item = {
                 "name": name,
                 "url": url,
                 "status": "En espera"
-            })
+            }
+            programa = request.form.get('programa', '').strip()
+            if programa:
+                item["programa"] = programa
+            registry['urls'].append(item)
             save_registry(registry)
             flash('URL agregada.', 'success')
         else:
@@ -345,9 +371,12 @@ def train_stream():
     El navegador se conecta aquí y recibe texto línea por línea.
     """
     registry = load_registry()
-    
+
+    # ?programa=... reentrena solo ese shard (SHARDS_POR_PROGRAMA)
+    programa = request.args.get('programa', '').strip() or None
+
     # Obtenemos el generador
-    generador = actualizar_base_datos_completa(registry)
+    generador = actualizar_base_datos_completa(registry, programa)
     
     # Retornamos una respuesta de tipo streaming
     return Response(stream_with_context(generador), mimetype='text/event-stream')
@@ -361,10 +390,17 @@ def train_complete():
     """
     registry = load_registry()
 
+    # Si se reentrenó un solo shard, solo sus documentos pasan a 'Activo'
+    programa = request.args.get('programa', '').strip()
+    def entrenado(item):
+        return not programa or _shards.shard_de(item.get('programa')) == _shards.shard_de(programa)
+
     # Actualizamos estados a 'Activo'
     if 'pdfs' in registry:
-        for item in registry['pdfs']: item['status'] = 'Activo'
-    for item in registry.get('urls', []): item['status'] = 'Activo'
+        for item in registry['pdfs']:
+            if entrenado(item): item['status'] = 'Activo'
+    for item in registry.get('urls', []):
+        if entrenado(item): item['status'] = 'Activo'
 
     save_registry(registry)
     return {"status": "ok", "message": "Estados actualizados"}
@@ -375,12 +411,15 @@ def train_complete():
 
 from flask import jsonify as _jsonify
 
-def _reload_knn():
-    """Recarga el modelo KNN después de cambios en las FAQs."""
+def _actualizar_knn(operacion, *args):
+    """
+    Aplica al índice KNN un cambio puntual en las FAQs.
+    Solo se recalcula el embedding de la pregunta afectada, no el de toda la colección.
+    """
     try:
-        _modelo_knn.inicializar_knn()
+        operacion(*args)
     except Exception as e:
-        print(f"⚠️ Error recargando KNN tras cambio en FAQ: {e}")
+        print(f"⚠️ Error actualizando KNN tras cambio en FAQ: {e}")
 
 
 @admin_bp.route('/faq/add', methods=['POST'])
@@ -394,8 +433,8 @@ def faq_add():
         return _jsonify({"status": "error", "message": "Pregunta y respuesta son obligatorias."}), 400
 
     try:
-        insert_faq(pregunta, respuesta)
-        _reload_knn()
+        faq_id = insert_faq(pregunta, respuesta)
+        _actualizar_knn(_modelo_knn.agregar_faq, faq_id, pregunta, respuesta)
         return _jsonify({"status": "ok", "message": "FAQ agregada correctamente."})
     except Exception as e:
         return _jsonify({"status": "error", "message": str(e)}), 500
@@ -416,7 +455,7 @@ def faq_edit():
         actualizado = update_faq_by_id(faq_id, pregunta, respuesta)
         if not actualizado:
             return _jsonify({"status": "error", "message": "No se encontró la FAQ."}), 404
-        _reload_knn()
+        _actualizar_knn(_modelo_knn.actualizar_faq, faq_id, pregunta, respuesta)
         return _jsonify({"status": "ok", "message": "FAQ actualizada correctamente."})
     except Exception as e:
         return _jsonify({"status": "error", "message": str(e)}), 500
@@ -435,7 +474,7 @@ def faq_delete():
         eliminado = delete_faq_by_id(faq_id)
         if not eliminado:
             return _jsonify({"status": "error", "message": "No se encontró la FAQ."}), 404
-        _reload_knn()
+        _actualizar_knn(_modelo_knn.eliminar_faq, faq_id)
         return _jsonify({"status": "ok", "message": "FAQ eliminada correctamente."})
     except Exception as e:
         return _jsonify({"status": "error", "message": str(e)}), 500
@@ -452,12 +491,40 @@ def faq_toggle_block():
 
     try:
         nuevo_estado = toggle_faq_block(faq_id)
-        _reload_knn()
+        _actualizar_knn(_modelo_knn.marcar_bloqueo, faq_id, nuevo_estado)
         estado_texto = "bloqueada" if nuevo_estado else "desbloqueada"
         return _jsonify({
             "status": "ok",
             "bloqueado": nuevo_estado,
             "message": f"FAQ {estado_texto} correctamente."
         })
+    except Exception as e:
+        return _jsonify({"status": "error", "message": str(e)}), 500
+
+
+@admin_bp.route('/faq/compact', methods=['POST'])
+@login_required
+def faq_compact():
+    """
+    Fusiona FAQs casi duplicadas (ver logic/compactacion_faq.py).
+    Con "aplicar": false (por defecto) solo devuelve el plan.
+    """
+    data = request.get_json(silent=True) or {}
+    aplicar = bool(data.get('aplicar', False))
+
+    try:
+        umbral = float(data.get('umbral', UMBRAL_COMPACTACION))
+    except (TypeError, ValueError):
+        return _jsonify({"status": "error", "message": "Umbral inválido."}), 400
+    if not 0 < umbral < 1:
+        return _jsonify({"status": "error", "message": "El umbral debe estar entre 0 y 1."}), 400
+
+    try:
+        resumen = compactar_faqs(umbral=umbral, aplicar=aplicar)
+        if aplicar:
+            mensaje = f"{resumen['eliminadas']} FAQ(s) fusionadas en {len(resumen['grupos'])} grupo(s)."
+        else:
+            mensaje = f"{resumen['eliminadas']} FAQ(s) se fusionarían en {len(resumen['grupos'])} grupo(s)."
+        return _jsonify({"status": "ok", "message": mensaje, "resumen": resumen})
     except Exception as e:
         return _jsonify({"status": "error", "message": str(e)}), 500
\ No newline at end of file
@@ -1,7 +1,8 @@
-from flask import Blueprint, render_template, request, jsonify, redirect, url_for
+from flask import Blueprint, render_template, request, jsonify, redirect, url_for, Response, stream_with_context
 import sys
 import os
 import re
+import json
 
 # Configuración de rutas
 current_dir   = os.path.dirname(os.path.abspath(__file__))
@@ -9,22 +10,22 @@ project_root  = os.path.dirname(current_dir)
 template_dir  = os.path.join(project_root, 'templates')
 logic_dir     = os.path.join(project_root, 'logic')
 models_dir    = os.path.join(project_root, 'models')
-data_dir_chroma = os.path.join(project_root, 'data', 'chroma_db_web')
 
 if project_root not in sys.path:
     sys.path.append(project_root)
 
 # --- IMPORTS DE BASE DE DATOS (MongoDB) ---
-from database import faq_collection, insert_faq, update_faq
+from database import find_faq_by_pregunta, insert_faq, update_faq_by_id
 
 # --- IMPORTS DE MODELOS ---
 from models import modelo_knn
-from models import modelo_llm
-modelo_llm.CHROMA_PATH = data_dir_chroma
-from logic.seleccion_modelo import SelectorDeModelo
+from models import shards
+from models.metricas import medir, contar_error
+from logic.seleccion_modelo import SelectorDeModelo, debe_aprenderse
 
 # --- IMPORTS DE LÓGICA ---
 from logic.access_tracker import registrar_acceso, registrar_pregunta
+from logic.cola_escritura import encolar
 
 chatbot_bp = Blueprint('chatbot', __name__, template_folder=template_dir)
 
@@ -32,34 +33,68 @@ chatbot_bp = Blueprint('chatbot', __name__, template_folder=template_dir)
 MATRICULA_REGEX = re.compile(r'^[Ss]\d{8}$')
 
 # El selector se crea inmediatamente pero NO hace ninguna llamada de red en __init__.
-# Toda la inicialización de KNN y LLM ocurre de forma diferida en la primera consulta.
+# KNN y LLM se cargan en segundo plano al arrancar cada worker (logic/calentamiento.py);
+# si aún no están listos, la primera consulta los inicializa de forma diferida.
 selector = SelectorDeModelo(usar_knn=True, usar_llm=True)
-print("✅ Selector de modelos creado (inicialización de red diferida a la primera consulta).")
+print(f"✅ Selector de modelos creado (umbral KNN={selector.UMBRAL_DISTANCIA_COSINE}, inicialización de red en segundo plano).")
 
 
 # ──────────────────────────────────────────────────────────────
 # GUARDAR EN FAQ (MongoDB)
 # ──────────────────────────────────────────────────────────────
 
-def guardar_faq_db(pregunta: str, respuesta: str) -> None:
-    """Inserta o actualiza una FAQ no bloqueada; después recarga el modelo KNN."""
+def guardar_faq_db(pregunta: str, respuesta: str, programa: str = "") -> None:
+    """
+    Inserta o actualiza una FAQ no bloqueada; después aplica el cambio al
+    índice KNN de forma incremental (solo se calcula el embedding de esa pregunta).
+
+    Con SHARDS_POR_PROGRAMA la FAQ pertenece al shard del programa: la
+    respuesta se generó con sus documentos.
+    """
     try:
-        registro_existente = faq_collection.find_one({"pregunta": pregunta})
+        _guardar_faq_db(pregunta, respuesta, shards.shard_de(programa))
+    except Exception as e:
+        contar_error("escritura_faq")
+        print(f"❌ Error en DB FAQ: {e}")
+
+
+def guardar_faqs(pendientes: list) -> None:
+    """
+    Destino de la cola de escrituras diferidas: [(pregunta, respuesta, programa), ...]
+    en orden. Un error de MongoDB se propaga para que la cola reintente; las FAQs
+    ya guardadas salen de `pendientes` y no se repiten.
+    """
+    while pendientes:
+        pregunta, respuesta, programa = pendientes[0]
+        _guardar_faq_db(pregunta, respuesta, shards.shard_de(programa))
+        del pendientes[0]
+
+
+def _guardar_faq_db(pregunta, respuesta, shard):
+    """Los errores de MongoDB se propagan; los del índice KNN se registran aquí."""
+    with medir("escritura_faq"):
+        # También encuentra la FAQ si `pregunta` es un alias de una FAQ compactada
+        registro_existente = find_faq_by_pregunta(
+            pregunta, shards.campo(shard), solo_shard=shards.activo()
+        )
         if registro_existente:
             # No sobreescribir si está bloqueada
             if registro_existente.get('bloqueado', False):
                 return
-            update_faq(pregunta, respuesta)
+            faq_id = str(registro_existente['_id'])
+            pregunta = registro_existente['pregunta']
+            update_faq_by_id(faq_id, pregunta, respuesta)
+            operacion = modelo_knn.actualizar_faq
         else:
-            insert_faq(pregunta, respuesta)
+            # "auto": aprendida del LLM, sujeta a desalojo (ver logic/cache_semantico.py)
+            faq_id = insert_faq(pregunta, respuesta, origen="auto", shard=shards.campo(shard))
+            operacion = lambda i, p, r: modelo_knn.agregar_faq(i, p, r, shard=shard)
 
         try:
-            modelo_knn.inicializar_knn()
+            operacion(faq_id, pregunta, respuesta)
         except Exception as e:
-            print(f"⚠️ Error recargando KNN: {e}")
-
-    except Exception as e:
-        print(f"❌ Error en DB FAQ: {e}")
+            contar_error("escritura_faq")
+            print(f"⚠️ Error actualizando KNN: {e}")
 
 
 # ──────────────────────────────────────────────────────────────
@@ -90,52 +125,131 @@ def chat():
     if not user_input:
         return jsonify({"reply": "Por favor escribe algo."})
 
-    # Formatear historial como texto para el LLM
-    # Se espera una lista de {role: 'user'|'assistant', content: '...'}
-    historial_texto = ""
-    if isinstance(history_raw, list) and history_raw:
-        lineas = []
-        for entrada in history_raw[-8:]:   # máximo 4 intercambios (8 turnos)
-            if not isinstance(entrada, dict):
-                continue
-            rol     = entrada.get("role", "")
-            content = str(entrada.get("content", "")).strip()
-            if not content:
-                continue
-            if rol == "user":
-                lineas.append(f"Usuario: {content}")
-            elif rol == "assistant":
-                lineas.append(f"Asistente: {content}")
-        historial_texto = "\n".join(lineas)
+    historial_texto = formatear_historial(history_raw)
 
     forzar_llm = (mode == 'regenerate')
 
+    if data.get("stream"):
+        return _chat_stream(user_input, historial_texto, forzar_llm, matricula, programa)
+
     # selector.responder retorna (respuesta, fuente, bloqueado)
     respuesta_limpia, fuente, bloqueado = selector.responder(
-        user_input, historial=historial_texto, forzar_llm=forzar_llm
+        user_input, historial=historial_texto, forzar_llm=forzar_llm, programa=programa
     )
 
-    # Guardar en FAQ cuando responde el LLM (nunca si está bloqueado)
-    if "LLM" in fuente and not bloqueado:
-        guardar_faq_db(user_input, respuesta_limpia)
+    _despues_de_responder(user_input, respuesta_limpia, fuente, bloqueado, matricula, programa)
+
+    return jsonify({
+        "reply":    respuesta_limpia,
+        "model":    fuente,
+        "bloqueado": bloqueado,
+    })
+
+
+def ip_cliente(reenviadas: list, ip_remota: str) -> str:
+    """IP del alumno: el primer encabezado X-Forwarded-For (detrás de un proxy) o la del socket."""
+    return reenviadas[0] if reenviadas else ip_remota
+
+
+def formatear_historial(history_raw) -> str:
+    """
+    Formatea el historial como texto para el LLM.
+    Se espera una lista de {role: 'user'|'assistant', content: '...'}
+    """
+    if not isinstance(history_raw, list) or not history_raw:
+        return ""
+    lineas = []
+    for entrada in history_raw[-8:]:   # máximo 4 intercambios (8 turnos)
+        if not isinstance(entrada, dict):
+            continue
+        rol     = entrada.get("role", "")
+        content = str(entrada.get("content", "")).strip()
+        if not content:
+            continue
+        if rol == "user":
+            lineas.append(f"Usuario: {content}")
+        elif rol == "assistant":
+            lineas.append(f"Asistente: {content}")
+    return "\n".join(lineas)
+
+
+def _despues_de_responder(pregunta, respuesta, fuente, bloqueado, matricula, programa):
+    """
+    Aprende la respuesta del LLM como FAQ y registra la pregunta del alumno.
+    Ambas escrituras se encolan (logic/cola_escritura.py): no retrasan la respuesta.
+    """
+    # Guardar en FAQ cuando responde el LLM (nunca si está bloqueado ni si la
+    # respuesta se compartió con otra petición: esa ya la guarda)
+    if debe_aprenderse(fuente, bloqueado):
+        if not encolar(guardar_faqs, (pregunta, respuesta, programa)):
+            guardar_faq_db(pregunta, respuesta, programa)
 
     # Registrar la pregunta asociada a la matrícula
     try:
         registrar_pregunta(
             matricula = matricula,
             programa  = programa,
-            pregunta  = user_input,
-            respuesta = respuesta_limpia,
+            pregunta  = pregunta,
+            respuesta = respuesta,
             modelo    = fuente,
         )
     except Exception as e:
         print(f"⚠️ Error registrando pregunta: {e}")
 
-    return jsonify({
-        "reply":    respuesta_limpia,
-        "model":    fuente,
-        "bloqueado": bloqueado,
-    })
+
+def evento_sse(evento: str, datos: dict) -> str:
+    return f"event: {evento}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
+
+def _chat_stream(user_input, historial_texto, forzar_llm, matricula, programa):
+    """
+    Modo streaming de /chat (cliente envía "stream": true).
+
+    Los aciertos del caché se devuelven como JSON de inmediato, igual que en
+    el modo normal. Las respuestas del LLM se envían como Server-Sent Events:
+      event: token → {"t": fragmento}
+      event: fin   → {"reply", "model", "bloqueado"} (texto completo definitivo)
+    La escritura en FAQ y el registro de la pregunta se hacen al terminar el
+    stream, solo si la respuesta se generó completa.
+    """
+    resultado = selector.responder_stream(
+        user_input, historial=historial_texto, forzar_llm=forzar_llm, programa=programa
+    )
+
+    if not resultado.en_stream:
+        _despues_de_responder(user_input, resultado.respuesta, resultado.fuente,
+                              resultado.bloqueado, matricula, programa)
+        return jsonify({
+            "reply":    resultado.respuesta,
+            "model":    resultado.fuente,
+            "bloqueado": resultado.bloqueado,
+        })
+
+    def eventos():
+        for fragmento in resultado:
+            if fragmento:
+                yield evento_sse("token", {"t": fragmento})
+        yield evento_sse("fin", {
+            "reply":    resultado.respuesta,
+            "model":    resultado.fuente,
+            "bloqueado": resultado.bloqueado,
+        })
+        # Si el cliente se desconecta antes, el generador se cierra en el
+        # yield anterior y la respuesta parcial no se guarda.
+        _despues_de_responder(user_input, resultado.respuesta, resultado.fuente,
+                              resultado.bloqueado, matricula, programa)
+
+    respuesta = Response(
+        stream_with_context(eventos()),
+        mimetype='text/event-stream',
+        headers={
+            "Cache-Control":     "no-cache",
+            "X-Accel-Buffering": "no",   # evita que un proxy (nginx) acumule la respuesta
+        },
+    )
+    # Si el cliente se va antes de leer nada, la generación compartida se libera igual
+    respuesta.call_on_close(resultado.cerrar)
+    return respuesta
 
 
 # ──────────────────────────────────────────────────────────────
@@ -155,10 +269,7 @@ def register_access():
     if matricula and not MATRICULA_REGEX.match(matricula):
         return jsonify({"status": "error", "message": "Formato de matrícula inválido"}), 400
 
-    if request.headers.getlist("X-Forwarded-For"):
-        user_ip = request.headers.getlist("X-Forwarded-For")[0]
-    else:
-        user_ip = request.remote_addr
+    user_ip = ip_cliente(request.headers.getlist("X-Forwarded-For"), request.remote_addr)
 
     user_agent = request.headers.get('User-Agent', '')
 
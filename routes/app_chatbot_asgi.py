@@ -0,0 +1,169 @@
+# --- app_chatbot_asgi.py ---
+"""
+Versión async (Starlette) de las rutas /chat y /api/register_access.
+
+Se montan delante de la app Flask en asgi.py: mientras una conversación
+espera al proveedor de embeddings, a Chroma, al LLM o a MongoDB, el event
+loop atiende otras, de modo que un solo worker sostiene cientos de
+peticiones en curso. El resto de la web sigue siendo Flask.
+
+Mismo contrato JSON/SSE que las rutas de routes/app_chatbot.py.
+"""
+import asyncio
+import sys
+import os
+
+from starlette.background import BackgroundTask
+from starlette.responses import JSONResponse, RedirectResponse, StreamingResponse
+from starlette.routing import Route
+
+# Configuración de rutas
+current_dir  = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+# Mismo selector (y caché KNN) que la versión Flask
+from routes.app_chatbot import (
+    selector, guardar_faq_db, guardar_faqs, formatear_historial, evento_sse, ip_cliente,
+    MATRICULA_REGEX,
+)
+from logic.access_tracker import aregistrar_acceso, aregistrar_pregunta
+from logic.cola_escritura import encolar
+from logic.seleccion_modelo import debe_aprenderse
+
+
+# ──────────────────────────────────────────────────────────────
+# RUTA CHAT
+# ──────────────────────────────────────────────────────────────
+
+async def _despues_de_responder(pregunta, respuesta, fuente, bloqueado, matricula, programa):
+    """
+    Aprende la respuesta del LLM como FAQ y registra la pregunta (tras enviar la
+    respuesta). Ambas van a la cola de escrituras diferidas; si está llena, se
+    escriben aquí.
+    """
+    if debe_aprenderse(fuente, bloqueado):
+        if not encolar(guardar_faqs, (pregunta, respuesta, programa)):
+            # Escritura en FAQ + embedding incremental del KNN: síncrono, en un hilo
+            await asyncio.to_thread(guardar_faq_db, pregunta, respuesta, programa)
+
+    await aregistrar_pregunta(
+        matricula = matricula,
+        programa  = programa,
+        pregunta  = pregunta,
+        respuesta = respuesta,
+        modelo    = fuente,
+    )
+
+
+async def chat(request):
+    if request.method == 'GET':
+        return RedirectResponse('/chatbot', status_code=302)
+
+    data       = await request.json()
+    user_input = data.get("message", "").strip()
+    mode       = data.get("mode", "normal")
+    matricula  = data.get("matricula", "").strip().upper()
+    programa   = data.get("programa", "").strip()
+
+    if not user_input:
+        return JSONResponse({"reply": "Por favor escribe algo."})
+
+    historial_texto = formatear_historial(data.get("history", []))
+    forzar_llm = (mode == 'regenerate')
+
+    if data.get("stream"):
+        return await _chat_stream(user_input, historial_texto, forzar_llm, matricula, programa)
+
+    respuesta_limpia, fuente, bloqueado = await selector.aresponder(
+        user_input, historial=historial_texto, forzar_llm=forzar_llm, programa=programa
+    )
+
+    return JSONResponse(
+        {"reply": respuesta_limpia, "model": fuente, "bloqueado": bloqueado},
+        background=BackgroundTask(
+            _despues_de_responder, user_input, respuesta_limpia, fuente, bloqueado, matricula, programa
+        ),
+    )
+
+
+async def _chat_stream(user_input, historial_texto, forzar_llm, matricula, programa):
+    """Modo streaming (ver _chat_stream en routes/app_chatbot.py)."""
+    resultado = await selector.aresponder_stream(
+        user_input, historial=historial_texto, forzar_llm=forzar_llm, programa=programa
+    )
+
+    if not resultado.en_stream:
+        return JSONResponse(
+            {"reply": resultado.respuesta, "model": resultado.fuente, "bloqueado": resultado.bloqueado},
+            background=BackgroundTask(
+                _despues_de_responder, user_input, resultado.respuesta, resultado.fuente,
+                resultado.bloqueado, matricula, programa
+            ),
+        )
+
+    completo = False
+
+    async def eventos():
+        nonlocal completo
+        async for fragmento in resultado:
+            if fragmento:
+                yield evento_sse("token", {"t": fragmento})
+        yield evento_sse("fin", {
+            "reply":    resultado.respuesta,
+            "model":    resultado.fuente,
+            "bloqueado": resultado.bloqueado,
+        })
+        completo = True
+
+    async def al_terminar():
+        # Libera la generación compartida aunque el stream no llegara a leerse
+        await resultado.acerrar()
+        # Si el cliente se desconectó a mitad, la respuesta parcial no se guarda
+        if completo:
+            await _despues_de_responder(user_input, resultado.respuesta, resultado.fuente,
+                                        resultado.bloqueado, matricula, programa)
+
+    return StreamingResponse(
+        eventos(),
+        media_type='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(al_terminar),
+    )
+
+
+# ──────────────────────────────────────────────────────────────
+# RUTA REGISTRO DE ACCESO
+# ──────────────────────────────────────────────────────────────
+
+async def register_access(request):
+    data      = await request.json()
+    programa  = data.get('programa', '').strip()
+    matricula = data.get('matricula', '').strip().upper()
+
+    if not programa:
+        return JSONResponse({"status": "error", "message": "Programa no seleccionado"}, status_code=400)
+
+    # Validar formato de matrícula en el servidor también
+    if matricula and not MATRICULA_REGEX.match(matricula):
+        return JSONResponse({"status": "error", "message": "Formato de matrícula inválido"}, status_code=400)
+
+    # Misma IP que la ruta Flask para la misma petición
+    user_ip = ip_cliente(request.headers.getlist("X-Forwarded-For"), request.client.host)
+
+    user_agent = request.headers.get('User-Agent', '')
+
+    try:
+        await aregistrar_acceso(programa, user_ip, user_agent, matricula)
+        return JSONResponse({"status": "success", "message": "Access logged"})
+    except Exception as e:
+        print(f"Error logging access: {e}")
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=500)
+
+
+rutas_chatbot_async = [
+    Route('/chat', chat, methods=['POST', 'GET']),
+    Route('/api/register_access', register_access, methods=['POST']),
+]
@@ -0,0 +1,27 @@
+# --- app_estado.py ---
+"""
+GET /ready: 200 cuando el worker está caliente (índice KNN, proveedor de
+embeddings y cadena RAG listos, ver logic/calentamiento.py) y 503 mientras
+tanto. Úsalo como comprobación de disponibilidad (readiness) de la plataforma.
+"""
+import os
+import sys
+
+from flask import Blueprint, jsonify
+
+# Configuración de rutas
+current_dir  = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from logic.calentamiento import estado_componentes, listo
+
+estado_bp = Blueprint('estado', __name__)
+
+
+@estado_bp.route('/ready')
+def ready():
+    disponible = listo()
+    return jsonify({"listo": disponible, "componentes": estado_componentes()}), (200 if disponible else 503)
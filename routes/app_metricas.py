@@ -0,0 +1,64 @@
+# --- app_metricas.py ---
+"""
+GET /metrics: métricas del proceso en formato de texto de Prometheus
+(ver models/metricas.py), más el estado de los circuitos de los proveedores del LLM
+y el tamaño de la cola de escrituras diferidas.
+
+Si METRICAS_TOKEN está definido, la petición debe traer
+`Authorization: Bearer <METRICAS_TOKEN>` (bearer_token en la configuración del scrape).
+"""
+import os
+import sys
+import hmac
+
+from flask import Blueprint, Response, request
+
+# Configuración de rutas
+current_dir  = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from models.metricas import exposicion
+from models.proveedores_llm import estado_proveedores
+from logic import cola_escritura
+
+METRICAS_TOKEN = os.getenv("METRICAS_TOKEN", "")
+
+metricas_bp = Blueprint('metricas', __name__)
+
+
+def _lineas_proveedores() -> list:
+    proveedores = estado_proveedores()
+    if not proveedores:
+        return []   # aún no se ha construido la cadena RAG
+    lineas = [
+        "# HELP goit_llm_circuito_abierto 1 si el cortacircuitos del proveedor no está cerrado.",
+        "# TYPE goit_llm_circuito_abierto gauge",
+    ]
+    for p in proveedores:
+        nombre = p["proveedor"].replace("\\", "\\\\").replace('"', '\\"')
+        lineas.append(f'goit_llm_circuito_abierto{{proveedor="{nombre}"}} {int(p["circuito"] != "cerrado")}')
+    return lineas
+
+
+def _lineas_cola() -> list:
+    return [
+        "# HELP goit_cola_escritura_pendientes Escrituras diferidas aún en la cola de este worker.",
+        "# TYPE goit_cola_escritura_pendientes gauge",
+        f"goit_cola_escritura_pendientes {cola_escritura.pendientes()}",
+    ]
+
+
+@metricas_bp.route('/metrics')
+def metrics():
+    if METRICAS_TOKEN:
+        recibido = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(recibido, f"Bearer {METRICAS_TOKEN}"):
+            return Response("No autorizado\n", status=401, mimetype="text/plain")
+
+    return Response(
+        exposicion(_lineas_proveedores() + _lineas_cola()),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
@@ -1,10 +1,23 @@
 # setup_db.py
-from database import init_db
+import argparse
+
+from database import init_db, backfill_faq_origen
+# Fuente con la que chat_logs registra las respuestas del LLM
+from logic.seleccion_modelo import FUENTE_LLM
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crea los índices de MongoDB y migra datos antiguos.")
+    parser.add_argument("--origen-por-defecto", choices=("manual", "auto"), default="manual",
+                        help="origen de las FAQs antiguas que no se pueden identificar en chat_logs")
+    args = parser.parse_args()
+
     print("🛠️ Iniciando configuración de MongoDB...")
     try:
         init_db()
+        # FAQs anteriores al campo origen: sin él nunca se desalojarían
+        conteo = backfill_faq_origen(FUENTE_LLM, args.origen_por_defecto)
+        if conteo:
+            print(f"🏷️ Origen asignado a FAQs antiguas: {conteo}")
         print("🚀 MongoDB listo. Ahora puedes ejecutar app.py")
     except Exception as e:
-        print(f"❌ Error al inicializar MongoDB: {e}")
\ No newline at end of file
+        print(f"❌ Error al inicializar MongoDB: {e}")
@@ -163,6 +163,76 @@ document.addEventListener('DOMContentLoaded', () => {
         messagesContainer.scrollTo({ top: messagesContainer.scrollHeight, behavior: 'smooth' });
     }
 
+    function renderBotMessage(div, text) {
+        if (typeof marked !== 'undefined') {
+            div.innerHTML = marked.parse(text);
+        } else {
+            div.innerHTML = text;
+        }
+        messagesContainer.scrollTop = messagesContainer.scrollHeight;
+    }
+
+    // LECTURA DE RESPUESTAS EN STREAMING (Server-Sent Events sobre fetch)
+    // Pinta los fragmentos conforme llegan y resuelve con el evento final
+    // {reply, model, bloqueado}, igual que la respuesta JSON normal.
+    async function readStream(response) {
+        const reader  = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let text   = '';
+        let div    = null;
+        let final  = null;
+        let pendingRender = false;
+
+        const scheduleRender = () => {
+            if (pendingRender) return;
+            pendingRender = true;
+            requestAnimationFrame(() => {
+                pendingRender = false;
+                renderBotMessage(div, text);
+            });
+        };
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let sep;
+            while ((sep = buffer.indexOf('\n\n')) !== -1) {
+                const block = buffer.slice(0, sep);
+                buffer = buffer.slice(sep + 2);
+
+                let event = 'message';
+                let payload = '';
+                for (const line of block.split('\n')) {
+                    if (line.startsWith('event:')) event = line.slice(6).trim();
+                    else if (line.startsWith('data:')) payload += line.slice(5).trim();
+                }
+                if (!payload) continue;
+                const data = JSON.parse(payload);
+
+                if (event === 'token') {
+                    if (!div) {
+                        if (loadingFace) loadingFace.style.display = 'none';
+                        div = document.createElement('div');
+                        div.classList.add('message', 'bot');
+                        messagesContainer.appendChild(div);
+                    }
+                    text += data.t;
+                    scheduleRender();
+                } else if (event === 'fin') {
+                    final = data;
+                }
+            }
+        }
+
+        if (!final) throw new Error('Stream interrumpido');
+        if (!div) return final;
+        text = final.reply;   // un render pendiente usará ya el texto definitivo
+        return { ...final, streamed: true, div: div };
+    }
+
     function removeLastBotMessage() {
         const lastElement = messagesContainer.lastElementChild;
         if (lastElement && lastElement.classList.contains('bot')) {
@@ -204,10 +274,14 @@ document.addEventListener('DOMContentLoaded', () => {
                     matricula: selectedMatricula,
                     programa:  selectedPrograma,
                     history:   conversationHistory.slice(-8),   // últimos 4 intercambios
+                    stream:    true,   // respuestas del LLM por SSE; el caché responde JSON
                 })
             });
 
-            const data = await response.json();
+            const contentType = response.headers.get('Content-Type') || '';
+            const data = contentType.includes('text/event-stream')
+                ? await readStream(response)
+                : await response.json();
             if (loadingFace) loadingFace.style.display = 'none';
 
             if (data.error) {
@@ -217,7 +291,12 @@ document.addEventListener('DOMContentLoaded', () => {
                 divError.textContent = "Error: " + data.error;
                 messagesContainer.appendChild(divError);
             } else {
-                addMessage(data.reply, 'bot');
+                if (data.streamed) {
+                    // El mensaje ya se fue pintando; se re-renderiza con el texto definitivo
+                    renderBotMessage(data.div, data.reply);
+                } else {
+                    addMessage(data.reply, 'bot');
+                }
                 // Guardar respuesta del asistente en el historial
                 conversationHistory.push({ role: 'assistant', content: data.reply });
 
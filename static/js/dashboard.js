@@ -156,7 +156,8 @@ function startTraining() {
     const terminal = document.getElementById('terminalOutput');
     
     // Obtenemos la URL desde el atributo data del botón
-    const streamUrl = btnTrain.getAttribute('data-stream-url');
+    // (con shards por programa, se puede reentrenar solo uno)
+    const streamUrl = btnTrain.getAttribute('data-stream-url') + parametroPrograma();
     
     let entrenamientoExitoso = false;
 
@@ -334,6 +335,30 @@ async function toggleFaqBlock(row) {
     }
 }
 
+async function compactFaqs() {
+    // Primero se pide solo el plan; la fusión se aplica tras confirmar
+    const plan = await _faqFetch(FAQ_URLS.compact, { aplicar: false });
+    if (!plan.ok) {
+        alert('Error: ' + plan.message);
+        return;
+    }
+    if (!plan.data.resumen || plan.data.resumen.eliminadas === 0) {
+        alert('No se encontraron FAQs duplicadas.');
+        return;
+    }
+
+    if (!confirm(`${plan.message}\n\nLas preguntas fusionadas se conservan como alias de la FAQ ` +
+        'representante. Las FAQs bloqueadas no se modifican.\n\n¿Aplicar la compactación?')) return;
+
+    const result = await _faqFetch(FAQ_URLS.compact, { aplicar: true });
+    if (result.ok) {
+        alert(result.message);
+        location.reload();
+    } else {
+        alert('Error: ' + result.message);
+    }
+}
+
 // ─── Utilidades FAQ (privadas) ────────────────────────────────
 
 async function _faqFetch(url, body) {
@@ -344,7 +369,7 @@ async function _faqFetch(url, body) {
             body: JSON.stringify(body)
         });
         const data = await res.json();
-        return { ok: data.status === 'ok', message: data.message || '' };
+        return { ok: data.status === 'ok', message: data.message || '', data };
     } catch (e) {
         return { ok: false, message: 'Error de red. Intenta de nuevo.' };
     }
@@ -372,13 +397,19 @@ function _updateFaqCount() {
 
 // ─── FIN FAQ ──────────────────────────────────────────────────
 
+function parametroPrograma() {
+    const campo = document.getElementById('trainPrograma');
+    const programa = campo ? campo.value.trim() : '';
+    return programa ? '?programa=' + encodeURIComponent(programa) : '';
+}
+
 function finishTrainingProcess() {
     const terminal = document.getElementById('terminalOutput');
     const btnFinish = document.getElementById('btnFinish');
     const btnTrain = document.getElementById('btnTrain');
 
     // Obtenemos la URL de finalización
-    const completeUrl = btnTrain.getAttribute('data-complete-url');
+    const completeUrl = btnTrain.getAttribute('data-complete-url') + parametroPrograma();
     
     if (terminal.lastElementChild.textContent.includes("Todos los procesos completados")) return;
 